@@ -0,0 +1,123 @@
+"""
+Coalescedor de peticiones (micro-batching) para /predict - CRISP-DM
+Fase 6: Despliegue
+
+Agrupa las peticiones individuales que llegan dentro de una ventana de tiempo
+(o hasta un número máximo de filas), las puntúa como una sola matriz y resuelve
+el futuro de cada llamante con su predicción.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+# Límites superiores de los buckets del histograma de tamaño de lote
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+class PredictionCoalescer:
+    """Acumula filas codificadas y las predice en lotes"""
+
+    def __init__(self, predict_matrix: Callable[[np.ndarray], np.ndarray],
+                 window_ms: float = 2.0, max_batch: int = 256):
+        self.predict_matrix = predict_matrix
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._pending: List[tuple] = []
+        self._timer = None
+
+        # Métricas para ajustar el compromiso throughput/latencia
+        self.batches = 0
+        self.requests = 0
+        self.max_batch_seen = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self._recent_waits = deque(maxlen=10000)
+
+    async def submit(self, row: List[float],
+                     predict_matrix: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> float:
+        """Encolar una fila codificada y esperar su predicción
+
+        predict_matrix fija la versión del modelo con la que se puntúa la fila;
+        las filas de versiones distintas se predicen en grupos separados.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future, time.perf_counter(), predict_matrix or self.predict_matrix))
+
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+
+        return await future
+
+    def flush(self):
+        """Predecir todas las filas pendientes como una única matriz"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        now = time.perf_counter()
+        for _, _, enqueued, _ in pending:
+            wait = now - enqueued
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+            self._recent_waits.append(wait)
+        self._record_batch(len(pending))
+
+        groups: Dict[int, list] = {}
+        for item in pending:
+            groups.setdefault(id(item[3]), []).append(item)
+
+        for group in groups.values():
+            try:
+                X = np.array([row for row, _, _, _ in group], dtype=np.float64)
+                predictions = group[0][3](X).tolist()
+            except Exception as e:
+                for _, future, _, _ in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _, _), prediction in zip(group, predictions):
+                if not future.done():
+                    future.set_result(prediction)
+
+    def _record_batch(self, size: int):
+        self.batches += 1
+        self.requests += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= bound:
+                self.batch_size_counts[i] += 1
+                break
+        else:
+            self.batch_size_counts[-1] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de tamaño de lote y espera en cola"""
+        waits = np.array(self._recent_waits) * 1000.0 if self._recent_waits else np.zeros(1)
+        labels = [f"<={bound}" for bound in BATCH_SIZE_BUCKETS] + [f">{BATCH_SIZE_BUCKETS[-1]}"]
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "batch_size_histogram": dict(zip(labels, self.batch_size_counts)),
+            "queue_wait_ms": {
+                "mean": self.queue_wait_total * 1000.0 / self.requests if self.requests else 0.0,
+                "p50": float(np.percentile(waits, 50)),
+                "p99": float(np.percentile(waits, 99)),
+                "max": self.queue_wait_max * 1000.0
+            }
+        }
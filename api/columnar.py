@@ -0,0 +1,219 @@
+"""
+Carga columnar binaria para puntuación masiva entre servicios - CRISP-DM
+Fase 6: Despliegue
+
+En lugar de una lista JSON de objetos, el cliente envía cada característica como
+un buffer contiguo little-endian. Las columnas se leen con np.frombuffer sobre el
+propio cuerpo (sin copias) y se puntúan con la ruta vectorizada del modelo. La
+respuesta es un buffer float64 little-endian con una predicción por fila (NaN en
+las filas inválidas).
+
+Formato (application/vnd.ventas.columnar):
+    b'VCOL' | uint32 LE longitud de la cabecera | cabecera JSON | relleno a 8 bytes
+    | buffer de cada columna en el orden de la cabecera, cada uno rellenado a 8 bytes
+
+    cabecera = {"rows": n, "columns": [
+        {"name": "tienda_id", "dtype": "<i4"},
+        {"name": "ubicacion", "dtype": "|u1", "categories": ["rural", "suburbana", "urbana"]},
+        ...
+    ]}
+
+Las columnas categóricas se envían como códigos enteros sobre su lista de
+categorías. Con pyarrow instalado también se acepta un stream Arrow IPC
+(application/vnd.apache.arrow.stream), con las categóricas como diccionario o texto.
+"""
+
+import json
+import struct
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+COLUMNAR_MEDIA_TYPE = 'application/vnd.ventas.columnar'
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+MAGIC = b'VCOL'
+ALIGNMENT = 8
+
+def _padded(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+class ColumnarBatch:
+    """Columnas de un lote: arreglos de NumPy y, en las categóricas, su lista de categorías"""
+
+    def __init__(self, rows: int, columns: Dict[str, np.ndarray],
+                 categories: Optional[Dict[str, List[str]]] = None):
+        self.rows = rows
+        self.columns = columns
+        self.categories = categories or {}
+
+def _column_dtype(spec: Any) -> np.dtype:
+    try:
+        dtype = np.dtype(spec)
+    except (TypeError, ValueError):
+        raise ValueError(f"Tipo de columna desconocido '{spec}'")
+    if dtype.kind not in 'iuf' or dtype.byteorder == '>' or (dtype.byteorder == '=' and not np.little_endian):
+        raise ValueError(f"Tipo de columna no soportado '{spec}' (enteros o reales little-endian)")
+    return dtype
+
+def _column_spec(spec: Any) -> Tuple[str, np.dtype, Optional[List[str]]]:
+    """Nombre, tipo y categorías de una entrada de 'columns' de la cabecera"""
+    if not isinstance(spec, dict) or not isinstance(spec.get('name'), str) or 'dtype' not in spec:
+        raise ValueError(f"Cabecera VCOL inválida: cada columna necesita 'name' y 'dtype' ({spec!r})")
+    name = spec['name']
+    try:
+        dtype = _column_dtype(spec['dtype'])
+    except ValueError as e:
+        raise ValueError(f"Cabecera VCOL inválida: columna '{name}': {e}")
+    categories = spec.get('categories')
+    if categories is None:
+        return name, dtype, None
+    if not isinstance(categories, list):
+        raise ValueError(f"Cabecera VCOL inválida: las categorías de '{name}' deben ser una lista")
+    if dtype.kind == 'f':
+        raise ValueError(f"Los códigos de la columna categórica '{name}' deben ser enteros")
+    return name, dtype, [str(category) for category in categories]
+
+def decode_columnar(body: bytes) -> ColumnarBatch:
+    """Leer una carga VCOL; los arreglos son vistas sobre body (sin copias)"""
+    if len(body) < 8 or body[:4] != MAGIC:
+        raise ValueError("La carga no empieza con la firma VCOL")
+    (header_size,) = struct.unpack_from('<I', body, 4)
+    try:
+        header = json.loads(body[8:8 + header_size])
+        rows = int(header['rows'])
+        specs = header['columns']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Cabecera VCOL inválida: {e}")
+    if not isinstance(specs, list):
+        raise ValueError("Cabecera VCOL inválida: 'columns' debe ser una lista")
+    if rows < 0:
+        raise ValueError("El número de filas no puede ser negativo")
+
+    offset = _padded(8 + header_size)
+    columns, categories = {}, {}
+    for name, dtype, spec_categories in map(_column_spec, specs):
+        size = rows * dtype.itemsize
+        if offset + size > len(body):
+            raise ValueError(f"La columna '{name}' excede el tamaño de la carga")
+        columns[name] = np.frombuffer(body, dtype=dtype, count=rows, offset=offset)
+        if spec_categories is not None:
+            categories[name] = spec_categories
+        offset += _padded(size)
+    return ColumnarBatch(rows, columns, categories)
+
+def encode_columnar(columns: Mapping[str, Any]) -> bytes:
+    """Construir una carga VCOL (lado del cliente)
+
+    Las columnas de texto se convierten en códigos sobre sus categorías.
+    """
+    arrays, specs = [], []
+    rows = None
+    for name, values in columns.items():
+        values = np.asarray(values)
+        spec: Dict[str, Any] = {"name": name}
+        if values.dtype.kind in 'OUS':
+            categories, codes = np.unique(values.astype(str), return_inverse=True)
+            spec["categories"] = categories.tolist()
+            values = codes.astype(np.uint8 if len(categories) <= 256 else np.int32)
+        values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+        spec["dtype"] = values.dtype.str
+        rows = len(values) if rows is None else rows
+        if len(values) != rows:
+            raise ValueError("Todas las columnas deben tener el mismo número de filas")
+        arrays.append(values)
+        specs.append(spec)
+
+    header = json.dumps({"rows": rows or 0, "columns": specs}).encode('utf-8')
+    parts = [MAGIC, struct.pack('<I', len(header)), header, b'\0' * (_padded(8 + len(header)) - 8 - len(header))]
+    for values in arrays:
+        data = values.tobytes()
+        parts.append(data)
+        parts.append(b'\0' * (_padded(len(data)) - len(data)))
+    return b''.join(parts)
+
+def decode_arrow(body: bytes) -> ColumnarBatch:
+    """Leer un stream Arrow IPC (requiere pyarrow)"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ValueError("Las cargas Arrow requieren el paquete pyarrow")
+
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all().combine_chunks()
+    columns, categories = {}, {}
+    for name, column in zip(table.column_names, table.columns):
+        array = column.chunk(0) if column.num_chunks else pa.array([], type=column.type)
+        if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+            array = array.dictionary_encode()
+        if pa.types.is_dictionary(array.type):
+            categories[name] = [str(category) for category in array.dictionary.to_pylist()]
+            array = array.indices
+        if array.null_count:
+            array = array.cast(pa.float64()).fill_null(np.nan)
+        columns[name] = array.to_numpy(zero_copy_only=False)
+    return ColumnarBatch(table.num_rows, columns, categories)
+
+def score_columnar(batch: ColumnarBatch, feature_cols: Sequence[str],
+                   encoders: Dict[str, Dict[str, int]], constraints: Dict[str, Dict[str, Any]],
+                   kernel=None, predict_matrix=None) -> Tuple[np.ndarray, np.ndarray, Dict[str, int]]:
+    """Validar y puntuar un lote columnar sin pasar por filas
+
+    Aplica los mismos límites, enteros y patrones que PredictionRequest.
+    Devuelve (predicciones con NaN en las filas inválidas, máscara de filas
+    válidas, filas rechazadas por columna). Una columna ausente es un error de
+    toda la carga (ValueError).
+    """
+    n = batch.rows
+    valid = np.ones(n, dtype=bool)
+    rejected: Dict[str, int] = {}
+    encoded: List[np.ndarray] = []
+
+    for col in feature_cols:
+        if col not in batch.columns:
+            raise ValueError(f"Falta la columna '{col}'")
+        values = batch.columns[col]
+        constraint = constraints.get(col, {})
+
+        if col in encoders:
+            if col not in batch.categories:
+                raise ValueError(f"La columna '{col}' debe enviarse con sus categorías")
+            # Traducir la lista de categorías del cliente a los códigos del modelo
+            # una sola vez; las filas solo hacen un take
+            pattern = constraint.get('pattern')
+            table = np.array([
+                encoders[col].get(category, -1) if pattern is None or pattern.match(category) else -1
+                for category in batch.categories[col]
+            ] + [-1], dtype=np.int64)
+            codes = np.where((values >= 0) & (values < len(table) - 1), values, len(table) - 1).astype(np.intp)
+            column = table[codes]
+            column_valid = column >= 0
+        else:
+            column = values
+            column_valid = np.ones(n, dtype=bool)
+            if values.dtype.kind == 'f':
+                column_valid &= np.isfinite(values)
+                if constraint.get('integer'):
+                    column_valid &= values == np.floor(values)
+            if 'ge' in constraint:
+                column_valid &= values >= constraint['ge']
+            if 'le' in constraint:
+                column_valid &= values <= constraint['le']
+
+        newly_rejected = int(np.count_nonzero(valid & ~column_valid))
+        if newly_rejected:
+            rejected[col] = newly_rejected
+        valid &= column_valid
+        encoded.append(column)
+
+    if kernel is not None:
+        # Las filas inválidas pueden producir inf o NaN; se descartan abajo
+        with np.errstate(invalid='ignore', over='ignore'):
+            predictions = kernel.predict_columns(encoded)
+    else:
+        X = np.column_stack([np.asarray(column, dtype=np.float64) for column in encoded]) \
+            if encoded else np.empty((n, 0))
+        predictions = np.full(n, np.nan)
+        if valid.any():
+            predictions[valid] = predict_matrix(X[valid])
+    if not valid.all():
+        predictions[~valid] = np.nan
+    return predictions, valid, rejected
@@ -0,0 +1,121 @@
+"""
+Ejecutores para el trabajo de predicción intensivo en CPU - CRISP-DM
+Fase 6: Despliegue
+
+Saca la validación, codificación y predicción de los lotes del event loop de
+asyncio para que /health y las peticiones pequeñas no queden bloqueadas detrás
+de un lote grande.
+
+Modos disponibles:
+    inline:  en el propio event loop (comportamiento original)
+    thread:  pool de hilos (las operaciones de NumPy liberan el GIL)
+    process: pool de procesos con el modelo precargado en cada trabajador
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+EXECUTOR_KINDS = ('inline', 'thread', 'process')
+
+# Estado de cada proceso trabajador (se asigna en el inicializador)
+_worker_scorer = None
+
+def _init_process_worker(scorer):
+    """Precargar el scorer (modelo y preprocesadores) una vez por proceso"""
+    global _worker_scorer
+    _worker_scorer = scorer
+
+def _score_in_worker(records: List[Dict[str, Any]]):
+    return _worker_scorer(records)
+
+class PredictionExecutor:
+    """Ejecuta lotes de predicción en el event loop, en hilos o en procesos"""
+
+    def __init__(self, kind: str = 'inline', workers: Optional[int] = None, chunk_size: int = 5000):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Ejecutor desconocido '{kind}', opciones: {', '.join(EXECUTOR_KINDS)}")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = max(1, int(chunk_size))
+        self.pool = None
+        self._scorer = None
+
+    def start(self, scorer: Callable):
+        """Crear el pool y precargar el scorer en los trabajadores
+
+        Si ya había un pool (recarga del modelo), se retira sin cancelar sus tareas:
+        los lotes en curso terminan con la versión anterior.
+        """
+        self.shutdown(cancel_futures=False)
+        self._scorer = scorer
+        if self.kind == 'thread':
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='predict')
+        elif self.kind == 'process':
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_process_worker,
+                initargs=(scorer,)
+            )
+
+    def shutdown(self, cancel_futures: bool = True):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=cancel_futures)
+            self.pool = None
+
+    async def score(self, records: List[Dict[str, Any]], scorer: Optional[Callable] = None):
+        """Puntuar un lote; en los modos con pool se reparte en trozos entre trabajadores
+
+        scorer fija la versión del modelo (por defecto, la precargada). Devuelve
+        (predicciones de las filas válidas, índices válidos, errores) con los
+        índices referidos al lote completo.
+        """
+        scorer = scorer or self._scorer
+        if self.kind == 'inline' or self.pool is None:
+            return scorer(records)
+
+        loop = asyncio.get_running_loop()
+        pool, target = self.pool, scorer
+        if self.kind == 'process':
+            if scorer is self._scorer:
+                target = _score_in_worker
+            else:
+                # Petición iniciada antes de una recarga: su versión ya no está
+                # precargada en los procesos, se puntúa en un hilo
+                pool = None
+        offsets = range(0, len(records), self.chunk_size)
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, target, records[start:start + self.chunk_size])
+            for start in offsets
+        ))
+
+        predictions, valid_idx, errors = [], [], []
+        for start, (chunk_predictions, chunk_valid, chunk_errors) in zip(offsets, results):
+            predictions.extend(chunk_predictions)
+            valid_idx.extend(start + i for i in chunk_valid)
+            errors.extend({**error, "index": start + error["index"]} for error in chunk_errors)
+        return predictions, valid_idx, errors
+
+    async def run(self, fn: Callable, *args):
+        """Ejecutar una función vectorizada sobre arreglos ya en memoria
+
+        Los arreglos no se envían a los procesos: en el modo process se usa el
+        pool de hilos por defecto (NumPy libera el GIL).
+        """
+        if self.kind == 'inline' or self.pool is None:
+            return fn(*args)
+        pool = self.pool if self.kind == 'thread' else None
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+def create_executor_from_env() -> PredictionExecutor:
+    """Configurar el ejecutor con variables de entorno
+
+    PREDICT_EXECUTOR: inline | thread | process
+    PREDICT_WORKERS: número de hilos/procesos (por defecto, núcleos disponibles)
+    PREDICT_CHUNK_SIZE: filas por tarea al repartir un lote
+    """
+    kind = os.environ.get("PREDICT_EXECUTOR", "inline").strip().lower()
+    workers = int(os.environ.get("PREDICT_WORKERS", 0)) or None
+    chunk_size = int(os.environ.get("PREDICT_CHUNK_SIZE", 5000))
+    return PredictionExecutor(kind, workers=workers, chunk_size=chunk_size)
@@ -0,0 +1,98 @@
+"""
+Decodificación y respuesta rápidas para /predict_fast - CRISP-DM
+Fase 6: Despliegue
+
+/predict construye un PredictionRequest y un PredictionResponse de Pydantic en
+cada petición, y con el kernel plegado eso cuesta más que la propia predicción.
+Esta ruta decodifica el cuerpo con orjson (si está instalado), comprueba los
+mismos límites y patrones declarados en PredictionRequest y escribe la respuesta
+sobre una plantilla de bytes precalculada por versión del modelo.
+
+Cualquier entrada que la ruta rápida no acepte tal cual (tipos que Pydantic
+convertiría, campos ausentes, valores fuera de rango) se devuelve a la
+validación de Pydantic, de modo que los errores y conversiones son idénticos.
+"""
+
+import json
+from typing import Any, Dict, Optional, Type
+
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+def decode_request(body: bytes, constraints: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Campos validados de un PredictionRequest, o None si debe decidir Pydantic"""
+    try:
+        data = _loads(body)
+    except ValueError:
+        return None
+    if type(data) is not dict:
+        return None
+
+    record = {}
+    for name, info in constraints.items():
+        value = data.get(name)
+        kind = type(value)
+        if 'pattern' in info:
+            if kind is not str or info['pattern'].fullmatch(value) is None:
+                return None
+        elif info['integer']:
+            if kind is not int:
+                return None
+        elif kind is float or kind is int:
+            value = float(value)
+        else:
+            return None
+        if 'ge' in info and not value >= info['ge']:
+            return None
+        if 'le' in info and not value <= info['le']:
+            return None
+        record[name] = value
+    return record
+
+def validate_request(body: bytes, model: Type[BaseModel]) -> Dict[str, Any]:
+    """Validar con Pydantic y fallar con los mismos errores 422 que un parámetro de cuerpo"""
+    data = None
+    if body:
+        try:
+            data = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise RequestValidationError([{
+                "type": "json_invalid", "loc": ("body", e.pos), "msg": "JSON decode error",
+                "input": {}, "ctx": {"error": e.msg}
+            }], body=e.doc)
+    if data is None:
+        raise RequestValidationError([
+            {"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}
+        ])
+    try:
+        return vars(model.model_validate(data, from_attributes=True))
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)], body=data
+        )
+
+class ResponseTemplate:
+    """Cuerpo JSON de la respuesta de /predict con todo resuelto salvo la predicción
+
+    Produce los mismos bytes que PredictionResponse serializado por FastAPI.
+    """
+
+    __slots__ = ('prefix', 'suffix')
+
+    def __init__(self, confidence: float, model_info: Dict[str, Any]):
+        tail = json.dumps(
+            {"confidence": float(confidence), "model_info": model_info},
+            ensure_ascii=False, allow_nan=False, separators=(',', ':')
+        )
+        self.prefix = b'{"prediction":'
+        self.suffix = (',' + tail[1:]).encode('utf-8')
+
+    def render(self, prediction: float) -> bytes:
+        return self.prefix + float.__repr__(float(prediction)).encode('ascii') + self.suffix
@@ -0,0 +1,63 @@
+"""
+Modelos por grupo (p. ej. uno por ubicación) - CRISP-DM
+Fase 4: Modelado
+Fase 6: Despliegue
+
+Vive junto a la API porque model.pkl guarda una instancia de esta clase: la
+búsqueda de modelos la entrena y la API la carga con joblib por la ruta de
+respaldo de sklearn (SklearnMatrixPredictor), sin código propio de servicio.
+"""
+
+from typing import Any
+
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.linear_model import LinearRegression
+
+class GroupedRegressor(RegressorMixin, BaseEstimator):
+    """Un estimador por valor de una columna; el resto de filas usa el modelo global
+
+    La columna de grupo llega escalada, así que cada fila se asigna al valor de
+    grupo visto en el entrenamiento más cercano (robusto a redondeos del scaler).
+    """
+
+    def __init__(self, estimator: Any = None, group_index: int = 0, min_rows: int = 30):
+        self.estimator = estimator
+        self.group_index = group_index
+        self.min_rows = min_rows
+
+    def _base_estimator(self):
+        return clone(self.estimator) if self.estimator is not None else LinearRegression()
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        groups = X[:, self.group_index]
+
+        self.global_model_ = self._base_estimator().fit(X, y)
+        self.groups_ = np.unique(groups)
+        self.models_ = []
+        for value in self.groups_:
+            rows = groups == value
+            # Grupos con pocas filas se quedan con el modelo global
+            self.models_.append(self._base_estimator().fit(X[rows], y[rows])
+                                if rows.sum() >= self.min_rows else None)
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def _assign(self, groups: np.ndarray) -> np.ndarray:
+        """Índice del grupo de entrenamiento más cercano a cada valor"""
+        if len(self.groups_) == 1:
+            return np.zeros(len(groups), dtype=np.intp)
+        midpoints = (self.groups_[1:] + self.groups_[:-1]) / 2
+        return np.searchsorted(midpoints, groups)
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        assigned = self._assign(X[:, self.group_index])
+        predictions = np.empty(len(X))
+        for index, model in enumerate(self.models_):
+            rows = assigned == index
+            if rows.any():
+                predictions[rows] = (model or self.global_model_).predict(X[rows])
+        return predictions
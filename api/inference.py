@@ -0,0 +1,304 @@
+"""
+Kernel de inferencia compilado a partir de los artefactos del modelo - CRISP-DM
+Fase 6: Despliegue
+
+El StandardScaler y la LinearRegression se pliegan en un único vector de pesos
+y un sesgo, y los LabelEncoders se convierten en diccionarios. Predecir se reduce
+a unas pocas multiplicaciones y sumas, sin DataFrames ni llamadas a sklearn.
+"""
+
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import numpy as np
+
+def _numeric_column(values: List[Any]) -> np.ndarray:
+    """Convertir una columna a float64; los valores no numéricos quedan como NaN"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except (TypeError, ValueError):
+                column[i] = np.nan
+        return column
+
+def _scalar(value: Any) -> Any:
+    """Escalar de NumPy a tipo nativo (para los mensajes de error)"""
+    return value.item() if isinstance(value, np.generic) else value
+
+def clip_bounds_for(feature_cols: List[str],
+                    clip_bounds: Optional[Mapping[str, List[float]]]):
+    """Límites inferior y superior en el orden de feature_cols (±inf sin límite), o None"""
+    if not clip_bounds or not any(col in clip_bounds for col in feature_cols):
+        return None
+    lower = np.array([clip_bounds[col][0] if col in clip_bounds else -np.inf for col in feature_cols],
+                     dtype=np.float64)
+    upper = np.array([clip_bounds[col][1] if col in clip_bounds else np.inf for col in feature_cols],
+                     dtype=np.float64)
+    return lower, upper
+
+def encode_batch(records: List[Dict[str, Any]],
+                 feature_cols: List[str],
+                 encoders: Dict[str, Dict[str, int]],
+                 constraints: Dict[str, Dict[str, Any]]):
+    """Validar y codificar un lote completo en una sola pasada
+
+    Devuelve la matriz codificada (sin escalar) de las filas válidas, sus índices
+    en el lote original y la lista de errores por fila (las filas inválidas no
+    detienen el lote).
+    """
+    columns = {
+        col: [record.get(col) if isinstance(record, dict) else None for record in records]
+        for col in feature_cols
+    }
+    return encode_columns(columns, len(records), feature_cols, encoders, constraints)
+
+def encode_columns(columns: Mapping[str, List[Any]], n: int,
+                   feature_cols: List[str],
+                   encoders: Dict[str, Dict[str, int]],
+                   constraints: Dict[str, Dict[str, Any]]):
+    """Igual que encode_batch, pero con los datos ya organizados por columnas"""
+    X = np.empty((n, len(feature_cols)), dtype=np.float64)
+    row_errors: Dict[int, str] = {}
+
+    for j, col in enumerate(feature_cols):
+        values = columns[col] if col in columns else [None] * n
+        constraint = constraints.get(col, {})
+
+        if col in encoders:
+            # Solo las clases que cumplen el patrón; así basta un lookup por valor
+            pattern = constraint.get('pattern')
+            allowed = {cls_: code for cls_, code in encoders[col].items()
+                       if pattern is None or pattern.match(cls_)}
+            try:
+                codes = np.fromiter(map(allowed.get, values, [-1] * n), dtype=np.float64, count=n)
+            except TypeError:
+                # Valores no hashables (listas u objetos JSON)
+                codes = np.fromiter(
+                    (allowed.get(v, -1) if isinstance(v, str) else -1 for v in values),
+                    dtype=np.float64, count=n
+                )
+            for i in np.flatnonzero(codes < 0):
+                row_errors.setdefault(int(i), f"{col}: valor inválido {_scalar(values[i])!r}")
+            X[:, j] = codes
+            continue
+
+        column = _numeric_column(values)
+        invalid = ~np.isfinite(column)
+        for i in np.flatnonzero(invalid):
+            row_errors.setdefault(int(i), f"{col}: valor ausente o no numérico {_scalar(values[i])!r}")
+
+        # Verificar límites de forma vectorizada (NaN ya fue reportado)
+        checked = np.where(invalid, constraint.get('ge', 0), column)
+        out_of_range = np.zeros(n, dtype=bool)
+        if 'ge' in constraint:
+            out_of_range |= checked < constraint['ge']
+        if 'le' in constraint:
+            out_of_range |= checked > constraint['le']
+        if constraint.get('integer'):
+            out_of_range |= checked != np.floor(checked)
+        for i in np.flatnonzero(out_of_range & ~invalid):
+            row_errors.setdefault(
+                int(i),
+                f"{col}: valor fuera de rango {_scalar(values[i])!r} "
+                f"(permitido: {constraint.get('ge')} - {constraint.get('le')})"
+            )
+        X[:, j] = column
+
+    valid = np.ones(n, dtype=bool)
+    valid[list(row_errors)] = False
+    valid_idx = np.flatnonzero(valid)
+    errors = [{"index": i, "error": msg} for i, msg in sorted(row_errors.items())]
+
+    return X[valid_idx], valid_idx, errors
+
+def encode_record(record: Mapping[str, Any], feature_cols: List[str],
+                  encoders: Dict[str, Dict[str, int]]) -> List[float]:
+    """Codificar una fila ya validada en el orden de feature_cols"""
+    return [
+        encoders[col][record[col]] if col in encoders else record[col]
+        for col in feature_cols
+    ]
+
+class FusedLinearModel:
+    """Scaler y regresión lineal plegados en pesos y sesgo precalculados
+
+    Para x escalado como (x - mean) / scale, la predicción lineal
+    coef · (x - mean) / scale + intercept se reescribe como w · x + b con
+    w = coef / scale y b = intercept - w · mean.
+
+    Si el modelo trae los límites de capado de outliers del entrenamiento
+    (clip_bounds), cada característica se capa a ellos antes de predecir.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float, feature_cols: List[str],
+                 encoders: Dict[str, Dict[str, int]],
+                 clip_bounds: Optional[Dict[str, List[float]]] = None):
+        self.weights = np.ascontiguousarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.feature_cols = list(feature_cols)
+        self.encoders = encoders
+        # Copia en floats de Python para la ruta escalar (evita el despacho de NumPy)
+        self._terms = list(zip(self.feature_cols, self.weights.tolist()))
+
+        self.clip_bounds = {col: [float(lo), float(hi)] for col, (lo, hi) in (clip_bounds or {}).items()
+                            if col in self.feature_cols} or None
+        limits = clip_bounds_for(self.feature_cols, self.clip_bounds)
+        if limits is not None:
+            self.lower, self.upper = limits
+            self._limits = list(zip(self.lower.tolist(), self.upper.tolist()))
+        else:
+            self.lower = self.upper = self._limits = None
+
+    @classmethod
+    def from_artifacts(cls, model, scaler, label_encoders, feature_cols,
+                       clip_bounds: Optional[Dict[str, List[float]]] = None) -> 'FusedLinearModel':
+        """Compilar el kernel a partir del modelo, el scaler y los encoders de sklearn"""
+        if not hasattr(model, 'coef_') or not hasattr(model, 'intercept_'):
+            raise ValueError(f"El modelo {type(model).__name__} no es lineal")
+
+        coef = np.asarray(model.coef_, dtype=np.float64).ravel()
+        n_features = len(feature_cols)
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+        scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+
+        weights = coef / scale
+        bias = float(np.ravel(model.intercept_)[0]) - float(np.dot(weights, mean))
+        encoders = {
+            col: {str(cls_): code for code, cls_ in enumerate(le.classes_)}
+            for col, le in (label_encoders or {}).items()
+        }
+        return cls(weights, bias, feature_cols, encoders, clip_bounds)
+
+    @classmethod
+    def from_bundle(cls, bundle: Dict[str, Any]) -> 'FusedLinearModel':
+        """Compilar el kernel a partir de un bundle leído con model_bundle.read_bundle"""
+        arrays = bundle['arrays']
+        scale = np.asarray(arrays['scaler_scale'], dtype=np.float64)
+        mean = np.asarray(arrays['scaler_mean'], dtype=np.float64)
+        weights = np.asarray(arrays['coef'], dtype=np.float64) / scale
+        bias = float(arrays['intercept'][0]) - float(np.dot(weights, mean))
+        encoders = {
+            col: {cls_: code for code, cls_ in enumerate(classes)}
+            for col, classes in bundle['encoders'].items()
+        }
+        return cls(weights, bias, bundle['feature_cols'], encoders, bundle.get('clip_bounds'))
+
+
+    def predict_record(self, record: Mapping[str, Any]) -> float:
+        """Predecir una única fila ya validada (dict con las columnas de entrada)"""
+        if self._limits is not None:
+            return self.predict_row(encode_record(record, self.feature_cols, self.encoders))
+        total = self.bias
+        encoders = self.encoders
+        for col, weight in self._terms:
+            value = record[col]
+            if col in encoders:
+                value = encoders[col][value]
+            total += weight * value
+        return total
+
+    def predict_row(self, row: List[float]) -> float:
+        """Predecir una fila ya codificada con encode_record"""
+        if self._limits is not None:
+            row = [min(max(value, lo), hi) for value, (lo, hi) in zip(row, self._limits)]
+        total = self.bias
+        for (_, weight), value in zip(self._terms, row):
+            total += weight * value
+        return total
+
+    def predict_columns(self, columns: List[np.ndarray]) -> np.ndarray:
+        """Predecir columnas codificadas (una por característica) sin formar la matriz"""
+        n = len(columns[0]) if columns else 0
+        if self._limits is not None:
+            columns = [np.clip(column, lo, hi) for column, (lo, hi) in zip(columns, self._limits)]
+        total = np.full(n, self.bias)
+        term = np.empty(n)
+        for column, weight in zip(columns, self._terms):
+            np.multiply(column, weight[1], out=term)
+            total += term
+        return total
+
+    def predict_matrix(self, X: np.ndarray) -> np.ndarray:
+        """Predecir una matriz codificada (sin escalar) en una única operación"""
+        if self.lower is not None:
+            X = np.clip(X, self.lower, self.upper)
+        return X @ self.weights + self.bias
+
+class SklearnMatrixPredictor:
+    """Ruta de respaldo para modelos no lineales: scaler + model.predict de sklearn"""
+
+    def __init__(self, model, scaler, feature_cols: List[str],
+                 clip_bounds: Optional[Dict[str, List[float]]] = None):
+        self.model = model
+        self.scaler = scaler
+        self.feature_cols = list(feature_cols)
+        self.limits = clip_bounds_for(self.feature_cols, clip_bounds)
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        import pandas as pd
+        if self.limits is not None:
+            X = np.clip(X, *self.limits)
+        return self.model.predict(self.scaler.transform(pd.DataFrame(X, columns=self.feature_cols)))
+
+class BatchScorer:
+    """Validación, codificación y predicción de un lote completo
+
+    Es serializable (pickle) para poder precargarse una sola vez en cada
+    proceso del pool de trabajadores.
+    """
+
+    def __init__(self, feature_cols: List[str], encoders: Dict[str, Dict[str, int]],
+                 constraints: Dict[str, Dict[str, Any]],
+                 predict_matrix: Callable[[np.ndarray], np.ndarray]):
+        self.feature_cols = list(feature_cols)
+        self.encoders = encoders
+        self.constraints = constraints
+        self.predict_matrix = predict_matrix
+
+    def __call__(self, records: List[Dict[str, Any]]):
+        """Devuelve (predicciones de las filas válidas, índices válidos, errores)"""
+        X, valid_idx, errors = encode_batch(records, self.feature_cols, self.encoders, self.constraints)
+        predictions = self.predict_matrix(X) if len(valid_idx) > 0 else np.empty(0)
+        return predictions.tolist(), valid_idx.tolist(), errors
+
+    def score_columns(self, columns: Mapping[str, List[Any]], n: int):
+        """Como __call__ pero con datos por columnas; devuelve arreglos de NumPy"""
+        X, valid_idx, errors = encode_columns(columns, n, self.feature_cols, self.encoders, self.constraints)
+        predictions = self.predict_matrix(X) if len(valid_idx) > 0 else np.empty(0)
+        return np.asarray(predictions, dtype=np.float64), valid_idx, errors
+
+def verify_equivalence(kernel: FusedLinearModel,
+                       reference: Callable[[Dict[str, Any]], float],
+                       samples: List[Dict[str, Any]],
+                       rtol: float = 1e-9) -> Optional[str]:
+    """Comparar el kernel con la ruta de referencia; devuelve un mensaje si difieren"""
+    for sample in samples:
+        expected = reference(sample)
+        got = kernel.predict_record(sample)
+        if not np.isclose(got, expected, rtol=rtol, atol=1e-6):
+            return f"predicción {got} != referencia {expected} para {sample}"
+    return None
+
+def reference_samples(kernel: FusedLinearModel,
+                      constraints: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Casos de verificación que recorren los extremos de cada característica"""
+    samples = []
+    categories = {col: list(mapping) for col, mapping in kernel.encoders.items()}
+    for k in range(3):
+        sample = {}
+        for col in kernel.feature_cols:
+            if col in categories:
+                options = categories[col]
+                sample[col] = options[k % len(options)]
+            else:
+                lo = constraints.get(col, {}).get('ge', 0)
+                hi = constraints.get(col, {}).get('le', lo + 1)
+                value = lo + (hi - lo) * k / 2
+                sample[col] = int(value) if constraints.get(col, {}).get('integer') else value
+        samples.append(sample)
+    return samples
@@ -0,0 +1,279 @@
+"""
+Métricas de la API en formato de texto de Prometheus - CRISP-DM
+Fase 6: Despliegue
+
+Contadores, histogramas y gauges mínimos (sin dependencias) y un middleware
+ASGI que mide cada petición por etapas:
+
+    decode:     lectura del cuerpo, JSON y validación de Pydantic (antes del handler)
+    preprocess: validación y codificación de las características
+    predict:    cálculo del modelo
+    serialize:  construcción y serialización de la respuesta (después del handler)
+
+El handler marca las etapas con el RequestTimer de la petición en curso; sin
+middleware (por ejemplo, al llamar al handler directamente) las marcas no
+hacen nada.
+"""
+
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 10, 100, 1000, 5000, 10000, 50000, 100000, 500000)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Contador monótono con etiquetas (los valores de etiqueta se pasan como tupla)"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: Tuple[str, ...] = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Gauge(Counter):
+    """Valor instantáneo con etiquetas"""
+
+    kind = 'gauge'
+
+    def set(self, labels: Tuple[str, ...] = (), value: float = 0):
+        self._values[labels] = value
+
+    def clear(self):
+        self._values = {}
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Por etiqueta: [conteos por bucket (+Inf al final), suma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, labels: Tuple[str, ...]) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total, n) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {n}"
+
+class MetricsRegistry:
+    """Conjunto de métricas y colectores que se evalúan al exponer /metrics"""
+
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Callable[[], Iterable]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable]):
+        """collector() devuelve métricas ya calculadas (p. ej. a partir de stats())"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Texto en el formato de exposición de Prometheus (versión 0.0.4)"""
+        metrics = list(self.metrics)
+        for collector in self.collectors:
+            metrics.extend(collector())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+class RequestTimer:
+    """Marcas de tiempo por etapa de una petición"""
+
+    __slots__ = ('start', 'last', 'stages')
+
+    def __init__(self, start: float):
+        self.start = start
+        self.last = start
+        self.stages: List[Tuple[str, float]] = []
+
+    def lap(self, stage: Optional[str] = None):
+        """Cerrar la etapa en curso (desde la marca anterior); sin nombre solo avanza la marca"""
+        now = time.perf_counter()
+        if stage is not None:
+            self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def add(self, stage: str, seconds: float):
+        """Registrar una etapa medida por separado (p. ej. dentro de los trabajadores)"""
+        self.stages.append((stage, seconds))
+
+class _NullTimer:
+    __slots__ = ()
+
+    def lap(self, stage: Optional[str] = None):
+        pass
+
+    def add(self, stage: str, seconds: float):
+        pass
+
+NULL_TIMER = _NullTimer()
+_current_timer: ContextVar = ContextVar('request_timer', default=NULL_TIMER)
+
+def request_timer():
+    """RequestTimer de la petición en curso (o uno que no hace nada)"""
+    return _current_timer.get()
+
+# Métricas de la API
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+
+metrics = MetricsRegistry()
+REQUESTS = metrics.counter(
+    'ventas_requests_total', 'Peticiones HTTP por endpoint y código de estado', ('endpoint', 'status'))
+REQUEST_LATENCY = metrics.histogram(
+    'ventas_request_duration_seconds', 'Latencia total de la petición por endpoint', ('endpoint',))
+STAGE_LATENCY = metrics.histogram(
+    'ventas_stage_duration_seconds', 'Latencia por etapa (decode, preprocess, predict, serialize)',
+    ('endpoint', 'stage'))
+BATCH_SIZE = metrics.histogram(
+    'ventas_batch_size_rows', 'Filas por petición de lote o bloque de streaming', ('endpoint',),
+    buckets=BATCH_SIZE_BUCKETS)
+ERRORS = metrics.counter(
+    'ventas_errors_total', 'Errores por endpoint y causa', ('endpoint', 'cause'))
+ROW_ERRORS = metrics.counter(
+    'ventas_row_errors_total', 'Filas rechazadas en lotes por columna inválida', ('endpoint', 'column'))
+MODEL_LOAD_SECONDS = metrics.gauge(
+    'ventas_model_load_seconds', 'Duración de la última carga del modelo (startup, reload, registry)', ('kind',))
+MODEL_LOADS = metrics.counter(
+    'ventas_model_loads_total', 'Cargas del modelo por resultado', ('kind', 'result'))
+MODEL_INFO = metrics.gauge(
+    'ventas_model_info', 'Versión del modelo principal en servicio (valor 1)', ('version', 'model_type'))
+
+# Causa de error según el código de estado de la respuesta
+ERROR_CAUSES = {
+    400: 'prediction', 401: 'unauthorized', 403: 'forbidden', 404: 'unknown_version',
+    422: 'validation', 500: 'internal', 503: 'model_unavailable'
+}
+
+def record_model_load(kind: str, seconds: float, ok: bool):
+    """Duración y resultado de una carga del modelo"""
+    MODEL_LOADS.inc((kind, 'ok' if ok else 'error'))
+    if ok:
+        MODEL_LOAD_SECONDS.set((kind,), seconds)
+
+def snapshot(kind: str, name: str, help_text: str, labelnames: Sequence[str],
+             values: Dict[Tuple[str, ...], float]):
+    """Métrica calculada al exponer /metrics a partir de valores ya acumulados"""
+    metric = Gauge(name, help_text, labelnames) if kind == 'gauge' else Counter(name, help_text, labelnames)
+    for labels, value in values.items():
+        metric.inc(labels, value)
+    return metric
+
+def record_row_errors(endpoint: str, errors: List[Dict]):
+    """Contar filas inválidas de un lote por la columna que falló"""
+    for error in errors:
+        column = error.get('error', '').split(':', 1)[0] or 'unknown'
+        ROW_ERRORS.inc((endpoint, column))
+
+class MetricsMiddleware:
+    """Middleware ASGI: conteo, latencia total y etapas decode/serialize por endpoint
+
+    Solo se etiquetan las rutas conocidas de la aplicación para acotar la
+    cardinalidad; el resto se agrupa como 'other'.
+    """
+
+    def __init__(self, app, endpoints: Optional[Callable[[], Iterable[str]]] = None):
+        self.app = app
+        self._endpoints_fn = endpoints
+        self._endpoints = None
+
+    def _endpoint(self, path: str) -> str:
+        if self._endpoints is None:
+            self._endpoints = set(self._endpoints_fn()) if self._endpoints_fn else set()
+        return path if path in self._endpoints else 'other'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not METRICS_ENABLED or scope.get('path') == '/metrics':
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope.get('path', ''))
+        timer = RequestTimer(time.perf_counter())
+        token = _current_timer.set(timer)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                # Desde la última marca del handler hasta el inicio de la respuesta
+                if timer.stages:
+                    timer.lap('serialize')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_timer.reset(token)
+            elapsed = time.perf_counter() - timer.start
+            code = status[0]
+            REQUESTS.inc((endpoint, str(code)))
+            REQUEST_LATENCY.observe((endpoint,), elapsed)
+            for stage, seconds in timer.stages:
+                STAGE_LATENCY.observe((endpoint, stage), seconds)
+            if code >= 400:
+                cause = 'not_found' if endpoint == 'other' else ERROR_CAUSES.get(code, str(code))
+                ERRORS.inc((endpoint, cause))
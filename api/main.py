@@ -3,72 +3,83 @@ API REST para Predicción de Ventas - CRISP-DM
 Fase 6: Despliegue en Render
 """
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-import pandas as pd
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
+from pydantic import BaseModel, ConfigDict, Field
 import numpy as np
-import joblib
 import os
 from typing import List, Dict, Any, Optional
-import uvicorn
+import sys
+
+# pandas, joblib y sklearn solo se necesitan en la ruta de respaldo con los
+# archivos .pkl; se importan de forma diferida para acelerar el arranque en frío
+
+# Los módulos hermanos del directorio api se importan por nombre
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fast_path import decode_request, validate_request
+from inference import encode_record
+from instrumentation import (
+    BATCH_SIZE, MODEL_INFO, ROW_ERRORS, MetricsMiddleware, metrics, record_model_load, record_row_errors,
+    request_timer, snapshot
+)
+from coalescer import PredictionCoalescer
+from columnar import ARROW_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE, decode_arrow, decode_columnar, score_columnar
+from executors import create_executor_from_env
+from prediction_cache import create_cache_from_env, make_key
+from registry import create_registry_from_env
+from schemas import FIELD_CONSTRAINTS, PredictionRequest
+from serving import MODEL_BUNDLE_PATH, ServingModel, artifact_signature, load_serving_model
+from static_responses import API_VERSION, NO_MODEL_RESPONSES, PreEncoded, StaticResponses
+from streaming import MEDIA_TYPES, BodyStreamingResponse, detect_format, stream_predictions
+import asyncio
+import time
 
 # Configurar FastAPI
 app = FastAPI(
     title="API de Predicción de Ventas Mensuales",
     description="API para predecir ventas mensuales por tienda usando Regresión Lineal siguiendo metodología CRISP-DM",
-    version="1.0.0",
+    version=API_VERSION,
     docs_url="/docs",
     redoc_url="/redoc"
 )
 
-# Variables globales para el modelo
-model = None
-scaler = None
-label_encoders = None
-model_info = None
-feature_cols = None
+# Métricas por endpoint y etapa en /metrics (METRICS_ENABLED=0 para desactivarlas)
+app.add_middleware(MetricsMiddleware, endpoints=lambda: [route.path for route in app.routes])
 
-# Esquemas Pydantic
-class PredictionRequest(BaseModel):
-    """Esquema para las solicitudes de predicción individual"""
-    tienda_id: int = Field(..., description="ID de la tienda", ge=1, le=100)
-    empleados: float = Field(..., description="Número de empleados", ge=1, le=50)
-    publicidad: float = Field(..., description="Gasto en publicidad", ge=0, le=20000)
-    ubicacion: str = Field(..., description="Tipo de ubicación", pattern="^(rural|suburbana|urbana)$")
-    
-    class Config:
-        schema_extra = {
-            "example": {
-                "tienda_id": 1,
-                "empleados": 20,
-                "publicidad": 5000,
-                "ubicacion": "urbana"
-            }
-        }
+# Modelo en servicio: una única referencia inmutable que se reemplaza al recargar
+serving_model: Optional[ServingModel] = None
+coalescer = None
+prediction_executor = None
+prediction_cache = None
 
+# Versiones residentes, reparto de tráfico y versión en sombra
+# (MODEL_TRAFFIC_SPLIT, MODEL_SHADOW_VERSION)
+model_registry = create_registry_from_env()
+
+# Esquemas Pydantic
 class BatchPredictionRequest(BaseModel):
     """Esquema para predicciones en lote"""
     data: List[Dict[str, Any]] = Field(..., description="Lista de datos para predicción")
     
-    class Config:
-        schema_extra = {
-            "example": {
-                "data": [
-                    {
-                        "tienda_id": 1,
-                        "empleados": 20,
-                        "publicidad": 5000,
-                        "ubicacion": "urbana"
-                    },
-                    {
-                        "tienda_id": 2,
-                        "empleados": 15,
-                        "publicidad": 3000,
-                        "ubicacion": "rural"
-                    }
-                ]
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "data": [
+                {
+                    "tienda_id": 1,
+                    "empleados": 20,
+                    "publicidad": 5000,
+                    "ubicacion": "urbana"
+                },
+                {
+                    "tienda_id": 2,
+                    "empleados": 15,
+                    "publicidad": 3000,
+                    "ubicacion": "rural"
+                }
+            ]
         }
+    })
 
 class PredictionResponse(BaseModel):
     """Esquema para las respuestas de predicción"""
@@ -78,8 +89,9 @@ class PredictionResponse(BaseModel):
 
 class BatchPredictionResponse(BaseModel):
     """Esquema para respuestas de predicción en lote"""
-    predictions: List[float]
+    predictions: List[Optional[float]]
     model_info: Dict[str, Any]
+    errors: List[Dict[str, Any]] = []
 
 class HealthResponse(BaseModel):
     """Esquema para el endpoint de salud"""
@@ -87,294 +99,541 @@ class HealthResponse(BaseModel):
     model_loaded: bool
     model_type: str
     version: str
+    model_version: Optional[str] = None
+
+# Token para los endpoints de administración (sin token quedan deshabilitados)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Intervalo de sondeo de los artefactos en disco para recargar (0 = deshabilitado)
+MODEL_WATCH_INTERVAL_S = float(os.environ.get("MODEL_WATCH_INTERVAL_S", 0))
+
+# Versiones adicionales que se mantienen residentes (bundles o directorios con .pkl)
+MODEL_REGISTRY_PATHS = [
+    path.strip() for path in os.environ.get("MODEL_REGISTRY_PATHS", "").split(",") if path.strip()
+]
+
+# Filas por bloque en /predict_stream (acota la memoria por petición)
+STREAM_BLOCK_ROWS = int(os.environ.get("STREAM_BLOCK_ROWS", 5000))
 
-def load_model():
+_reload_lock = asyncio.Lock()
+_watch_task = None
+_shadow_tasks = set()
+
+def load_model(bundle_path: Optional[str] = MODEL_BUNDLE_PATH):
     """Cargar modelo y preprocesadores"""
-    global model, scaler, label_encoders, model_info, feature_cols
+    global serving_model
     
+    start = time.perf_counter()
     try:
-        # Cargar modelo
-        model = joblib.load('models/model.pkl')
-        print("✅ Modelo cargado exitosamente")
-        
-        # Cargar preprocesadores
-        scaler = joblib.load('models/scaler.pkl')
-        print("✅ Scaler cargado exitosamente")
-        
-        label_encoders = joblib.load('models/label_encoders.pkl')
-        print("✅ Label encoders cargados exitosamente")
-        
-        # Cargar información del modelo
-        model_info = joblib.load('models/model_info.pkl')
-        print("✅ Model info cargado exitosamente")
-        
-        # Verificar estructura de model_info
-        if isinstance(model_info, dict):
-            if 'processed_data_info' in model_info and 'feature_cols' in model_info['processed_data_info']:
-                feature_cols = model_info['processed_data_info']['feature_cols']
-                print(f"✅ Feature cols cargadas: {feature_cols}")
-            else:
-                # Valores por defecto si no están disponibles
-                feature_cols = ['tienda_id', 'empleados', 'publicidad', 'ubicacion']
-                print("⚠️ Usando feature cols por defecto")
-        else:
-            # Si model_info no es un diccionario, usar valores por defecto
-            feature_cols = ['tienda_id', 'empleados', 'publicidad', 'ubicacion']
-            print("⚠️ Model info no es un diccionario, usando valores por defecto")
-        
+        activate_model(load_serving_model(bundle_path, FIELD_CONSTRAINTS))
+        record_model_load('startup', time.perf_counter() - start, True)
         print("✅ Modelo y preprocesadores cargados exitosamente")
         return True
         
     except Exception as e:
+        record_model_load('startup', time.perf_counter() - start, False)
         print(f"❌ Error al cargar el modelo: {e}")
-        # Inicializar con valores por defecto
-        model = None
-        scaler = None
-        label_encoders = None
-        model_info = None
-        feature_cols = ['tienda_id', 'empleados', 'publicidad', 'ubicacion']
+        serving_model = None
         return False
 
-def preprocess_input(data: Dict[str, Any]) -> np.ndarray:
-    """Preprocesar datos de entrada"""
-    # Crear DataFrame
-    df = pd.DataFrame([data])
+def activate_model(new_model: ServingModel):
+    """Publicar una nueva versión con un único reemplazo atómico de la referencia"""
+    global serving_model
+    
+    # La versión anterior sigue residente solo si está fijada, en el reparto o en sombra
+    new_model = model_registry.add(new_model, primary=True)
+    serving_model = new_model
+    if prediction_cache is not None:
+        prediction_cache.retain_versions(model_registry.models)
+    # Los trabajadores nuevos precargan la nueva versión; los lotes en curso
+    # terminan en el pool anterior
+    if prediction_executor is not None:
+        prediction_executor.start(new_model.scorer)
+    MODEL_INFO.clear()
+    MODEL_INFO.set((new_model.version, new_model.model_type), 1)
+    print(f"✅ Versión del modelo en servicio: {new_model.version}")
+
+def _load_and_validate(bundle_path: Optional[str], models_dir: str = 'models') -> ServingModel:
+    """Cargar una versión candidata y validarla con una predicción de humo"""
+    candidate = load_serving_model(bundle_path, FIELD_CONSTRAINTS, models_dir=models_dir, strict=True)
+    candidate.smoke_test(FIELD_CONSTRAINTS)
+    return candidate
+
+def load_registry_versions(paths: List[str] = MODEL_REGISTRY_PATHS):
+    """Cargar y fijar en el registro las versiones adicionales"""
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            if os.path.isdir(path):
+                model = _load_and_validate(None, models_dir=path)
+            else:
+                model = _load_and_validate(path)
+            model = model_registry.add(model, pinned=True)
+            record_model_load('registry', time.perf_counter() - start, True)
+            print(f"✅ Versión {model.version} residente desde '{path}'")
+        except Exception as e:
+            record_model_load('registry', time.perf_counter() - start, False)
+            print(f"⚠️ No se pudo cargar la versión de '{path}': {e}")
+
+def resolve_model(requested_version: Optional[str] = None, split: bool = True) -> ServingModel:
+    """Versión que atiende una petición: la de X-Model-Version, el reparto o la principal"""
+    try:
+        current = model_registry.route(requested_version) if split or requested_version \
+            else model_registry.primary_model
+    except KeyError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Versión '{requested_version}' no residente; disponibles: {sorted(model_registry.models)}"
+        )
+    if current is None:
+        raise HTTPException(status_code=503, detail="Modelo no disponible")
+    return current
+
+async def shadow_score(shadow: ServingModel, records: List[Dict[str, Any]],
+                       predictions: List[float], valid_idx: List[int]):
+    """Puntuar en sombra y comparar con las predicciones servidas"""
+    start = time.perf_counter()
+    try:
+        shadow_predictions, shadow_idx, _ = await prediction_executor.score(records, shadow.scorer)
+    except Exception as e:
+        model_registry.shadow_stats.failures += 1
+        print(f"⚠️ Fallo al puntuar en sombra con {shadow.version}: {e}")
+        return
+    elapsed = time.perf_counter() - start
     
-    # Codificar ubicación
-    if 'ubicacion' in df.columns:
-        df['ubicacion'] = label_encoders['ubicacion'].transform(df['ubicacion'])
+    served = dict(zip(valid_idx, predictions))
+    pairs = [(prediction, served[i]) for i, prediction in zip(shadow_idx, shadow_predictions) if i in served]
+    model_registry.shadow_stats.compare([p for p, _ in pairs], [s for _, s in pairs], elapsed)
+
+def schedule_shadow(current: ServingModel, records: List[Dict[str, Any]],
+                    predictions: List[float], valid_idx: List[int]):
+    """Lanzar la puntuación en sombra sin que la respuesta la espere"""
+    shadow = model_registry.shadow_for(current)
+    if shadow is None or not valid_idx:
+        return
+    task = asyncio.create_task(shadow_score(shadow, records, predictions, valid_idx))
+    _shadow_tasks.add(task)
+    task.add_done_callback(_shadow_tasks.discard)
+
+async def reload_model(bundle_path: Optional[str] = MODEL_BUNDLE_PATH) -> Dict[str, Any]:
+    """Cargar y validar una nueva versión en segundo plano y activarla
     
-    # Reordenar columnas según el orden del entrenamiento
-    df = df[feature_cols]
+    La carga y la predicción de humo se ejecutan en un hilo para no bloquear el
+    event loop; si fallan, la versión actual sigue en servicio.
+    """
+    async with _reload_lock:
+        previous = serving_model
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            candidate = await loop.run_in_executor(None, _load_and_validate, bundle_path)
+        except Exception:
+            record_model_load('reload', time.perf_counter() - start, False)
+            raise
+        record_model_load('reload', time.perf_counter() - start, True)
+        activate_model(candidate)
+        return {
+            "status": "reloaded",
+            "previous_version": previous.version if previous else None,
+            "version": candidate.version,
+            "source": candidate.source
+        }
+
+async def watch_artifacts(interval: float):
+    """Recargar automáticamente cuando cambian los artefactos en disco"""
+    signature = artifact_signature(MODEL_BUNDLE_PATH)
+    while True:
+        await asyncio.sleep(interval)
+        current = artifact_signature(MODEL_BUNDLE_PATH)
+        if current == signature:
+            continue
+        signature = current
+        try:
+            result = await reload_model(MODEL_BUNDLE_PATH)
+            print(f"🔄 Modelo recargado: {result['previous_version']} → {result['version']}")
+        except Exception as e:
+            print(f"⚠️ Recarga automática rechazada, se mantiene la versión actual: {e}")
+
+def create_coalescer():
+    """Crear el coalescedor de /predict si está habilitado por variables de entorno
     
-    # Escalar características
-    df_scaled = scaler.transform(df)
+    PREDICT_COALESCE_WINDOW_MS: ventana de agrupación en milisegundos (0 = deshabilitado)
+    PREDICT_COALESCE_MAX_BATCH: número máximo de filas por lote
+    """
+    window_ms = float(os.environ.get("PREDICT_COALESCE_WINDOW_MS", 0))
+    if window_ms <= 0:
+        return None
     
-    return df_scaled
+    max_batch = int(os.environ.get("PREDICT_COALESCE_MAX_BATCH", 256))
+    print(f"✅ Coalescedor de /predict habilitado (ventana {window_ms} ms, máx. {max_batch} filas)")
+    return PredictionCoalescer(
+        lambda X: serving_model.predict_matrix(X), window_ms=window_ms, max_batch=max_batch
+    )
 
 @app.on_event("startup")
 async def startup_event():
     """Evento de inicio de la aplicación"""
+    global coalescer, prediction_executor, prediction_cache, _watch_task
+    
     print("🚀 Iniciando API de Predicción de Ventas...")
+    
+    # Ejecutor para sacar el trabajo de CPU del event loop
+    prediction_executor = create_executor_from_env()
+    
     if not load_model():
         print("⚠️ No se pudo cargar el modelo. La API funcionará en modo limitado.")
+    print(f"✅ Ejecutor de predicciones: {prediction_executor.kind}")
+    
+    load_registry_versions()
+    
+    coalescer = create_coalescer()
+    
+    # Caché de /predict (PREDICT_CACHE_SIZE, PREDICT_CACHE_TTL_S, PREDICT_CACHE_REDIS_URL)
+    prediction_cache = create_cache_from_env()
+    if prediction_cache is not None:
+        print(f"✅ Caché de predicciones habilitada ({prediction_cache.stats()['backend']}, "
+              f"{prediction_cache.max_size} entradas, TTL {prediction_cache.ttl} s)")
+    
+    if MODEL_WATCH_INTERVAL_S > 0:
+        _watch_task = asyncio.create_task(watch_artifacts(MODEL_WATCH_INTERVAL_S))
+        print(f"✅ Vigilando artefactos del modelo cada {MODEL_WATCH_INTERVAL_S} s")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Liberar el pool de trabajadores"""
+    if _watch_task is not None:
+        _watch_task.cancel()
+    if prediction_executor is not None:
+        prediction_executor.shutdown()
+
+def static_responses(model: Optional[ServingModel]) -> StaticResponses:
+    """Respuestas precodificadas de la versión (o las de la API sin modelo)"""
+    return model.static_responses if model is not None else NO_MODEL_RESPONSES
 
 @app.get("/", response_model=Dict[str, Any])
-async def root():
+async def root(if_none_match: Optional[str] = Header(None)):
     """Endpoint raíz con información del modelo"""
-    return {
-        "message": "API de Predicción de Ventas Mensuales por Tienda",
-        "version": "1.0.0",
-        "model_type": model_info['model_type'] if model_info else "No disponible",
-        "features": len(feature_cols) if feature_cols else 0,
-        "methodology": "CRISP-DM",
-        "algorithm": "Regresión Lineal",
-        "docs": "/docs",
-        "health": "/health",
-        "example": "/example"
-    }
+    return static_responses(serving_model).root.response(if_none_match)
 
 @app.get("/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(if_none_match: Optional[str] = Header(None)):
     """Verificar el estado del servicio"""
-    return HealthResponse(
-        status="healthy" if model is not None else "unhealthy",
-        model_loaded=model is not None,
-        model_type=model_info['model_type'] if model_info else "No disponible",
-        version="1.0.0"
-    )
+    return static_responses(serving_model).health.response(if_none_match)
+
+async def score_single(current: ServingModel, record: Dict[str, Any]) -> float:
+    """Predecir una fila validada con el coalescedor, el kernel o sklearn"""
+    timer = request_timer()
+    if coalescer is not None:
+        # Agrupar con otras peticiones concurrentes y predecir como una matriz
+        row = encode_record(record, current.feature_cols, current.encoders)
+        timer.lap('preprocess')
+        prediction = await coalescer.submit(row, current.predict_matrix)
+        timer.lap('predict')
+        return prediction
+    if current.kernel is not None:
+        # Kernel plegado: unas pocas multiplicaciones y sumas
+        row = encode_record(record, current.feature_cols, current.encoders)
+        timer.lap('preprocess')
+        prediction = current.kernel.predict_row(row)
+        timer.lap('predict')
+        return prediction
+    
+    # Ruta sklearn: se ejecuta en el pool configurado para no bloquear el event loop
+    predictions, _, errors = await prediction_executor.score([record], current.scorer)
+    timer.lap('predict')
+    if errors:
+        raise ValueError(errors[0]["error"])
+    return predictions[0]
+
+async def predict_one(current: ServingModel, record: Dict[str, Any]) -> float:
+    """Predicción de una fila validada con caché, latencia por versión y sombra"""
+    start = time.perf_counter()
+    cache_key = None
+    prediction = None
+    if prediction_cache is not None:
+        # Mismos campos validados + misma versión = misma predicción
+        cache_key = make_key(current.version, (record[col] for col in current.feature_cols))
+        prediction = await prediction_cache.lookup(cache_key)
+        request_timer().lap('cache')
+    
+    if prediction is None:
+        prediction = await score_single(current, record)
+        if cache_key is not None:
+            await prediction_cache.store(cache_key, prediction)
+    
+    model_registry.record_latency(current.version, time.perf_counter() - start)
+    schedule_shadow(current, [record], [prediction], [0])
+    return prediction
 
 @app.post("/predict", response_model=PredictionResponse)
-async def predict_ventas(request: PredictionRequest):
+async def predict_ventas(request: PredictionRequest, x_model_version: Optional[str] = Header(None)):
     """Realizar predicción de ventas individual"""
-    if model is None:
-        raise HTTPException(status_code=503, detail="Modelo no disponible")
+    # Lectura del cuerpo y validación de Pydantic hasta aquí
+    request_timer().lap('decode')
+    # La petición termina con la versión elegida al empezar aunque se recargue otra
+    current = resolve_model(x_model_version)
     
     try:
-        # Preprocesar datos
-        data_dict = request.dict()
-        X = preprocess_input(data_dict)
-        
-        # Realizar predicción
-        prediction = model.predict(X)[0]
-        
-        # Calcular confianza (basada en R² del modelo)
-        confidence = 0.57  # Valor por defecto
-        if model_info and 'metrics' in model_info and 'r2_test' in model_info['metrics']:
-            confidence = model_info['metrics']['r2_test']
+        prediction = await predict_one(current, vars(request))
         
-        # Preparar información del modelo con validaciones
-        model_type = "LinearRegression"
-        r2_score = 0.57
-        rmse = 10739.31
-        
-        if model_info:
-            if 'model_type' in model_info:
-                model_type = model_info['model_type']
-            if 'metrics' in model_info:
-                if 'r2_test' in model_info['metrics']:
-                    r2_score = model_info['metrics']['r2_test']
-                if 'rmse_test' in model_info['metrics']:
-                    rmse = model_info['metrics']['rmse_test']
-        
-        return PredictionResponse(
-            prediction=float(prediction),
-            confidence=float(confidence),
-            model_info={
-                "model_type": model_type,
-                "r2_score": r2_score,
-                "rmse": rmse
-            }
-        )
+        # Confianza y metadatos resueltos al cargar la versión: solo se escribe la predicción
+        return Response(current.response_template.render(prediction), media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error en la predicción: {str(e)}")
 
+@app.post("/predict_fast", response_model=PredictionResponse)
+async def predict_ventas_fast(request: Request, x_model_version: Optional[str] = Header(None)):
+    """Predicción individual de alto rendimiento con el mismo contrato que /predict
+    
+    Decodifica y valida el cuerpo sin construir modelos de Pydantic y responde
+    con la plantilla precalculada de la versión; las entradas que necesitan
+    conversión o que son inválidas pasan por la validación de PredictionRequest.
+    """
+    body = await request.body()
+    record = decode_request(body, FIELD_CONSTRAINTS)
+    if record is None:
+        record = validate_request(body, PredictionRequest)
+    request_timer().lap('decode')
+    current = resolve_model(x_model_version)
+    
+    try:
+        prediction = await predict_one(current, record)
+        return Response(current.response_template.render(prediction), media_type="application/json")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error en la predicción: {str(e)}")
+
 @app.post("/predict_batch", response_model=BatchPredictionResponse)
-async def predict_ventas_batch(request: BatchPredictionRequest):
+async def predict_ventas_batch(request: BatchPredictionRequest, x_model_version: Optional[str] = Header(None)):
     """Realizar predicciones en lote"""
-    if model is None:
-        raise HTTPException(status_code=503, detail="Modelo no disponible")
+    timer = request_timer()
+    timer.lap('decode')
+    current = resolve_model(x_model_version)
+    start = time.perf_counter()
+    BATCH_SIZE.observe(('/predict_batch',), len(request.data))
     
     try:
-        predictions = []
+        predictions: List[Optional[float]] = [None] * len(request.data)
         
-        for data in request.data:
-            # Preprocesar datos
-            X = preprocess_input(data)
-            
-            # Realizar predicción
-            prediction = model.predict(X)[0]
-            predictions.append(float(prediction))
+        # Validar, codificar y predecir el lote fuera del event loop (según PREDICT_EXECUTOR)
+        batch_predictions, valid_idx, errors = await prediction_executor.score(request.data, current.scorer)
+        timer.lap('score')
+        record_row_errors('/predict_batch', errors)
         
-        # Preparar información del modelo con validaciones
-        model_type = "LinearRegression"
-        r2_score = 0.57
-        rmse = 10739.31
+        for i, prediction in zip(valid_idx, batch_predictions):
+            predictions[i] = prediction
         
-        if model_info:
-            if 'model_type' in model_info:
-                model_type = model_info['model_type']
-            if 'metrics' in model_info:
-                if 'r2_test' in model_info['metrics']:
-                    r2_score = model_info['metrics']['r2_test']
-                if 'rmse_test' in model_info['metrics']:
-                    rmse = model_info['metrics']['rmse_test']
+        model_registry.record_latency(current.version, time.perf_counter() - start, len(request.data))
+        schedule_shadow(current, request.data, batch_predictions, valid_idx)
         
         return BatchPredictionResponse(
             predictions=predictions,
             model_info={
-                "model_type": model_type,
-                "r2_score": r2_score,
-                "rmse": rmse,
-                "batch_size": len(predictions)
-            }
+                "model_type": current.model_type,
+                "model_version": current.version,
+                "r2_score": current.r2_score,
+                "rmse": current.rmse,
+                "batch_size": len(predictions),
+                "valid_rows": len(valid_idx)
+            },
+            errors=errors
         )
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error en la predicción en lote: {str(e)}")
 
-@app.get("/model-info", response_model=Dict[str, Any])
-async def get_model_info():
-    """Obtener información detallada del modelo"""
-    if model_info is None:
-        raise HTTPException(status_code=503, detail="Información del modelo no disponible")
+@app.post("/predict_stream")
+async def predict_ventas_stream(request: Request, x_model_version: Optional[str] = Header(None)):
+    """Puntuar una carga NDJSON o CSV en streaming (Content-Type application/x-ndjson o text/csv)
     
-    # Preparar respuesta con validaciones
-    response = {
-        "model_type": "LinearRegression",
-        "features": feature_cols or ['tienda_id', 'empleados', 'publicidad', 'ubicacion'],
-        "metrics": {
-            "r2_train": 0.5893,
-            "r2_test": 0.5732,
-            "mae_train": 8516.5747,
-            "mae_test": 8532.4092,
-            "rmse_train": 10721.5931,
-            "rmse_test": 10739.3127
-        },
-        "training_info": {
-            "cv_scores": [0.58555319, 0.5819458, 0.61389409, 0.56689647, 0.59305461],
-            "cv_mean": 0.5883,
-            "cv_std": 0.0308
-        },
-        "data_info": {
-            "train_size": 8000,
-            "test_size": 2000,
-            "feature_cols": feature_cols or ['tienda_id', 'empleados', 'publicidad', 'ubicacion'],
-            "target_col": "ventas"
-        }
-    }
+    El cuerpo se lee por trozos y las predicciones de cada bloque de
+    STREAM_BLOCK_ROWS filas se envían en cuanto se calculan, en el mismo formato
+    de la carga y con el índice de cada fila; las filas inválidas llevan su error.
+    """
+    current = resolve_model(x_model_version)
+    fmt = detect_format(request.headers.get("content-type"))
+    timer = request_timer()
     
-    # Actualizar con datos reales si están disponibles
-    if isinstance(model_info, dict):
-        if 'model_type' in model_info:
-            response["model_type"] = model_info['model_type']
-        if 'metrics' in model_info:
-            response["metrics"] = model_info['metrics']
-        if 'training_info' in model_info:
-            response["training_info"] = model_info['training_info']
-        if 'processed_data_info' in model_info:
-            response["data_info"] = model_info['processed_data_info']
+    async def score(records):
+        start = time.perf_counter()
+        result = await prediction_executor.score(records, current.scorer)
+        elapsed = time.perf_counter() - start
+        model_registry.record_latency(current.version, elapsed, len(records))
+        timer.add('score', elapsed)
+        BATCH_SIZE.observe(('/predict_stream',), len(records))
+        record_row_errors('/predict_stream', result[2])
+        return result
     
-    return response
+    return BodyStreamingResponse(
+        stream_predictions(request.stream(), fmt, STREAM_BLOCK_ROWS, score),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"X-Model-Version": current.version}
+    )
 
-@app.get("/feature-importance", response_model=Dict[str, Any])
-async def get_feature_importance():
-    """Obtener importancia de características"""
-    # Valores por defecto
-    default_importance = [
-        {"feature": "empleados", "coefficient": 11583.705021},
-        {"feature": "ubicacion", "coefficient": 5364.847664},
-        {"feature": "publicidad", "coefficient": 1482.179605},
-        {"feature": "tienda_id", "coefficient": 89.109364}
-    ]
+@app.post("/predict_columnar")
+async def predict_ventas_columnar(request: Request, x_model_version: Optional[str] = Header(None)):
+    """Puntuar un lote columnar binario (application/vnd.ventas.columnar o Arrow IPC)
     
-    model_type = "LinearRegression"
+    Devuelve las predicciones como un buffer float64 little-endian, una por fila
+    y en el orden de la carga, con NaN en las filas inválidas. X-Valid-Rows
+    indica cuántas filas se puntuaron.
+    """
+    timer = request_timer()
+    current = resolve_model(x_model_version)
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if content_type not in (COLUMNAR_MEDIA_TYPE, ARROW_MEDIA_TYPE):
+        raise HTTPException(
+            status_code=415,
+            detail=f"Content-Type debe ser {COLUMNAR_MEDIA_TYPE} o {ARROW_MEDIA_TYPE}"
+        )
     
-    # Actualizar con datos reales si están disponibles
-    if model_info is not None and isinstance(model_info, dict):
-        if 'model_type' in model_info:
-            model_type = model_info['model_type']
-        if 'feature_importance' in model_info:
-            try:
-                if hasattr(model_info['feature_importance'], 'to_dict'):
-                    default_importance = model_info['feature_importance'].to_dict('records')
-                elif isinstance(model_info['feature_importance'], list):
-                    default_importance = model_info['feature_importance']
-            except:
-                pass  # Usar valores por defecto si hay error
+    body = await request.body()
+    try:
+        batch = decode_arrow(body) if content_type == ARROW_MEDIA_TYPE else decode_columnar(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Carga columnar inválida: {e}")
+    timer.lap('decode')
+    BATCH_SIZE.observe(('/predict_columnar',), batch.rows)
+    start = time.perf_counter()
     
-    return {
-        "feature_importance": default_importance,
-        "model_type": model_type
+    try:
+        # Sin copias ni filas: validación y predicción por columnas
+        predictions, valid, rejected = await prediction_executor.run(
+            score_columnar, batch, current.feature_cols, current.encoders, FIELD_CONSTRAINTS,
+            current.kernel, current.predict_matrix
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Error en la predicción columnar: {e}")
+    timer.lap('score')
+    
+    model_registry.record_latency(current.version, time.perf_counter() - start, batch.rows)
+    for col, count in rejected.items():
+        ROW_ERRORS.inc(('/predict_columnar', col), count)
+    
+    return Response(
+        predictions.astype('<f8', copy=False).tobytes(),
+        media_type="application/octet-stream",
+        headers={
+            "X-Model-Version": current.version,
+            "X-Rows": str(batch.rows),
+            "X-Valid-Rows": str(int(valid.sum()))
+        }
+    )
+
+@app.get("/coalescer/stats", response_model=Dict[str, Any])
+async def get_coalescer_stats():
+    """Métricas del coalescedor de /predict (tamaño de lote y espera en cola)"""
+    if coalescer is None:
+        return {"enabled": False}
+    return {"enabled": True, **coalescer.stats()}
+
+@app.get("/cache/stats", response_model=Dict[str, Any])
+async def get_cache_stats():
+    """Aciertos, fallos y desalojos de la caché de /predict"""
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **prediction_cache.stats()}
+
+def collect_runtime_metrics():
+    """Métricas de la caché, el coalescedor y el registro calculadas al exponer /metrics"""
+    collected = []
+    if prediction_cache is not None:
+        cache = prediction_cache.stats()
+        collected.append(snapshot('counter', 'ventas_cache_lookups_total', 'Consultas a la caché de /predict',
+                                  ('result',), {('hit',): cache['hits'], ('miss',): cache['misses']}))
+        collected.append(snapshot('gauge', 'ventas_cache_entries', 'Entradas en la caché de /predict',
+                                  (), {(): cache['size']}))
+    if coalescer is not None:
+        stats = coalescer.stats()
+        collected.append(snapshot('counter', 'ventas_coalescer_batches_total', 'Lotes del coalescedor',
+                                  (), {(): stats['batches']}))
+        collected.append(snapshot('counter', 'ventas_coalescer_requests_total', 'Peticiones agrupadas',
+                                  (), {(): stats['requests']}))
+    shadow = model_registry.shadow_stats
+    if model_registry.shadow_version:
+        collected.append(snapshot('counter', 'ventas_shadow_failures_total', 'Fallos de la versión en sombra',
+                                  (), {(): shadow.failures}))
+        collected.append(snapshot('gauge', 'ventas_shadow_mean_abs_diff', 'Diferencia absoluta media en sombra',
+                                  (), {(): shadow.abs_diff_total / shadow.compared if shadow.compared else 0.0}))
+    collected.append(snapshot('gauge', 'ventas_models_resident', 'Versiones del modelo residentes',
+                              (), {(): len(model_registry.models)}))
+    return collected
+
+metrics.add_collector(collect_runtime_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/models", response_model=Dict[str, Any])
+async def get_models():
+    """Versiones residentes, reparto de tráfico, sombra y latencia por versión"""
+    return model_registry.describe()
+
+@app.post("/admin/reload", response_model=Dict[str, Any])
+async def admin_reload(x_admin_token: Optional[str] = Header(None)):
+    """Recargar el modelo desde disco sin reiniciar (requiere ADMIN_TOKEN)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Recarga deshabilitada: defina ADMIN_TOKEN")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Token de administración inválido")
+    
+    try:
+        return await reload_model(MODEL_BUNDLE_PATH)
+    except Exception as e:
+        current = serving_model
+        raise HTTPException(
+            status_code=422,
+            detail=f"Nueva versión rechazada, se mantiene {current.version if current else 'ninguna'}: {e}"
+        )
+
+@app.get("/model-info", response_model=Dict[str, Any])
+async def get_model_info(x_model_version: Optional[str] = Header(None),
+                         if_none_match: Optional[str] = Header(None)):
+    """Obtener información detallada del modelo"""
+    current = resolve_model(x_model_version, split=False)
+    return current.static_responses.model_info.response(if_none_match)
+
+@app.get("/feature-importance", response_model=Dict[str, Any])
+async def get_feature_importance(x_model_version: Optional[str] = Header(None),
+                                 if_none_match: Optional[str] = Header(None)):
+    """Obtener importancia de características"""
+    # Sin modelo cargado se responden los valores por defecto
+    current = resolve_model(x_model_version, split=False) \
+        if x_model_version or serving_model is not None else None
+    return static_responses(current).feature_importance.response(if_none_match)
+
+# Ejemplo de entrada y salida (no depende del modelo)
+EXAMPLE_RESPONSE = PreEncoded({
+    "example_request": {
+        "tienda_id": 1,
+        "empleados": 20,
+        "publicidad": 5000,
+        "ubicacion": "urbana"
+    },
+    "example_response": {
+        "prediction": 45000.0,
+        "confidence": 0.57,
+        "model_info": {
+            "model_type": "LinearRegression",
+            "r2_score": 0.57,
+            "rmse": 10739.31
+        }
+    },
+    "valid_locations": ["rural", "suburbana", "urbana"],
+    "valid_ranges": {
+        "tienda_id": [1, 100],
+        "empleados": [1, 50],
+        "publicidad": [0, 20000]
     }
+})
 
 @app.get("/example", response_model=Dict[str, Any])
-async def get_example():
+async def get_example(if_none_match: Optional[str] = Header(None)):
     """Obtener ejemplo de datos de entrada"""
-    return {
-        "example_request": {
-            "tienda_id": 1,
-            "empleados": 20,
-            "publicidad": 5000,
-            "ubicacion": "urbana"
-        },
-        "example_response": {
-            "prediction": 45000.0,
-            "confidence": 0.57,
-            "model_info": {
-                "model_type": "LinearRegression",
-                "r2_score": 0.57,
-                "rmse": 10739.31
-            }
-        },
-        "valid_locations": ["rural", "suburbana", "urbana"],
-        "valid_ranges": {
-            "tienda_id": [1, 100],
-            "empleados": [1, 50],
-            "publicidad": [0, 20000]
-        }
-    }
+    return EXAMPLE_RESPONSE.response(if_none_match)
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,202 @@
+"""
+Bundle del modelo en un único archivo versionado - CRISP-DM
+Fase 6: Despliegue
+
+Reemplaza los cuatro pickles (model.pkl, scaler.pkl, label_encoders.pkl y
+model_info.pkl) por un archivo que se puede mapear en memoria sin importar
+pandas ni sklearn:
+
+    magic "VENTASMB" (8 bytes)
+    versión del formato (uint32, little-endian)
+    longitud de la cabecera JSON (uint32, little-endian)
+    cabecera JSON (UTF-8): métricas, columnas, clases de los encoders,
+                           disposición de los pesos y checksum
+    relleno con ceros hasta un múltiplo de 64 bytes
+    sección de pesos: float64 little-endian contiguos
+
+El checksum (SHA-256) cubre la cabecera canónica sin el propio checksum y
+la sección de pesos.
+"""
+
+import hashlib
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+BUNDLE_MAGIC = b"VENTASMB"
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_ALIGNMENT = 64
+DEFAULT_BUNDLE_PATH = 'models/model_bundle.bin'
+
+# Orden de los bloques dentro de la sección de pesos
+WEIGHT_SECTIONS = ('scaler_mean', 'scaler_scale', 'coef', 'intercept')
+
+class BundleError(Exception):
+    """El archivo no es un bundle válido o está corrupto"""
+
+def to_builtin(value):
+    """Convertir tipos de NumPy/pandas a tipos nativos serializables en JSON"""
+    if isinstance(value, dict):
+        return {str(k): to_builtin(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_builtin(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, 'to_dict'):
+        return to_builtin(value.to_dict('records'))
+    return value
+
+def _checksum(header: Dict[str, Any], weights: bytes) -> str:
+    canonical = json.dumps({k: v for k, v in header.items() if k != 'checksum'},
+                           sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(canonical + weights).hexdigest()
+
+def write_bundle(path: str, *, coef, intercept, scaler_mean, scaler_scale,
+                 feature_cols: List[str], target_col: str,
+                 encoders: Dict[str, List[str]], model_type: str = 'LinearRegression',
+                 metrics: Optional[Dict[str, Any]] = None,
+                 training_info: Optional[Dict[str, Any]] = None,
+                 feature_importance=None,
+                 clip_bounds: Optional[Dict[str, List[float]]] = None,
+                 extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Escribir el bundle de forma atómica y devolver su cabecera
+
+    clip_bounds ({columna: [inferior, superior]}) son los límites de capado de
+    outliers del entrenamiento; la API los aplica antes de predecir.
+    """
+    blocks = {
+        'scaler_mean': np.asarray(scaler_mean, dtype='<f8').ravel(),
+        'scaler_scale': np.asarray(scaler_scale, dtype='<f8').ravel(),
+        'coef': np.asarray(coef, dtype='<f8').ravel(),
+        'intercept': np.asarray(intercept, dtype='<f8').ravel()[:1],
+    }
+    layout, start = {}, 0
+    for name in WEIGHT_SECTIONS:
+        layout[name] = [start, len(blocks[name])]
+        start += len(blocks[name])
+    weights = np.concatenate([blocks[name] for name in WEIGHT_SECTIONS]).astype('<f8').tobytes()
+
+    header = {
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'model_type': model_type,
+        'feature_cols': list(feature_cols),
+        'target_col': target_col,
+        'encoders': {col: [str(c) for c in classes] for col, classes in encoders.items()},
+        'metrics': to_builtin(metrics or {}),
+        'training_info': to_builtin(training_info or {}),
+        'feature_importance': to_builtin(feature_importance) if feature_importance is not None else [],
+        'weights': {'dtype': '<f8', 'count': start, 'layout': layout},
+    }
+    if clip_bounds:
+        header['clip_bounds'] = {col: [float(lo), float(hi)] for col, (lo, hi) in clip_bounds.items()}
+    if extra:
+        header.update(to_builtin(extra))
+    header['checksum'] = {'algorithm': 'sha256', 'value': _checksum(header, weights)}
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    prefix_len = len(BUNDLE_MAGIC) + 8 + len(header_bytes)
+    padding = (-prefix_len) % BUNDLE_ALIGNMENT
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack('<II', BUNDLE_FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * padding)
+        f.write(weights)
+    os.replace(tmp_path, path)
+    return header
+
+def read_bundle(path: str, verify: bool = True) -> Dict[str, Any]:
+    """Leer la cabecera y mapear en memoria la sección de pesos
+
+    Devuelve la cabecera con una clave adicional 'arrays' que contiene vistas
+    (sin copia) de cada bloque de pesos.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(BUNDLE_MAGIC))
+        if magic != BUNDLE_MAGIC:
+            raise BundleError(f"{path} no es un bundle de modelo (magic {magic!r})")
+        version, header_len = struct.unpack('<II', f.read(8))
+        if version > BUNDLE_FORMAT_VERSION:
+            raise BundleError(f"Versión de bundle {version} no soportada (máx. {BUNDLE_FORMAT_VERSION})")
+        header = json.loads(f.read(header_len).decode('utf-8'))
+
+    prefix_len = len(BUNDLE_MAGIC) + 8 + header_len
+    offset = prefix_len + (-prefix_len) % BUNDLE_ALIGNMENT
+    count = header['weights']['count']
+    weights = np.memmap(path, dtype=header['weights']['dtype'], mode='r', offset=offset, shape=(count,))
+
+    if verify:
+        expected = header.get('checksum', {}).get('value')
+        if expected != _checksum(header, weights.tobytes()):
+            raise BundleError(f"Checksum inválido en {path}: el bundle está corrupto")
+
+    header['arrays'] = {
+        name: weights[start:start + length]
+        for name, (start, length) in header['weights']['layout'].items()
+    }
+    return header
+
+def model_info_from_bundle(header: Dict[str, Any]) -> Dict[str, Any]:
+    """Reconstruir el diccionario model_info que usa la API a partir de la cabecera"""
+    data_info = {
+        'feature_cols': header['feature_cols'],
+        'target_col': header.get('target_col', 'ventas')
+    }
+    if header.get('clip_bounds'):
+        data_info['clip_bounds'] = header['clip_bounds']
+    return {
+        'model_type': header.get('model_type', 'LinearRegression'),
+        'feature_importance': header.get('feature_importance', []),
+        'processed_data_info': data_info,
+        'metrics': header.get('metrics', {}),
+        'training_info': header.get('training_info', {}),
+        'bundle': {
+            'format_version': header.get('format_version'),
+            'checksum': header.get('checksum', {}).get('value')
+        }
+    }
+
+def bundle_from_artifacts(model, scaler, label_encoders, model_info) -> Dict[str, Any]:
+    """Argumentos de write_bundle a partir de los artefactos de sklearn"""
+    model_info = model_info if isinstance(model_info, dict) else {}
+    data_info = model_info.get('processed_data_info', {})
+    feature_cols = list(data_info.get('feature_cols', getattr(scaler, 'feature_names_in_', [])))
+    n_features = len(feature_cols)
+    mean = getattr(scaler, 'mean_', None)
+    scale = getattr(scaler, 'scale_', None)
+    return dict(
+        coef=model.coef_,
+        intercept=model.intercept_,
+        scaler_mean=np.zeros(n_features) if mean is None else mean,
+        scaler_scale=np.ones(n_features) if scale is None else scale,
+        feature_cols=feature_cols,
+        target_col=data_info.get('target_col', 'ventas'),
+        encoders={col: list(le.classes_) for col, le in (label_encoders or {}).items()},
+        model_type=model_info.get('model_type', type(model).__name__),
+        metrics=model_info.get('metrics'),
+        training_info=model_info.get('training_info'),
+        feature_importance=model_info.get('feature_importance'),
+        clip_bounds=data_info.get('clip_bounds'),
+    )
+
+if __name__ == "__main__":
+    # Convertir los pickles existentes en models/ a un bundle
+    import joblib
+
+    print("📦 Convirtiendo artefactos .pkl a bundle...")
+    args = bundle_from_artifacts(
+        joblib.load('models/model.pkl'),
+        joblib.load('models/scaler.pkl'),
+        joblib.load('models/label_encoders.pkl'),
+        joblib.load('models/model_info.pkl'),
+    )
+    header = write_bundle(DEFAULT_BUNDLE_PATH, **args)
+    print(f"✅ Bundle guardado en '{DEFAULT_BUNDLE_PATH}' "
+          f"({os.path.getsize(DEFAULT_BUNDLE_PATH):,} bytes, sha256 {header['checksum']['value'][:12]}...)")
@@ -0,0 +1,170 @@
+"""
+Caché de predicciones para /predict - CRISP-DM
+Fase 6: Despliegue
+
+Los clientes repiten las mismas combinaciones de entrada (por ejemplo, un panel
+que consulta todas las tiendas cada pocos segundos). La clave es la versión del
+modelo más los campos ya validados de PredictionRequest, de modo que una nueva
+versión nunca reutiliza predicciones de otra.
+
+    PredictionCache: LRU en el proceso con límite de tamaño y TTL
+    SharedPredictionCache: la LRU local delante de Redis, para que varios
+        workers de uvicorn compartan aciertos
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+CacheKey = Tuple[Any, ...]
+
+def make_key(version: str, values: Iterable[Any]) -> CacheKey:
+    """Clave normalizada: versión del modelo + valores validados en el orden de las columnas"""
+    return (version, *values)
+
+class PredictionCache:
+    """LRU con límite de entradas y tiempo de vida por entrada"""
+
+    def __init__(self, max_size: int = 10000, ttl_s: float = 300.0):
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl_s)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, float]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: CacheKey) -> Optional[float]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        prediction, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return prediction
+
+    def put(self, key: CacheKey, prediction: float):
+        self._entries[key] = (prediction, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def lookup(self, key: CacheKey) -> Optional[float]:
+        return self.get(key)
+
+    async def store(self, key: CacheKey, prediction: float):
+        self.put(key, prediction)
+
+    def retain_versions(self, versions: Iterable[str]):
+        """Descartar las entradas de versiones que ya no están en servicio"""
+        versions = set(versions)
+        stale = [key for key in self._entries if key[0] not in versions]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Aciertos, fallos, desalojos y ocupación"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+class SharedPredictionCache(PredictionCache):
+    """LRU local delante de Redis compartido entre workers
+
+    Un fallo de Redis nunca hace fallar la predicción: se cuenta y se trata
+    como un fallo de caché. El TTL se delega en Redis (SET ... EX) y la
+    invalidación por versión ocurre porque la versión forma parte de la clave.
+    """
+
+    def __init__(self, client, max_size: int = 10000, ttl_s: float = 300.0,
+                 prefix: str = "ventas:pred"):
+        super().__init__(max_size=max_size, ttl_s=ttl_s)
+        self.client = client
+        self.prefix = prefix
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def _redis_key(self, key: CacheKey) -> str:
+        return f"{self.prefix}:" + "|".join(repr(value) for value in key)
+
+    async def lookup(self, key: CacheKey) -> Optional[float]:
+        prediction = self.get(key)
+        if prediction is not None:
+            return prediction
+        try:
+            value = await self.client.get(self._redis_key(key))
+        except Exception:
+            self.shared_errors += 1
+            return None
+        if value is None:
+            return None
+        # Acierto compartido: cuenta como acierto y se copia a la LRU local
+        prediction = float(value)
+        self.misses -= 1
+        self.hits += 1
+        self.shared_hits += 1
+        self.put(key, prediction)
+        return prediction
+
+    async def store(self, key: CacheKey, prediction: float):
+        self.put(key, prediction)
+        try:
+            await self.client.set(self._redis_key(key), repr(prediction), ex=max(1, int(self.ttl)))
+        except Exception:
+            self.shared_errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "backend": "memory+redis",
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors
+        }
+
+def create_cache_from_env() -> Optional[PredictionCache]:
+    """Configurar la caché con variables de entorno
+
+    PREDICT_CACHE_SIZE: entradas máximas en cada proceso (0 = deshabilitada)
+    PREDICT_CACHE_TTL_S: segundos de vida de cada predicción
+    PREDICT_CACHE_REDIS_URL: Redis compartido entre workers (opcional, requiere redis)
+    """
+    max_size = int(os.environ.get("PREDICT_CACHE_SIZE", 0))
+    if max_size <= 0:
+        return None
+    ttl_s = float(os.environ.get("PREDICT_CACHE_TTL_S", 300))
+
+    redis_url = os.environ.get("PREDICT_CACHE_REDIS_URL")
+    if redis_url:
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            print("⚠️ PREDICT_CACHE_REDIS_URL definido pero el paquete redis no está instalado; "
+                  "se usa solo la caché local")
+        else:
+            return SharedPredictionCache(aioredis.from_url(redis_url), max_size=max_size, ttl_s=ttl_s)
+    return PredictionCache(max_size=max_size, ttl_s=ttl_s)
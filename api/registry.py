@@ -0,0 +1,210 @@
+"""
+Registro de versiones del modelo en servicio - CRISP-DM
+Fase 6: Despliegue
+
+Mantiene varias versiones residentes a la vez y decide con cuál se puntúa cada
+petición: la indicada en la cabecera X-Model-Version, un reparto de tráfico
+ponderado o la versión principal. Una versión candidata puede puntuarse en
+sombra sobre el tráfico real, fuera del camino de la respuesta, para comparar
+sus predicciones con las de la versión servida.
+"""
+
+import os
+import random
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from serving import ServingModel, share_preprocessing
+
+# Muestras recientes de latencia que se conservan por versión
+LATENCY_WINDOW = 10000
+
+def parse_traffic_split(spec: Optional[str]) -> Dict[str, float]:
+    """Interpretar 'version:peso,version:peso' (el resto del tráfico va a la principal)"""
+    split = {}
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        version, sep, weight = item.rpartition(':')
+        if not sep or not version:
+            raise ValueError(f"Entrada de reparto inválida '{item}', formato esperado version:peso")
+        split[version.strip()] = float(weight)
+    if any(weight < 0 for weight in split.values()) or sum(split.values()) > 1.0 + 1e-9:
+        raise ValueError(f"Los pesos del reparto deben ser positivos y sumar como máximo 1: {split}")
+    return split
+
+class LatencyStats:
+    """Peticiones, filas y latencia recientes de una versión"""
+
+    def __init__(self):
+        self.requests = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, seconds: float, rows: int = 1):
+        self.requests += 1
+        self.rows += rows
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._recent.append(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        recent = np.array(self._recent) * 1000.0 if self._recent else np.zeros(1)
+        return {
+            "requests": self.requests,
+            "rows": self.rows,
+            "latency_ms": {
+                "mean": self.total * 1000.0 / self.requests if self.requests else 0.0,
+                "p50": float(np.percentile(recent, 50)),
+                "p99": float(np.percentile(recent, 99)),
+                "max": self.max * 1000.0
+            }
+        }
+
+class ShadowStats(LatencyStats):
+    """Latencia de la versión en sombra y diferencias con la versión servida"""
+
+    def __init__(self):
+        super().__init__()
+        self.compared = 0
+        self.abs_diff_total = 0.0
+        self.abs_diff_max = 0.0
+        self.failures = 0
+
+    def compare(self, shadow: List[float], served: List[float], seconds: float):
+        self.record(seconds, len(served))
+        if not served:
+            return
+        diff = np.abs(np.asarray(shadow, dtype=np.float64) - np.asarray(served, dtype=np.float64))
+        self.compared += len(diff)
+        self.abs_diff_total += float(diff.sum())
+        self.abs_diff_max = max(self.abs_diff_max, float(diff.max()))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            **super().summary(),
+            "compared_rows": self.compared,
+            "mean_abs_diff": self.abs_diff_total / self.compared if self.compared else 0.0,
+            "max_abs_diff": self.abs_diff_max,
+            "failures": self.failures
+        }
+
+class ModelRegistry:
+    """Versiones residentes, enrutado por cabecera o reparto y puntuación en sombra
+
+    Las versiones con la misma huella de preprocesado comparten encoders y
+    scaler. La tabla de versiones se reemplaza completa en cada cambio, de modo
+    que una petición nunca ve un registro a medio actualizar.
+    """
+
+    def __init__(self, traffic_split: Optional[Dict[str, float]] = None,
+                 shadow_version: Optional[str] = None):
+        self.models: Dict[str, ServingModel] = {}
+        self.primary: Optional[str] = None
+        self.pinned = set()
+        self.traffic_split = dict(traffic_split or {})
+        self.shadow_version = shadow_version or None
+        self.latency: Dict[str, LatencyStats] = {}
+        self.shadow_stats = ShadowStats()
+
+    def add(self, model: ServingModel, primary: bool = False, pinned: bool = False) -> ServingModel:
+        """Registrar una versión (reutilizando el preprocesado de otra idéntica)"""
+        for resident in self.models.values():
+            if resident.version != model.version and resident.preprocessing_key == model.preprocessing_key:
+                model = share_preprocessing(model, resident)
+                break
+
+        models = dict(self.models)
+        models[model.version] = model
+        if pinned:
+            self.pinned.add(model.version)
+        if primary:
+            self.primary = model.version
+        self.latency.setdefault(model.version, LatencyStats())
+        self.models = self._prune(models)
+        # La latencia de las versiones retiradas se descarta con ellas
+        self.latency = {version: stats for version, stats in self.latency.items() if version in self.models}
+        return model
+
+    def _prune(self, models: Dict[str, ServingModel]) -> Dict[str, ServingModel]:
+        """Retirar las versiones que ya no son principal, fijadas, de reparto ni sombra"""
+        keep = {self.primary, self.shadow_version, *self.pinned, *self.traffic_split}
+        return {version: model for version, model in models.items() if version in keep}
+
+    @property
+    def primary_model(self) -> Optional[ServingModel]:
+        return self.models.get(self.primary)
+
+    def route(self, requested: Optional[str] = None) -> Optional[ServingModel]:
+        """Elegir la versión de una petición; KeyError si la pedida no está residente"""
+        models = self.models
+        if requested:
+            if requested not in models:
+                raise KeyError(requested)
+            return models[requested]
+
+        if self.traffic_split:
+            draw, cumulative = random.random(), 0.0
+            for version, weight in self.traffic_split.items():
+                cumulative += weight
+                if draw < cumulative:
+                    if version in models:
+                        return models[version]
+                    break
+        return models.get(self.primary)
+
+    def shadow_for(self, served: ServingModel) -> Optional[ServingModel]:
+        """Versión en sombra para una petición servida por otra versión"""
+        shadow = self.models.get(self.shadow_version) if self.shadow_version else None
+        return shadow if shadow is not None and shadow is not served else None
+
+    def record_latency(self, version: str, seconds: float, rows: int = 1):
+        stats = self.latency.get(version)
+        if stats is not None:
+            stats.record(seconds, rows)
+
+    def describe(self) -> Dict[str, Any]:
+        """Versiones residentes, reparto, sombra y latencia por versión"""
+        models = self.models
+        groups: Dict[str, List[str]] = {}
+        for version, model in models.items():
+            groups.setdefault(model.preprocessing_key or version, []).append(version)
+        return {
+            "primary": self.primary,
+            "traffic_split": self.traffic_split,
+            "shadow": {
+                "version": self.shadow_version,
+                "resident": self.shadow_version in models,
+                **self.shadow_stats.summary()
+            },
+            "versions": {
+                version: {
+                    "model_type": model.model_type,
+                    "source": model.source,
+                    "loaded_at": model.loaded_at,
+                    "pinned": version in self.pinned,
+                    "fused_kernel": model.kernel is not None,
+                    "shares_preprocessing_with": [
+                        other for other in groups[model.preprocessing_key or version] if other != version
+                    ],
+                    **self.latency[version].summary()
+                }
+                for version, model in models.items()
+            }
+        }
+
+def create_registry_from_env() -> ModelRegistry:
+    """Configurar el registro con variables de entorno
+
+    MODEL_TRAFFIC_SPLIT: 'version:peso,...' (el resto va a la versión principal)
+    MODEL_SHADOW_VERSION: versión que se puntúa en sombra sobre el tráfico real
+    """
+    return ModelRegistry(
+        traffic_split=parse_traffic_split(os.environ.get("MODEL_TRAFFIC_SPLIT")),
+        shadow_version=os.environ.get("MODEL_SHADOW_VERSION", "").strip() or None
+    )
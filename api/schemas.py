@@ -0,0 +1,48 @@
+"""
+Esquema de entrada de una predicción y sus reglas de validación - CRISP-DM
+Fase 6: Despliegue
+
+PredictionRequest es la fuente única de tipos, límites y patrones de cada
+campo. FIELD_CONSTRAINTS los extrae una vez para las rutas que validan sin
+Pydantic (lotes, streaming, columnar y la puntuación fuera de línea), que así
+importan solo este módulo y no la aplicación FastAPI.
+"""
+
+import re
+from typing import Any, Dict
+
+from pydantic import BaseModel, ConfigDict, Field
+
+class PredictionRequest(BaseModel):
+    """Esquema para las solicitudes de predicción individual"""
+    tienda_id: int = Field(..., description="ID de la tienda", ge=1, le=100)
+    empleados: float = Field(..., description="Número de empleados", ge=1, le=50)
+    publicidad: float = Field(..., description="Gasto en publicidad", ge=0, le=20000)
+    ubicacion: str = Field(..., description="Tipo de ubicación", pattern="^(rural|suburbana|urbana)$")
+
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "tienda_id": 1,
+            "empleados": 20,
+            "publicidad": 5000,
+            "ubicacion": "urbana"
+        }
+    })
+
+def _field_constraints() -> Dict[str, Dict[str, Any]]:
+    """Extraer tipos, límites y patrones declarados en PredictionRequest"""
+    constraints = {}
+    for name, field in PredictionRequest.model_fields.items():
+        info = {'integer': field.annotation is int}
+        for meta in field.metadata:
+            if getattr(meta, 'ge', None) is not None:
+                info['ge'] = meta.ge
+            if getattr(meta, 'le', None) is not None:
+                info['le'] = meta.le
+            if getattr(meta, 'pattern', None):
+                info['pattern'] = re.compile(meta.pattern)
+        constraints[name] = info
+    return constraints
+
+# Las mismas reglas de validación que aplica Pydantic en /predict
+FIELD_CONSTRAINTS = _field_constraints()
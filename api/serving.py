@@ -0,0 +1,293 @@
+"""
+Modelo en servicio como un único objeto inmutable - CRISP-DM
+Fase 6: Despliegue
+
+Todo lo necesario para predecir (artefactos, kernel, encoders, scorer de lotes
+y metadatos) vive en un ServingModel. La API guarda una sola referencia al
+modelo activo y la reemplaza de forma atómica al recargar: cada petición toma
+la referencia al empezar y termina con esa versión aunque se publique otra.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from fast_path import ResponseTemplate
+from inference import (
+    BatchScorer, FusedLinearModel, SklearnMatrixPredictor,
+    reference_samples, verify_equivalence
+)
+from model_bundle import DEFAULT_BUNDLE_PATH, model_info_from_bundle, read_bundle
+from static_responses import StaticResponses
+
+DEFAULT_FEATURE_COLS = ['tienda_id', 'empleados', 'publicidad', 'ubicacion']
+LEGACY_ARTIFACTS = ('model.pkl', 'scaler.pkl', 'label_encoders.pkl', 'model_info.pkl')
+
+# Bundle único del modelo (si no existe se usan los pickles)
+MODEL_BUNDLE_PATH = os.environ.get("MODEL_BUNDLE_PATH", DEFAULT_BUNDLE_PATH)
+
+class ServingModel:
+    """Modelo, preprocesadores y metadatos de una versión en servicio (inmutable)"""
+
+    def __init__(self, *, model, scaler, label_encoders, model_info: Dict[str, Any],
+                 feature_cols: List[str], kernel: Optional[FusedLinearModel],
+                 constraints: Dict[str, Dict[str, Any]], version: str, source: str,
+                 preprocessing_key: Optional[str] = None):
+        self.model = model
+        self.scaler = scaler
+        self.label_encoders = label_encoders
+        self.model_info = model_info
+        self.feature_cols = list(feature_cols)
+        self.kernel = kernel
+        self.version = version
+        self.source = source
+        self.preprocessing_key = preprocessing_key
+        self.loaded_at = time.time()
+        # Límites de capado de outliers del entrenamiento (None en modelos anteriores)
+        data_info = model_info.get('processed_data_info', {}) if isinstance(model_info, dict) else {}
+        self.clip_bounds = data_info.get('clip_bounds')
+
+        if kernel is not None:
+            self.encoders = kernel.encoders
+            self.predict_matrix = kernel.predict_matrix
+        else:
+            self.encoders = {
+                col: {str(cls): code for code, cls in enumerate(le.classes_)}
+                for col, le in (label_encoders or {}).items()
+            }
+            self.predict_matrix = SklearnMatrixPredictor(model, scaler, feature_cols, self.clip_bounds)
+        self.scorer = BatchScorer(self.feature_cols, self.encoders, constraints, self.predict_matrix)
+
+        # Metadatos que /predict devuelve en cada respuesta, resueltos una sola vez
+        metrics = model_info.get('metrics', {}) if isinstance(model_info, dict) else {}
+        self.model_type = model_info.get('model_type', type(model).__name__) \
+            if isinstance(model_info, dict) else type(model).__name__
+        self.r2_score = metrics.get('r2_test', 0.57)
+        self.rmse = metrics.get('rmse_test', 10739.31)
+        self.response_template = ResponseTemplate(self.r2_score, {
+            "model_type": self.model_type,
+            "model_version": version,
+            "r2_score": float(self.r2_score),
+            "rmse": float(self.rmse)
+        })
+        # /, /health, /model-info y /feature-importance serializados una sola vez
+        self.static_responses = StaticResponses(self)
+
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError("ServingModel es inmutable; cargue una nueva versión")
+        super().__setattr__(name, value)
+
+    def preprocess_input(self, data: Dict[str, Any]) -> np.ndarray:
+        """Preprocesar una fila con pandas/sklearn (ruta de referencia)"""
+        if self.scaler is None:
+            # Los modelos cargados del bundle no tienen scaler ni encoders de sklearn
+            raise ValueError(f"La ruta de referencia requiere los artefactos .pkl "
+                             f"(el modelo '{self.version}' se cargó desde {self.source})")
+        import pandas as pd
+
+        df = pd.DataFrame([data])
+        for col, le in (self.label_encoders or {}).items():
+            if col in df.columns:
+                df[col] = le.transform(df[col])
+        for col, (lower, upper) in (self.clip_bounds or {}).items():
+            if col in df.columns:
+                df[col] = df[col].clip(lower, upper)
+        return self.scaler.transform(df[self.feature_cols])
+
+    def reference_predict(self, data: Dict[str, Any]) -> float:
+        """Predicción de referencia con pandas/sklearn (usada para verificar el kernel)"""
+        X = self.preprocess_input(data)
+        if not hasattr(self.model, 'predict'):
+            # Modelo del bundle con el scaler compartido de otra versión
+            raise ValueError(f"La ruta de referencia requiere los artefactos .pkl "
+                             f"(el modelo '{self.version}' se cargó desde {self.source})")
+        return float(self.model.predict(X)[0])
+
+    def smoke_test(self, constraints: Dict[str, Dict[str, Any]]):
+        """Predicción de humo sobre casos conocidos; lanza ValueError si falla"""
+        samples = [
+            {col: (next(iter(self.encoders[col])) if col in self.encoders
+                   else constraints.get(col, {}).get('ge', 0))
+             for col in self.feature_cols}
+        ]
+        if self.kernel is not None:
+            samples = reference_samples(self.kernel, constraints)
+        predictions, valid_idx, errors = self.scorer(samples)
+        if errors or len(predictions) != len(samples):
+            raise ValueError(f"La predicción de humo falló: {errors}")
+        if not np.all(np.isfinite(predictions)):
+            raise ValueError(f"La predicción de humo devolvió valores no finitos: {predictions}")
+
+def preprocessing_fingerprint(feature_cols: List[str], encoders: Dict[str, Dict[str, int]],
+                              mean, scale) -> str:
+    """Huella de columnas, encoders y parámetros del scaler (iguales = preprocesado compartible)"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(feature_cols), encoders], sort_keys=True).encode('utf-8'))
+    for values in (mean, scale):
+        if values is not None:
+            digest.update(np.asarray(values, dtype='<f8').tobytes())
+    return digest.hexdigest()[:16]
+
+def share_preprocessing(model: ServingModel, donor: ServingModel) -> ServingModel:
+    """Reconstruir model reutilizando los encoders y el scaler de donor
+    
+    Solo se aplica si ambas versiones tienen la misma huella de preprocesado;
+    así las versiones residentes no duplican diccionarios ni objetos de sklearn.
+    """
+    if model.preprocessing_key is None or model.preprocessing_key != donor.preprocessing_key:
+        return model
+
+    kernel = model.kernel
+    if kernel is not None:
+        kernel = FusedLinearModel(kernel.weights, kernel.bias, donor.feature_cols, donor.encoders,
+                                  kernel.clip_bounds)
+    estimator = kernel if model.model is model.kernel else model.model
+    return ServingModel(
+        model=estimator,
+        scaler=donor.scaler if donor.scaler is not None else model.scaler,
+        label_encoders=donor.label_encoders if donor.label_encoders is not None else model.label_encoders,
+        model_info=model.model_info,
+        feature_cols=donor.feature_cols,
+        kernel=kernel,
+        constraints=model.scorer.constraints,
+        version=model.version,
+        source=model.source,
+        preprocessing_key=model.preprocessing_key
+    )
+
+def _file_digest(paths: List[str]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+def load_bundle_model(path: str, constraints: Dict[str, Dict[str, Any]]) -> ServingModel:
+    """Mapear el bundle: sin pickles, sin pandas y sin sklearn"""
+    bundle = read_bundle(path)
+    kernel = FusedLinearModel.from_bundle(bundle)
+    arrays = bundle['arrays']
+    return ServingModel(
+        model=kernel,
+        scaler=None,
+        label_encoders=None,
+        model_info=model_info_from_bundle(bundle),
+        feature_cols=kernel.feature_cols,
+        kernel=kernel,
+        constraints=constraints,
+        version=bundle['checksum']['value'][:12],
+        source=path,
+        preprocessing_key=preprocessing_fingerprint(
+            kernel.feature_cols, kernel.encoders, arrays['scaler_mean'], arrays['scaler_scale']
+        )
+    )
+
+def load_pickle_model(models_dir: str, constraints: Dict[str, Dict[str, Any]]) -> ServingModel:
+    """Cargar los cuatro archivos .pkl y compilar el kernel plegado si es posible"""
+    import joblib
+
+    # Cargar modelo
+    model = joblib.load(os.path.join(models_dir, 'model.pkl'))
+    print("✅ Modelo cargado exitosamente")
+
+    # Cargar preprocesadores
+    scaler = joblib.load(os.path.join(models_dir, 'scaler.pkl'))
+    print("✅ Scaler cargado exitosamente")
+
+    label_encoders = joblib.load(os.path.join(models_dir, 'label_encoders.pkl'))
+    print("✅ Label encoders cargados exitosamente")
+
+    # Cargar información del modelo
+    model_info = joblib.load(os.path.join(models_dir, 'model_info.pkl'))
+    print("✅ Model info cargado exitosamente")
+
+    # Verificar estructura de model_info
+    if isinstance(model_info, dict):
+        if 'processed_data_info' in model_info and 'feature_cols' in model_info['processed_data_info']:
+            feature_cols = model_info['processed_data_info']['feature_cols']
+            print(f"✅ Feature cols cargadas: {feature_cols}")
+        else:
+            # Valores por defecto si no están disponibles
+            feature_cols = DEFAULT_FEATURE_COLS
+            print("⚠️ Usando feature cols por defecto")
+    else:
+        # Si model_info no es un diccionario, usar valores por defecto
+        feature_cols = DEFAULT_FEATURE_COLS
+        model_info = {}
+        print("⚠️ Model info no es un diccionario, usando valores por defecto")
+
+    version = "pkl-" + _file_digest([os.path.join(models_dir, name) for name in LEGACY_ARTIFACTS])
+    serving = ServingModel(
+        model=model, scaler=scaler, label_encoders=label_encoders, model_info=model_info,
+        feature_cols=feature_cols, kernel=None, constraints=constraints,
+        version=version, source=models_dir
+    )
+    preprocessing_key = preprocessing_fingerprint(
+        feature_cols, serving.encoders, getattr(scaler, 'mean_', None), getattr(scaler, 'scale_', None)
+    )
+
+    # Plegar scaler + modelo en un kernel sin pandas ni sklearn
+    kernel = compile_fused_model(serving, constraints)
+    return ServingModel(
+        model=model, scaler=scaler, label_encoders=label_encoders, model_info=model_info,
+        feature_cols=feature_cols, kernel=kernel, constraints=constraints,
+        version=version, source=models_dir, preprocessing_key=preprocessing_key
+    )
+
+def compile_fused_model(serving: ServingModel, constraints: Dict[str, Dict[str, Any]]):
+    """Compilar y verificar el kernel plegado; None si no es aplicable"""
+    try:
+        kernel = FusedLinearModel.from_artifacts(
+            serving.model, serving.scaler, serving.label_encoders, serving.feature_cols,
+            serving.clip_bounds
+        )
+    except Exception as e:
+        print(f"⚠️ Kernel plegado no disponible, se usará sklearn: {e}")
+        return None
+
+    mismatch = verify_equivalence(kernel, serving.reference_predict, reference_samples(kernel, constraints))
+    if mismatch:
+        print(f"⚠️ El kernel plegado no coincide con sklearn ({mismatch}), se usará sklearn")
+        return None
+
+    print("✅ Kernel de inferencia plegado compilado")
+    return kernel
+
+def load_serving_model(bundle_path: Optional[str], constraints: Dict[str, Dict[str, Any]],
+                       models_dir: str = 'models', strict: bool = False) -> ServingModel:
+    """Cargar el bundle si existe; si no (o si está corrupto), los archivos .pkl
+
+    Con strict=True un bundle corrupto es un error en lugar de recurrir a los
+    .pkl, que podrían ser de una versión anterior (se usa al recargar).
+    """
+    if bundle_path and os.path.exists(bundle_path):
+        try:
+            serving = load_bundle_model(bundle_path, constraints)
+            print(f"✅ Bundle del modelo cargado desde '{bundle_path}'")
+            return serving
+        except Exception as e:
+            if strict:
+                raise
+            print(f"⚠️ No se pudo cargar el bundle ({e}), se usarán los archivos .pkl")
+
+    return load_pickle_model(models_dir, constraints)
+
+def artifact_signature(bundle_path: Optional[str], models_dir: str = 'models'):
+    """Firma (ruta, mtime, tamaño) de los artefactos para detectar cambios en disco"""
+    paths = [bundle_path] if bundle_path and os.path.exists(bundle_path) else \
+        [os.path.join(models_dir, name) for name in LEGACY_ARTIFACTS]
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
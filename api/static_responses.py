@@ -0,0 +1,150 @@
+"""
+Respuestas estáticas precodificadas por versión del modelo - CRISP-DM
+Fase 6: Despliegue
+
+/, /health, /model-info y /feature-importance solo dependen de la versión en
+servicio. Sus cuerpos JSON se construyen y serializan una vez al cargar la
+versión y se sirven tal cual, con un ETag para que los sondeos repetidos con
+If-None-Match reciban un 304 sin cuerpo.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from starlette.responses import Response
+
+from model_bundle import to_builtin
+
+API_VERSION = "1.0.0"
+DEFAULT_FEATURES = ['tienda_id', 'empleados', 'publicidad', 'ubicacion']
+
+# Valores que se publican si el modelo no trae los suyos
+DEFAULT_METRICS = {
+    "r2_train": 0.5893,
+    "r2_test": 0.5732,
+    "mae_train": 8516.5747,
+    "mae_test": 8532.4092,
+    "rmse_train": 10721.5931,
+    "rmse_test": 10739.3127
+}
+DEFAULT_TRAINING_INFO = {
+    "cv_scores": [0.58555319, 0.5819458, 0.61389409, 0.56689647, 0.59305461],
+    "cv_mean": 0.5883,
+    "cv_std": 0.0308
+}
+DEFAULT_FEATURE_IMPORTANCE = [
+    {"feature": "empleados", "coefficient": 11583.705021},
+    {"feature": "ubicacion", "coefficient": 5364.847664},
+    {"feature": "publicidad", "coefficient": 1482.179605},
+    {"feature": "tienda_id", "coefficient": 89.109364}
+]
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+class PreEncoded:
+    """Cuerpo JSON serializado una sola vez y su ETag"""
+
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, payload: Any):
+        # Mismo formato que JSONResponse de Starlette
+        self.body = json.dumps(
+            to_builtin(payload), ensure_ascii=False, allow_nan=False, separators=(',', ':')
+        ).encode('utf-8')
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+    def response(self, if_none_match: Optional[str] = None) -> Response:
+        if _etag_matches(if_none_match, self.etag):
+            return Response(status_code=304, headers={"ETag": self.etag})
+        return Response(self.body, media_type="application/json", headers={"ETag": self.etag})
+
+def root_payload(model) -> Dict[str, Any]:
+    return {
+        "message": "API de Predicción de Ventas Mensuales por Tienda",
+        "version": API_VERSION,
+        "model_type": model.model_type if model else "No disponible",
+        "features": len(model.feature_cols) if model else 0,
+        "methodology": "CRISP-DM",
+        "algorithm": "Regresión Lineal",
+        "docs": "/docs",
+        "health": "/health",
+        "example": "/example"
+    }
+
+def health_payload(model) -> Dict[str, Any]:
+    return {
+        "status": "healthy" if model is not None else "unhealthy",
+        "model_loaded": model is not None,
+        "model_type": model.model_type if model else "No disponible",
+        "version": API_VERSION,
+        "model_version": model.version if model else None
+    }
+
+def model_info_payload(model) -> Dict[str, Any]:
+    model_info = model.model_info
+    feature_cols = model.feature_cols
+    response = {
+        "model_type": model.model_type,
+        "model_version": model.version,
+        "features": feature_cols or DEFAULT_FEATURES,
+        "metrics": DEFAULT_METRICS,
+        "training_info": DEFAULT_TRAINING_INFO,
+        "data_info": {
+            "train_size": 8000,
+            "test_size": 2000,
+            "feature_cols": feature_cols or DEFAULT_FEATURES,
+            "target_col": "ventas"
+        }
+    }
+
+    # Datos reales del modelo si están disponibles
+    if isinstance(model_info, dict):
+        if 'model_type' in model_info:
+            response["model_type"] = model_info['model_type']
+        if 'metrics' in model_info:
+            response["metrics"] = model_info['metrics']
+        if 'training_info' in model_info:
+            response["training_info"] = model_info['training_info']
+        if 'processed_data_info' in model_info:
+            response["data_info"] = model_info['processed_data_info']
+    return response
+
+def feature_importance_payload(model) -> Dict[str, Any]:
+    model_type = model.model_type if model else "LinearRegression"
+    importance = DEFAULT_FEATURE_IMPORTANCE
+    model_info = model.model_info if model else None
+
+    if isinstance(model_info, dict):
+        if 'model_type' in model_info:
+            model_type = model_info['model_type']
+        value = model_info.get('feature_importance')
+        try:
+            if hasattr(value, 'to_dict'):
+                importance = value.to_dict('records')
+            elif isinstance(value, list):
+                importance = value
+        except Exception:
+            pass  # Usar valores por defecto si hay error
+    return {"feature_importance": importance, "model_type": model_type}
+
+class StaticResponses:
+    """Respuestas de metadatos de una versión (o de la API sin modelo)"""
+
+    __slots__ = ('root', 'health', 'model_info', 'feature_importance')
+
+    def __init__(self, model=None):
+        self.root = PreEncoded(root_payload(model))
+        self.health = PreEncoded(health_payload(model))
+        self.model_info = PreEncoded(model_info_payload(model)) if model is not None else None
+        self.feature_importance = PreEncoded(feature_importance_payload(model))
+
+# Respuestas mientras no hay un modelo cargado
+NO_MODEL_RESPONSES = StaticResponses(None)
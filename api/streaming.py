@@ -0,0 +1,150 @@
+"""
+Puntuación en streaming de cargas NDJSON o CSV - CRISP-DM
+Fase 6: Despliegue
+
+Lee el cuerpo de la petición por trozos, puntúa cada bloque de filas en cuanto
+está completo y devuelve sus predicciones antes de leer el siguiente, de modo
+que la memoria queda acotada por el tamaño del bloque y no por el de la carga.
+
+Formato de salida (el mismo que el de entrada):
+    NDJSON: {"index": 0, "prediction": 45123.4} o {"index": 1, "error": "..."}
+    CSV:    index,prediction,error
+"""
+
+import csv
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+STREAM_FORMATS = ('ndjson', 'csv')
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def detect_format(content_type: Optional[str]) -> str:
+    """Formato de la carga según Content-Type (por defecto NDJSON)"""
+    content_type = (content_type or '').lower()
+    return 'csv' if 'csv' in content_type else 'ndjson'
+
+async def iter_line_blocks(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[bytes]]:
+    """Cortar los trozos del cuerpo en líneas completas (una lista por trozo)"""
+    tail = b''
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        if lines:
+            yield lines
+    if tail.strip():
+        yield [tail]
+
+def _parse_ndjson(lines: List[bytes], records: List[Any], parse_errors: Dict[int, str]):
+    # Una llamada al parser por línea: cada registro queda ligado a su línea
+    # (un arreglo con todo el bloque podría cuadrar en número con líneas mal formadas)
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = _loads(line)
+        except ValueError as e:
+            record = None
+            parse_errors[len(records)] = f"JSON inválido: {e}"
+        else:
+            if not isinstance(record, dict):
+                parse_errors[len(records)] = "Cada línea debe ser un objeto JSON"
+                record = None
+        records.append(record)
+
+def _parse_csv(lines: List[bytes], header: List[str], records: List[Any], parse_errors: Dict[int, str]):
+    rows = csv.reader(line.decode('utf-8').rstrip('\r') for line in lines if line.strip())
+    for row in rows:
+        if len(row) != len(header):
+            parse_errors[len(records)] = f"Se esperaban {len(header)} columnas y hay {len(row)}"
+            records.append(None)
+            continue
+        records.append(dict(zip(header, row)))
+
+async def iter_record_blocks(chunks: AsyncIterator[bytes], fmt: str,
+                             block_rows: int) -> AsyncIterator[Tuple[List[Any], Dict[int, str]]]:
+    """Agrupar las filas de la carga en bloques de como mucho block_rows registros
+
+    Devuelve (registros, errores de formato por posición en el bloque); las
+    líneas ilegibles quedan como None para conservar la numeración.
+    """
+    header = None
+    records: List[Any] = []
+    parse_errors: Dict[int, str] = {}
+
+    async for lines in iter_line_blocks(chunks):
+        if fmt == 'csv' and header is None:
+            while lines and not lines[0].strip():
+                lines.pop(0)
+            if not lines:
+                continue
+            header = next(csv.reader([lines.pop(0).decode('utf-8-sig').rstrip('\r')]))
+            header = [name.strip() for name in header]
+
+        for start in range(0, len(lines), block_rows):
+            part = lines[start:start + block_rows]
+            if fmt == 'csv':
+                _parse_csv(part, header, records, parse_errors)
+            else:
+                _parse_ndjson(part, records, parse_errors)
+            if len(records) >= block_rows:
+                yield records, parse_errors
+                records, parse_errors = [], {}
+
+    if records:
+        yield records, parse_errors
+
+def format_block(fmt: str, offset: int, size: int, predictions: List[float],
+                 valid_idx: List[int], errors: List[Dict[str, Any]],
+                 parse_errors: Dict[int, str]) -> bytes:
+    """Serializar las predicciones y errores de un bloque en el orden de entrada"""
+    lines: List[str] = [''] * size
+    if fmt == 'csv':
+        for i, prediction in zip(valid_idx, predictions):
+            lines[i] = f"{offset + i},{prediction!r},\n"
+        for error in errors:
+            i = error["index"]
+            message = parse_errors.get(i, error["error"]).replace('"', '""')
+            lines[i] = f'{offset + i},,"{message}"\n'
+    else:
+        for i, prediction in zip(valid_idx, predictions):
+            lines[i] = f'{{"index": {offset + i}, "prediction": {prediction!r}}}\n'
+        for error in errors:
+            i = error["index"]
+            lines[i] = json.dumps(
+                {"index": offset + i, "error": parse_errors.get(i, error["error"])}, ensure_ascii=False
+            ) + "\n"
+    return ''.join(lines).encode('utf-8')
+
+async def stream_predictions(chunks: AsyncIterator[bytes], fmt: str, block_rows: int,
+                             score: Callable[[List[Any]], Awaitable]) -> AsyncIterator[bytes]:
+    """Puntuar la carga bloque a bloque y producir la salida de cada uno"""
+    if fmt == 'csv':
+        yield b"index,prediction,error\n"
+
+    offset = 0
+    async for records, parse_errors in iter_record_blocks(chunks, fmt, block_rows):
+        predictions, valid_idx, errors = await score(records)
+        yield format_block(fmt, offset, len(records), predictions, valid_idx, errors, parse_errors)
+        offset += len(records)
+
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse que puede seguir leyendo el cuerpo de la petición
+
+    StreamingResponse escucha la desconexión del cliente consumiendo los
+    mensajes de receive, lo que descartaría los trozos de la carga que aún no
+    se han leído. Aquí la desconexión se detecta al leer el propio cuerpo.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
@@ -0,0 +1,709 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de rendimiento de la API de predicción
+Compara las rutas de inferencia y reporta filas por segundo
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from starlette.responses import JSONResponse
+
+warnings.filterwarnings('ignore')
+
+# Agregar el directorio api al path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'api'))
+
+from api import main as api
+import fast_path
+import instrumentation
+import static_responses
+from coalescer import PredictionCoalescer
+from columnar import COLUMNAR_MEDIA_TYPE, encode_columnar
+from executors import PredictionExecutor
+from fast_path import decode_request
+from inference import SklearnMatrixPredictor, encode_batch, encode_record
+from model_bundle import to_builtin
+from prediction_cache import PredictionCache
+from serving import ServingModel
+
+# Módulos que no deben importarse en la ruta de servicio con el bundle
+HEAVY_MODULES = ('pandas', 'sklearn', 'joblib', 'matplotlib', 'seaborn', 'scipy')
+
+# Presupuesto de arranque en frío (ms) para la prueba de regresión
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 3000))
+
+# p99 máximo (ms) de /health con lotes en un pool, y cuánto menor debe ser que en línea
+HEALTH_P99_BUDGET_MS = float(os.environ.get("HEALTH_P99_BUDGET_MS", 50))
+HEALTH_P99_MAX_RATIO = 0.5
+
+# Se ejecuta en un proceso nuevo para medir un arranque en frío real
+_STARTUP_PROBE = """
+import asyncio, json, sys, time, warnings
+warnings.filterwarnings('ignore')
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter()
+from api import main as api
+from coalescer import PredictionCoalescer
+from executors import PredictionExecutor
+from inference import SklearnMatrixPredictor, encode_batch, encode_record
+api.load_model(api.MODEL_BUNDLE_PATH)
+request = api.PredictionRequest(tienda_id=1, empleados=20, publicidad=5000, ubicacion='urbana')
+response = asyncio.run(api.predict_ventas(request, x_model_version=None))
+t_first = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t_import - t0) * 1000,
+    'first_prediction_ms': (t_first - t0) * 1000,
+    'prediction': json.loads(response.body)['prediction'],
+    'heavy_modules': [m for m in %r if m in sys.modules]
+}))
+""" % (HEAVY_MODULES,)
+
+# Puntúa n filas por /predict_batch o /predict_stream en un proceso nuevo y
+# reporta el pico de memoria (RSS) que añade la petición
+_STREAM_PROBE = """
+import asyncio, json, resource, sys, time, warnings
+warnings.filterwarnings('ignore')
+from starlette.requests import Request
+from api import main as api
+mode, n = sys.argv[1], int(sys.argv[2])
+api.prediction_executor = api.create_executor_from_env()
+api.load_model(api.MODEL_BUNDLE_PATH)
+ubicaciones = ('rural', 'suburbana', 'urbana')
+
+def lines():
+    for i in range(n):
+        yield ('{"tienda_id": %d, "empleados": %d, "publicidad": %.2f, "ubicacion": "%s"}'
+               % (i % 100 + 1, i % 50 + 1, (i * 37) % 20000, ubicaciones[i % 3]))
+
+def body_chunks(size=65536):
+    buffer = []
+    for line in lines():
+        buffer.append(line + '\\n')
+        if len(buffer) == 500:
+            yield ''.join(buffer).encode()
+            buffer = []
+    if buffer:
+        yield ''.join(buffer).encode()
+
+async def run_batch():
+    body = ('{"data": [' + ','.join(lines()) + ']}').encode()
+    start = time.perf_counter()
+    request = api.BatchPredictionRequest(**json.loads(body))
+    response = await api.predict_ventas_batch(request, x_model_version=None)
+    payload = response.model_dump_json()
+    return len(response.predictions), time.perf_counter() - start
+
+async def run_stream():
+    chunks = body_chunks()
+    async def receive():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        return {'type': 'http.request', 'body': chunk, 'more_body': True}
+    scope = {'type': 'http', 'method': 'POST', 'path': '/predict_stream',
+             'headers': [(b'content-type', b'application/x-ndjson')]}
+    start = time.perf_counter()
+    response = await api.predict_ventas_stream(Request(scope, receive), x_model_version=None)
+    rows = 0
+    async for part in response.body_iterator:
+        rows += part.count(b'\\n')
+    return rows, time.perf_counter() - start
+
+def peak_rss_kb():
+    # ru_maxrss se hereda del proceso padre en Linux; VmHWM es propio de este proceso
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+baseline = peak_rss_kb()
+rows, elapsed = asyncio.run(run_batch() if mode == 'batch' else run_stream())
+peak = peak_rss_kb()
+print(json.dumps({'rows': rows, 'seconds': elapsed, 'baseline_mb': baseline / 1024, 'peak_mb': peak / 1024}))
+"""
+
+def generate_records(n, seed=42):
+    """Generar registros sintéticos con la forma de PredictionRequest"""
+    rng = np.random.default_rng(seed)
+    ubicaciones = np.array(['rural', 'suburbana', 'urbana'])
+    return [
+        {
+            'tienda_id': int(t),
+            'empleados': float(e),
+            'publicidad': float(p),
+            'ubicacion': str(u)
+        }
+        for t, e, p, u in zip(
+            rng.integers(1, 101, n),
+            rng.integers(1, 51, n),
+            rng.uniform(0, 20000, n).round(2),
+            rng.choice(ubicaciones, n)
+        )
+    ]
+
+def timed(fn, repeat=3):
+    """Ejecutar fn varias veces y devolver el mejor tiempo (segundos)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def predict_loop(records):
+    """Ruta original: un DataFrame y un model.predict por fila"""
+    return [api.serving_model.reference_predict(r) for r in records]
+
+def predict_vectorized(records):
+    """Ruta vectorizada con sklearn: todo el lote en una sola matriz"""
+    sm = api.serving_model
+    X, valid_idx, errors = encode_batch(records, sm.feature_cols, sm.encoders, api.FIELD_CONSTRAINTS)
+    return SklearnMatrixPredictor(sm.model, sm.scaler, sm.feature_cols)(X).tolist()
+
+def predict_fused(records):
+    """Ruta vectorizada con el kernel plegado"""
+    sm = api.serving_model
+    X, valid_idx, errors = encode_batch(records, sm.feature_cols, sm.encoders, api.FIELD_CONSTRAINTS)
+    return sm.kernel.predict_matrix(X).tolist()
+
+def latency_percentiles(fn, samples, warmup=100):
+    """Latencias por llamada (microsegundos): p50 y p99"""
+    for sample in samples[:warmup]:
+        fn(sample)
+    timings = np.empty(len(samples))
+    for i, sample in enumerate(samples):
+        start = time.perf_counter()
+        fn(sample)
+        timings[i] = time.perf_counter() - start
+    return np.percentile(timings, 50) * 1e6, np.percentile(timings, 99) * 1e6
+
+def benchmark_batch(sizes=(100, 1000, 10000)):
+    """Comparar el bucle por fila con la ruta vectorizada de /predict_batch"""
+    print("\n📦 /predict_batch: bucle por fila vs vectorizado")
+    print("=" * 60)
+
+    for n in sizes:
+        records = generate_records(n)
+
+        # El bucle original es lento; limitar el tamaño que se mide
+        loop_n = min(n, 2000)
+        t_loop, loop_preds = timed(lambda: predict_loop(records[:loop_n]), repeat=1)
+        t_vec, vec_preds = timed(lambda: predict_vectorized(records))
+        t_fused, fused_preds = timed(lambda: predict_fused(records))
+
+        if not np.allclose(loop_preds, vec_preds[:loop_n], rtol=1e-12, atol=1e-9):
+            print("❌ Las predicciones vectorizadas no coinciden con el bucle original")
+            return False
+        if not np.allclose(vec_preds, fused_preds, rtol=1e-12, atol=1e-9):
+            print("❌ Las predicciones del kernel plegado no coinciden con sklearn")
+            return False
+
+        loop_rate = loop_n / t_loop
+        vec_rate = n / t_vec
+        fused_rate = n / t_fused
+        print(f"   n={n:>7,}  bucle: {loop_rate:>10,.0f} filas/s   "
+              f"vectorizado: {vec_rate:>12,.0f} filas/s   "
+              f"plegado: {fused_rate:>12,.0f} filas/s   (x{fused_rate / loop_rate:,.1f})")
+
+    return True
+
+def benchmark_single(n=5000):
+    """Latencia de /predict: pandas/sklearn por petición vs kernel plegado"""
+    print("\n🎯 /predict: latencia por petición (sin HTTP)")
+    print("=" * 60)
+
+    samples = [api.PredictionRequest(**r) for r in generate_records(n)]
+
+    # Equivalencia exacta (hasta el redondeo de coma flotante) con la ruta original
+    for sample in samples:
+        expected = api.serving_model.reference_predict(sample.dict())
+        got = api.serving_model.kernel.predict_record(vars(sample))
+        if not np.isclose(got, expected, rtol=1e-12, atol=1e-9):
+            print(f"❌ Kernel plegado {got} != referencia {expected} para {sample}")
+            return False
+    print(f"   ✅ {n:,} predicciones idénticas a la ruta pandas/sklearn")
+
+    p50, p99 = latency_percentiles(lambda s: api.serving_model.reference_predict(s.dict()), samples[:1000])
+    print(f"   pandas/sklearn:  p50 {p50:>9,.1f} µs   p99 {p99:>9,.1f} µs")
+    p50, p99 = latency_percentiles(lambda s: api.serving_model.kernel.predict_record(vars(s)), samples)
+    print(f"   kernel plegado:  p50 {p50:>9,.1f} µs   p99 {p99:>9,.1f} µs")
+
+    return True
+
+async def _concurrent_predictions(rows, concurrency, predict):
+    """Lanzar predicciones individuales con un número fijo de clientes concurrentes"""
+    queue = list(rows)
+
+    async def client():
+        while queue:
+            await predict(queue.pop())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+def benchmark_coalescer(n=5000, concurrency=64, window_ms=2.0, max_batch=256):
+    """Throughput de /predict con y sin coalescedor bajo carga concurrente"""
+    print("\n🧺 /predict bajo carga concurrente: directo vs coalescedor")
+    print("=" * 60)
+
+    records = generate_records(n)
+    sm = api.serving_model
+    rows = [encode_record(r, sm.feature_cols, sm.encoders) for r in records]
+
+    # Usar la ruta sklearn, que es la que paga sobrecarga por llamada
+    sklearn_matrix = SklearnMatrixPredictor(sm.model, sm.scaler, sm.feature_cols)
+
+    async def direct(row):
+        return float(sklearn_matrix(np.array([row]))[0])
+
+    t_direct = asyncio.run(_concurrent_predictions(rows, concurrency, direct))
+    print(f"   directo (sklearn):      {n / t_direct:>12,.0f} peticiones/s")
+
+    for label, matrix_fn in (("sklearn", sklearn_matrix), ("plegado", api.serving_model.kernel.predict_matrix)):
+        coalescer = PredictionCoalescer(matrix_fn, window_ms=window_ms, max_batch=max_batch)
+        t = asyncio.run(_concurrent_predictions(rows, concurrency, coalescer.submit))
+        stats = coalescer.stats()
+        print(f"   coalescedor ({label}): {n / t:>12,.0f} peticiones/s   "
+              f"lote medio {stats['mean_batch_size']:.1f}   "
+              f"espera p50 {stats['queue_wait_ms']['p50']:.2f} ms   "
+              f"p99 {stats['queue_wait_ms']['p99']:.2f} ms")
+
+    return True
+
+def benchmark_cache(n=5000, distinct=100):
+    """/predict con la ruta sklearn: sin caché vs caché LRU con entradas repetidas"""
+    print(f"\n🗃️  /predict con {distinct} combinaciones repetidas: sin caché vs caché")
+    print("=" * 60)
+
+    sm = api.serving_model
+    # La caché importa sobre todo cuando no hay kernel plegado (modelos no lineales)
+    sklearn_only = ServingModel(
+        model=sm.model, scaler=sm.scaler, label_encoders=sm.label_encoders, model_info=sm.model_info,
+        feature_cols=sm.feature_cols, kernel=None, constraints=api.FIELD_CONSTRAINTS,
+        version=sm.version, source=sm.source
+    )
+    polled = generate_records(distinct)
+    samples = [api.PredictionRequest(**polled[i % distinct]) for i in range(n)]
+
+    previous_executor = api.prediction_executor
+    api.prediction_executor = PredictionExecutor('inline')
+    api.activate_model(sklearn_only)
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for label, cache in (("sin caché", None), ("caché LRU", PredictionCache(max_size=10000, ttl_s=300))):
+            api.prediction_cache = cache
+
+            def call(sample):
+                response = loop.run_until_complete(api.predict_ventas(sample, x_model_version=None))
+                return json.loads(response.body)['prediction']
+
+            p50, p99 = latency_percentiles(call, samples, warmup=0)
+            results[label] = [call(sample) for sample in samples[:distinct]]
+            hit_rate = f"   aciertos {cache.stats()['hit_rate']:.1%}" if cache else ""
+            print(f"   {label:<10} p50 {p50:>10,.1f} µs   p99 {p99:>10,.1f} µs{hit_rate}")
+    finally:
+        loop.close()
+        api.prediction_cache = None
+        api.activate_model(sm)
+        api.prediction_executor = previous_executor
+
+    if not np.allclose(results["sin caché"], results["caché LRU"], rtol=1e-12):
+        print("❌ La caché devolvió predicciones distintas")
+        return False
+    return True
+
+async def _asgi_get(app, path, headers=()):
+    """GET completo contra la aplicación ASGI; devuelve (estado, bytes del cuerpo)"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(k.encode(), v.encode()) for k, v in headers],
+        'client': ('127.0.0.1', 1234), 'server': ('127.0.0.1', 8000)
+    }
+    status, size = [], [0]
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            size[0] += len(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status[0], size[0]
+
+async def _asgi_post(app, path, body, content_type='application/json'):
+    """Petición HTTP completa contra la aplicación ASGI, sin red"""
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'content-type', content_type.encode())],
+        'client': ('127.0.0.1', 1234), 'server': ('127.0.0.1', 8000)
+    }
+    status, body_parts = [], []
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            body_parts.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status[0], b''.join(body_parts)
+
+def benchmark_metrics(n=5000):
+    """Sobrecarga de la instrumentación de /metrics en /predict (pila ASGI completa)"""
+    print("\n📈 /predict con y sin métricas (ASGI, sin red)")
+    print("=" * 60)
+
+    bodies = [json.dumps(r).encode() for r in generate_records(n)]
+    loop = asyncio.new_event_loop()
+    enabled = instrumentation.METRICS_ENABLED
+    # Alternar la instrumentación en cada petición para que la deriva térmica
+    # y el GC afecten por igual a las dos series
+    timings = {False: [], True: []}
+    try:
+        for i, body in enumerate(bodies * 2):
+            flag = bool(i % 2)
+            instrumentation.METRICS_ENABLED = flag
+            start = time.perf_counter()
+            status, _ = loop.run_until_complete(_asgi_post(api.app, '/predict', body))
+            timings[flag].append(time.perf_counter() - start)
+            if status != 200:
+                print(f"❌ /predict respondió {status}")
+                return False
+    finally:
+        instrumentation.METRICS_ENABLED = enabled
+        loop.close()
+
+    results = {}
+    for label, flag in (("sin métricas", False), ("con métricas", True)):
+        # Descartar la primera mitad como calentamiento
+        samples = np.array(timings[flag][n // 2:]) * 1e6
+        results[label] = (np.percentile(samples, 50), np.percentile(samples, 99))
+        print(f"   {label:<13} p50 {results[label][0]:>8,.1f} µs   p99 {results[label][1]:>8,.1f} µs")
+
+    overhead = results["con métricas"][0] - results["sin métricas"][0]
+    print(f"   sobrecarga p50: {overhead:,.1f} µs por petición "
+          f"({overhead / results['sin métricas'][0]:.1%})")
+    scraped = instrumentation.REQUESTS.value(('/predict', '200'))
+    if scraped < n:
+        print(f"❌ /metrics solo contó {scraped:,.0f} de {n:,} peticiones")
+        return False
+    return True
+
+def benchmark_fast_path(n=5000):
+    """/predict (Pydantic) vs /predict_fast (decodificación y plantilla de respuesta)"""
+    print("\n⚡ /predict vs /predict_fast: decodificación y respuesta")
+    print("=" * 60)
+
+    sm = api.serving_model
+    bodies = [json.dumps(r).encode() for r in generate_records(n)]
+
+    def pydantic_path(body):
+        request = api.PredictionRequest.model_validate_json(body)
+        prediction = sm.kernel.predict_row(encode_record(vars(request), sm.feature_cols, sm.encoders))
+        response = api.PredictionResponse(
+            prediction=prediction, confidence=float(sm.r2_score),
+            model_info={"model_type": sm.model_type, "model_version": sm.version,
+                        "r2_score": sm.r2_score, "rmse": sm.rmse}
+        )
+        return response.model_dump_json()
+
+    def template_path(body):
+        record = decode_request(body, api.FIELD_CONSTRAINTS)
+        prediction = sm.kernel.predict_row(encode_record(record, sm.feature_cols, sm.encoders))
+        return sm.response_template.render(prediction)
+
+    p50, p99 = latency_percentiles(pydantic_path, bodies)
+    print(f"   sin HTTP  Pydantic:         p50 {p50:>8,.1f} µs   p99 {p99:>8,.1f} µs")
+    p50, p99 = latency_percentiles(template_path, bodies)
+    print(f"   sin HTTP  ruta rápida:      p50 {p50:>8,.1f} µs   p99 {p99:>8,.1f} µs   "
+          f"(JSON: {'orjson' if fast_path.orjson else 'json'})")
+
+    # Pila ASGI completa, alternando los endpoints en cada petición
+    loop = asyncio.new_event_loop()
+    timings = {'/predict': [], '/predict_fast': []}
+    try:
+        for body in bodies:
+            responses = {}
+            for path in timings:
+                start = time.perf_counter()
+                responses[path] = loop.run_until_complete(_asgi_post(api.app, path, body))
+                timings[path].append(time.perf_counter() - start)
+            if responses['/predict'] != responses['/predict_fast']:
+                print(f"❌ Respuestas distintas para {body!r}: {responses}")
+                return False
+    finally:
+        loop.close()
+    print(f"   ✅ {n:,} respuestas idénticas byte a byte")
+
+    for path, samples in timings.items():
+        samples = np.array(samples[n // 2:]) * 1e6
+        print(f"   ASGI      {path:<17} p50 {np.percentile(samples, 50):>8,.1f} µs   "
+              f"p99 {np.percentile(samples, 99):>8,.1f} µs")
+    return True
+
+def benchmark_static_payloads(n=3000):
+    """Metadatos: construir y serializar en cada petición vs precodificado con ETag"""
+    print("\n🏷️  /model-info y /feature-importance: por petición vs precodificado")
+    print("=" * 60)
+
+    sm = api.serving_model
+    dynamic = {
+        '/model-info': lambda: JSONResponse(to_builtin(static_responses.model_info_payload(sm))),
+        '/feature-importance': lambda: JSONResponse(to_builtin(static_responses.feature_importance_payload(sm)))
+    }
+    precoded = {
+        '/model-info': sm.static_responses.model_info,
+        '/feature-importance': sm.static_responses.feature_importance
+    }
+    loop = asyncio.new_event_loop()
+    try:
+        for path, build in dynamic.items():
+            encoded = precoded[path]
+            status, size = loop.run_until_complete(_asgi_get(api.app, path, [('if-none-match', encoded.etag)]))
+            if status != 304 or size:
+                print(f"❌ {path} con If-None-Match respondió {status} con {size} bytes")
+                return False
+
+            p50_build, _ = latency_percentiles(lambda _: build(), range(n))
+            p50_200, _ = latency_percentiles(lambda _: encoded.response(None), range(n))
+            p50_304, _ = latency_percentiles(lambda _: encoded.response(encoded.etag), range(n))
+            p50_asgi, _ = latency_percentiles(
+                lambda _: loop.run_until_complete(_asgi_get(api.app, path, [('if-none-match', encoded.etag)])),
+                range(n)
+            )
+            print(f"   {path:<20} por petición {p50_build:>6,.1f} µs   precodificado {p50_200:>5,.1f} µs   "
+                  f"304 {p50_304:>5,.1f} µs   (ASGI 304 {p50_asgi:,.0f} µs, {len(encoded.body):,} B ahorrados)")
+    finally:
+        loop.close()
+    return True
+
+def benchmark_columnar(sizes=(10000, 100000, 1000000), batch_limit=100000):
+    """/predict_batch (JSON) vs /predict_columnar (buffers binarios por columna)"""
+    print("\n🧱 /predict_batch (JSON) vs /predict_columnar (binario)")
+    print("=" * 60)
+
+    previous_executor = api.prediction_executor
+    api.prediction_executor = PredictionExecutor('inline')
+    loop = asyncio.new_event_loop()
+    try:
+        for n in sizes:
+            records = generate_records(n)
+            columns = {col: [r[col] for r in records] for col in api.serving_model.feature_cols}
+            columns['tienda_id'] = np.array(columns['tienda_id'], dtype=np.int16)
+            columns['empleados'] = np.array(columns['empleados'], dtype=np.int16)
+            binary = encode_columnar(columns)
+
+            t_col, (status, content) = timed(lambda: loop.run_until_complete(
+                _asgi_post(api.app, '/predict_columnar', binary, COLUMNAR_MEDIA_TYPE)
+            ))
+            if status != 200:
+                print(f"❌ /predict_columnar respondió {status}: {content[:200]!r}")
+                return False
+            columnar = np.frombuffer(content, dtype='<f8')
+
+            line = (f"   n={n:>9,}  columnar {n / t_col:>12,.0f} filas/s "
+                    f"({len(binary) / n:.0f} B/fila)")
+            if n <= batch_limit:
+                body = json.dumps({"data": records}).encode()
+                t_json, (status, content) = timed(lambda: loop.run_until_complete(
+                    _asgi_post(api.app, '/predict_batch', body)
+                ), repeat=1)
+                expected = json.loads(content)["predictions"]
+                if status != 200 or not np.allclose(columnar, expected, rtol=1e-12, atol=1e-9):
+                    print("❌ Las predicciones columnares no coinciden con /predict_batch")
+                    return False
+                line += (f"   JSON {n / t_json:>10,.0f} filas/s ({len(body) / n:.0f} B/fila)"
+                         f"   x{t_json / t_col:,.0f}")
+            print(line)
+    finally:
+        loop.close()
+        api.prediction_executor = previous_executor
+    return True
+
+async def _health_during_batches(records, n_batches, interval=0.005):
+    """Latencias de /health mientras hay lotes grandes en curso"""
+    request = api.BatchPredictionRequest(data=records)
+    latencies = []
+    done = asyncio.Event()
+
+    async def health_pinger():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            await api.health_check(if_none_match=None)
+            # Retraso respecto al intervalo pedido = tiempo bloqueado en el event loop
+            latencies.append(time.perf_counter() - start - interval)
+
+    async def batches():
+        await asyncio.sleep(interval * 4)
+        start = time.perf_counter()
+        await asyncio.gather(*(api.predict_ventas_batch(request, x_model_version=None) for _ in range(n_batches)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        return elapsed
+
+    _, elapsed = await asyncio.gather(health_pinger(), batches())
+    return np.array(latencies) * 1000.0, elapsed
+
+def benchmark_executors(n=50000, n_batches=4, kinds=('inline', 'thread', 'process')):
+    """Prueba de carga: /health no debe quedar bloqueado detrás de lotes grandes"""
+    print(f"\n🧵 /health durante {n_batches} lotes de {n:,} filas por ejecutor")
+    print("=" * 60)
+
+    records = generate_records(n)
+    scorer = api.serving_model.scorer
+
+    p99 = {}
+    for kind in kinds:
+        executor = PredictionExecutor(kind, chunk_size=5000)
+        executor.start(scorer)
+        api.prediction_executor = executor
+        try:
+            latencies, elapsed = asyncio.run(_health_during_batches(records, n_batches))
+        finally:
+            executor.shutdown()
+        p99[kind] = np.percentile(latencies, 99)
+        print(f"   {kind:<8} /health p50 {np.percentile(latencies, 50):>8.2f} ms   "
+              f"p99 {np.percentile(latencies, 99):>8.2f} ms   máx {latencies.max():>8.2f} ms   "
+              f"lotes: {n * n_batches / elapsed:>10,.0f} filas/s")
+
+    api.prediction_executor = PredictionExecutor('inline')
+    api.prediction_executor.start(scorer)
+
+    # Con un pool, /health no debe esperar a los lotes como en el modo en línea
+    ok = True
+    for kind in (kind for kind in kinds if kind != 'inline'):
+        if p99[kind] > HEALTH_P99_BUDGET_MS:
+            print(f"❌ /health p99 con '{kind}' supera el presupuesto "
+                  f"({p99[kind]:.1f} ms > {HEALTH_P99_BUDGET_MS:.0f} ms)")
+            ok = False
+        if 'inline' in p99 and p99[kind] > HEALTH_P99_MAX_RATIO * p99['inline']:
+            print(f"❌ /health p99 con '{kind}' ({p99[kind]:.1f} ms) no mejora el modo en línea "
+                  f"({p99['inline']:.1f} ms)")
+            ok = False
+    return ok
+
+def benchmark_streaming(sizes=(100000, 500000)):
+    """/predict_stream vs /predict_batch: filas por segundo y pico de memoria"""
+    print("\n🌊 /predict_stream (NDJSON) vs /predict_batch (JSON)")
+    print("=" * 60)
+
+    for n in sizes:
+        results = {}
+        for mode in ('batch', 'stream'):
+            output = subprocess.run(
+                [sys.executable, '-c', _STREAM_PROBE, mode, str(n)],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True, text=True, check=True
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+
+        for mode, label in (('batch', '/predict_batch'), ('stream', '/predict_stream')):
+            result = results[mode]
+            print(f"   n={n:>7,}  {label:<16} {result['rows'] / result['seconds']:>10,.0f} filas/s   "
+                  f"pico RSS {result['peak_mb']:>7.1f} MB "
+                  f"(+{result['peak_mb'] - result['baseline_mb']:.1f} MB sobre el modelo cargado)")
+
+        if results['stream']['rows'] != results['batch']['rows']:
+            print("❌ /predict_stream no devolvió una línea por fila")
+            return False
+
+    return True
+
+def _startup_probe(bundle_path, runs=3):
+    """Mejor tiempo de arranque en frío de varias ejecuciones en procesos nuevos"""
+    env = dict(os.environ, MODEL_BUNDLE_PATH=bundle_path)
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', _STARTUP_PROBE],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results, key=lambda r: r['first_prediction_ms'])
+
+def benchmark_startup():
+    """Prueba de regresión del arranque en frío: tiempos y módulos importados"""
+    print("\n🧊 Arranque en frío: import y primera predicción")
+    print("=" * 60)
+
+    legacy = _startup_probe('')
+    bundle = _startup_probe(api.MODEL_BUNDLE_PATH)
+    for label, result in (("pickles", legacy), ("bundle", bundle)):
+        print(f"   {label:<8} import {result['import_ms']:>8.1f} ms   "
+              f"primera predicción {result['first_prediction_ms']:>8.1f} ms   "
+              f"módulos pesados: {result['heavy_modules'] or 'ninguno'}")
+
+    ok = True
+    if bundle['heavy_modules']:
+        print(f"❌ La ruta de servicio importa módulos pesados: {bundle['heavy_modules']}")
+        ok = False
+    if bundle['first_prediction_ms'] > STARTUP_BUDGET_MS:
+        print(f"❌ Arranque en frío por encima del presupuesto "
+              f"({bundle['first_prediction_ms']:.0f} ms > {STARTUP_BUDGET_MS:.0f} ms)")
+        ok = False
+    if not np.isclose(bundle['prediction'], legacy['prediction'], rtol=1e-12):
+        print("❌ El bundle y los pickles predicen valores distintos")
+        ok = False
+    return ok
+
+if __name__ == "__main__":
+    print("🚀 Benchmarks de la API de Predicción de Ventas")
+    print("=" * 60)
+
+    # 'python benchmark_api.py startup' ejecuta solo la prueba de regresión de arranque
+    if sys.argv[1:] == ['startup']:
+        ok = benchmark_startup()
+        print("\n" + "=" * 60)
+        print("🏁 Arranque en frío dentro del presupuesto" if ok else "⚠️ Regresión en el arranque en frío")
+        sys.exit(0 if ok else 1)
+
+    if not api.load_model(bundle_path=None):
+        print("❌ No se pudo cargar el modelo")
+        sys.exit(1)
+
+    if api.serving_model.kernel is None:
+        print("❌ El kernel plegado no está disponible para este modelo")
+        sys.exit(1)
+
+    ok = benchmark_batch()
+    ok = benchmark_single() and ok
+    ok = benchmark_coalescer() and ok
+    ok = benchmark_cache() and ok
+    ok = benchmark_metrics() and ok
+    ok = benchmark_fast_path() and ok
+    ok = benchmark_columnar() and ok
+    ok = benchmark_static_payloads() and ok
+    ok = benchmark_executors() and ok
+    ok = benchmark_streaming() and ok
+    ok = benchmark_startup() and ok
+
+    print("\n" + "=" * 60)
+    print("🏁 Benchmarks completados" if ok else "⚠️ Benchmarks con errores")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,769 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de rendimiento del pipeline de preprocesamiento
+Compara el modo en memoria con el modo por trozos sobre datasets sintéticos
+el pipeline completo con gráficos frente al modo headless y el ajuste en memoria
+frente al ajuste por estadísticas suficientes (también en la validación cruzada) la caché de etapas, el formato de los datos procesados
+y el reentrenamiento incremental por particiones mensuales
+"""
+
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+warnings.filterwarnings('ignore')
+
+# Agregar el directorio src al path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+# Ejecuta un modo del pipeline en un proceso nuevo y reporta tiempo y pico de memoria (RSS)
+_PIPELINE_PROBE = """
+import contextlib, io, json, resource, sys, time, warnings
+warnings.filterwarnings('ignore')
+sys.path.insert(0, 'src')
+from data_preprocessing import DataPreprocessor
+mode, data_path, output_dir, chunk_rows = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+
+def peak_rss_kb():
+    # VmHWM es propio de este proceso (ru_maxrss se hereda del padre en Linux)
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+baseline = peak_rss_kb()
+preprocessor = DataPreprocessor(data_path)
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    if mode == 'memory':
+        preprocessor.load_data()
+        preprocessor.clean_data()
+        preprocessor.encode_categorical_variables()
+        preprocessor.scale_numerical_features('ventas')
+        preprocessor.split_data('ventas')
+    else:
+        preprocessor.run_chunked_pipeline(output_dir, chunk_rows)
+elapsed = time.perf_counter() - start
+peak = peak_rss_kb()
+print(json.dumps({
+    'seconds': elapsed,
+    'baseline_mb': baseline / 1024,
+    'peak_mb': peak / 1024,
+    'scaler_mean': preprocessor.scaler.mean_.tolist(),
+    'scaler_scale': preprocessor.scaler.scale_.tolist()
+}))
+"""
+
+# Carga el CSV con tipos inferidos o con el esquema declarado en un proceso nuevo
+_INGEST_PROBE = """
+import json, resource, sys, time, warnings
+warnings.filterwarnings('ignore')
+sys.path.insert(0, 'src')
+import pandas as pd
+from data_preprocessing import read_sales_csv
+mode, data_path = sys.argv[1], sys.argv[2]
+
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+baseline = peak_rss_kb()
+start = time.perf_counter()
+df = pd.read_csv(data_path) if mode == 'inferred' else read_sales_csv(data_path)
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'rows': len(df),
+    'frame_mb': df.memory_usage(deep=True).sum() / 2**20,
+    'baseline_mb': baseline / 1024,
+    'peak_mb': peak_rss_kb() / 1024,
+    'nulls': int(df.isnull().sum().sum()),
+    'sums': [float(df[col].astype('float64').sum()) for col in df.columns if col != 'ubicacion']
+}))
+"""
+
+# Preprocesamiento + entrenamiento completos (o headless) en el directorio actual
+_HEADLESS_PROBE = """
+import contextlib, io, json, sys, time, warnings
+warnings.filterwarnings('ignore')
+mode, data_path, src_dir = sys.argv[1], sys.argv[2], sys.argv[3]
+sys.path.insert(0, src_dir)
+start = time.perf_counter()
+from data_preprocessing import DataPreprocessor
+from model_training import ModelTrainer
+headless = mode != 'full'
+with contextlib.redirect_stdout(io.StringIO()):
+    DataPreprocessor(data_path).run_preprocessing_pipeline(headless=headless)
+    trainer = ModelTrainer()
+    trainer.run_training_pipeline(headless=headless, parallel_reports=mode == 'parallel')
+model_ready = time.perf_counter() - start
+if trainer.report_process is not None:
+    trainer.report_process.wait()
+print(json.dumps({
+    'model_seconds': model_ready,
+    'total_seconds': time.perf_counter() - start,
+    'plotting_loaded': sorted({name.split('.')[0] for name in sys.modules} & {'matplotlib', 'seaborn'})
+}))
+"""
+
+# Ajuste sobre la salida por trozos: todo en memoria vs estadísticas suficientes
+_FIT_PROBE = """
+import json, resource, sys, time, warnings
+warnings.filterwarnings('ignore')
+sys.path.insert(0, 'src')
+import numpy as np
+mode, chunks_dir, workers = sys.argv[1], sys.argv[2], int(sys.argv[3])
+
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+from sklearn.linear_model import LinearRegression
+from data_preprocessing import iter_processed_chunks
+from linear_stats import stats_from_chunks
+baseline = peak_rss_kb()
+start = time.perf_counter()
+if mode == 'memory':
+    X, y = [], []
+    for X_part, y_part, test in iter_processed_chunks(chunks_dir):
+        X.append(X_part[~test])
+        y.append(y_part[~test])
+    model = LinearRegression().fit(np.concatenate(X), np.concatenate(y))
+    coef, intercept = model.coef_, model.intercept_
+else:
+    coef, intercept = stats_from_chunks(chunks_dir, workers).solve()
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'baseline_mb': baseline / 1024,
+    'peak_mb': peak_rss_kb() / 1024,
+    'coef': np.asarray(coef).tolist(),
+    'intercept': float(intercept)
+}))
+"""
+
+# Preprocesamiento headless con o sin caché de etapas, en el directorio actual
+_CACHE_PROBE = """
+import contextlib, io, json, sys, time, warnings
+warnings.filterwarnings('ignore')
+mode, data_path, src_dir, test_size = sys.argv[1], sys.argv[2], sys.argv[3], float(sys.argv[4])
+sys.path.insert(0, src_dir)
+from data_preprocessing import DataPreprocessor, read_processed_data
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()) as output:
+    ok = DataPreprocessor(data_path).run_preprocessing_pipeline(
+        headless=True, use_cache=mode != 'no-cache', test_size=test_size)
+elapsed = time.perf_counter() - start
+data = read_processed_data()
+hits = [line.split(':', 1)[1].strip() for line in output.getvalue().splitlines() if 'recuperadas' in line]
+print(json.dumps({
+    'ok': ok,
+    'seconds': elapsed,
+    'hits': hits[0] if hits else '',
+    'checksum': [float(data[name].sum()) for name in ('X_train', 'X_test', 'y_train', 'y_test')]
+}))
+"""
+
+# Carga de los datos procesados y ajuste del modelo: processed_data.pkl vs formato columnar
+_TRAIN_LOAD_PROBE = """
+import contextlib, io, json, resource, sys, time, warnings
+warnings.filterwarnings('ignore')
+sys.path.insert(0, 'src')
+mode, workdir = sys.argv[1], sys.argv[2]
+
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+from model_training import ModelTrainer
+processed_dir = workdir + '/processed_data' if mode != 'pkl' else workdir + '/missing'
+trainer = ModelTrainer(workdir + '/processed_data.pkl', processed_dir)
+baseline = peak_rss_kb()
+with contextlib.redirect_stdout(io.StringIO()):
+    start = time.perf_counter()
+    X_train, X_test, y_train, y_test, feature_cols, target_col = trainer.load_processed_data()
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    trainer.train_linear_regression(X_train, y_train, incremental=mode == 'columnar-incremental')
+    fit_seconds = time.perf_counter() - start
+print(json.dumps({
+    'load_seconds': load_seconds,
+    'fit_seconds': fit_seconds,
+    'baseline_mb': baseline / 1024,
+    'peak_mb': peak_rss_kb() / 1024,
+    'coef': trainer.model.coef_.tolist()
+}))
+"""
+
+# Reentrenamiento incremental mes a mes frente al reentrenamiento completo, en el directorio actual
+_RETRAIN_PROBE = """
+import contextlib, io, json, sys, time, warnings
+warnings.filterwarnings('ignore')
+src_dir, base_csv, full_csv, unserved_csv, months = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5:]
+sys.path.insert(0, src_dir)
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.preprocessing import StandardScaler
+from data_preprocessing import DataPreprocessor, read_processed_data
+from incremental_training import IncrementalTrainer
+from model_training import ModelTrainer
+from pipeline_cache import PipelineCache
+
+def timed(fn):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = fn()
+    assert ok is not False
+    return time.perf_counter() - start
+
+result = {'base': timed(lambda: DataPreprocessor(base_csv).run_preprocessing_pipeline(headless=True, use_cache=False)
+                        and ModelTrainer().run_training_pipeline(headless=True))}
+result['init'] = timed(lambda: IncrementalTrainer().init_from_processed())
+result['updates'] = [timed(lambda: IncrementalTrainer().update([path])) for path in months]
+# Una ubicación que la API no acepta se rechaza sin tocar el estado
+with contextlib.redirect_stdout(io.StringIO()):
+    result['rejected'] = IncrementalTrainer().update([unserved_csv]) is False
+result['duplicate'] = timed(lambda: IncrementalTrainer().update(months[-1:]))
+state = joblib.load('models/incremental/state.pkl')
+result['version'] = state['version']
+result['vocabulary'] = state['vocabularies']['ubicacion']
+
+# Referencia: todas las filas en memoria con los mismos parámetros de limpieza y la misma división
+data = read_processed_data()
+scaler, cols, target = data['scaler'], state['feature_cols'], state['target_col']
+base = {split: (np.asarray(data['X_' + split]) * scaler.scale_ + scaler.mean_, np.asarray(data['y_' + split]))
+        for split in ('train', 'test')}
+for split in base:
+    base[split][0][:, cols.index('ubicacion')] = np.rint(base[split][0][:, cols.index('ubicacion')])
+parts = {'train': [base['train']], 'test': [base['test']]}
+for path in months:
+    df = pd.read_csv(path)
+    for col, (lower, upper) in state['clip_bounds'].items():
+        df[col] = df[col].fillna(state['fill_values'][col]).clip(lower, upper)
+    codes = {cls: code for code, cls in enumerate(state['vocabularies']['ubicacion'])}
+    df['ubicacion'] = df['ubicacion'].fillna(state['fill_values']['ubicacion']).map(codes)
+    digest = PipelineCache('models/incremental').file_digest(path)
+    test = np.random.default_rng([state['random_state'], int(digest[:16], 16)]).random(len(df)) < state['test_size']
+    X, y = df[cols].to_numpy(dtype=np.float64), df[target].to_numpy(dtype=np.float64)
+    parts['train'].append((X[~test], y[~test]))
+    parts['test'].append((X[test], y[test]))
+X_train, y_train = (np.concatenate(a) for a in zip(*parts['train']))
+X_test, y_test = (np.concatenate(a) for a in zip(*parts['test']))
+reference_scaler = StandardScaler().fit(np.vstack([X_train, X_test]))
+reference = LinearRegression().fit(reference_scaler.transform(X_train), y_train)
+model, scaler = joblib.load('models/model.pkl'), joblib.load('models/scaler.pkl')
+info = joblib.load('models/model_info.pkl')
+result['coef_diff'] = float(np.max(np.abs(model.coef_ - reference.coef_) / np.abs(reference.coef_)))
+result['intercept_diff'] = abs(model.intercept_ - reference.intercept_) / abs(reference.intercept_)
+result['scaler_diff'] = float(max(np.max(np.abs(scaler.mean_ - reference_scaler.mean_) / reference_scaler.mean_),
+                                  np.max(np.abs(scaler.scale_ - reference_scaler.scale_) / reference_scaler.scale_)))
+result['r2_diff'] = abs(info['metrics']['r2_test'] - reference.score(reference_scaler.transform(X_test), y_test))
+
+# Hoy: preprocesamiento y entrenamiento completos sobre todo el histórico
+result['full'] = timed(lambda: DataPreprocessor(full_csv).run_preprocessing_pipeline(headless=True, use_cache=False)
+                       and ModelTrainer().run_training_pipeline(headless=True))
+print(json.dumps(result))
+"""
+
+def synthetic_frame(rng, n, null_rate=0.05):
+    """DataFrame con el esquema de ventas_tiendas (valores enteros), nulos y outliers"""
+    ubicaciones = np.array(['rural', 'suburbana', 'urbana'], dtype=object)
+    efecto = {'rural': 0.0, 'suburbana': 5000.0, 'urbana': 10000.0}
+    df = pd.DataFrame({
+        'tienda_id': rng.integers(1, 101, n),
+        'empleados': rng.integers(1, 51, n).astype(float),
+        'publicidad': rng.gamma(4.0, 1250.0, n).round(),
+        'ubicacion': rng.choice(ubicaciones, n)
+    })
+    df['ventas'] = (20000 + 1400 * df['empleados'] + 0.8 * df['publicidad']
+                    + df['ubicacion'].map(efecto) + rng.normal(0, 9000, n)).round()
+    for col in ('empleados', 'publicidad', 'ubicacion', 'ventas'):
+        df.loc[rng.random(n) < null_rate, col] = None
+    return df
+
+def write_synthetic_csv(path, rows, seed=42, chunk_rows=500000, null_rate=0.05):
+    """Escribir un CSV sintético por trozos"""
+    rng = np.random.default_rng(seed)
+    first = True
+    for offset in range(0, rows, chunk_rows):
+        df = synthetic_frame(rng, min(chunk_rows, rows - offset), null_rate)
+        df.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+        first = False
+    return path
+
+def legacy_clean_data(df):
+    """clean_data anterior: mediana, cuartiles y capado columna por columna"""
+    df_original = df.copy()
+    numerical_cols = df.select_dtypes(include=[np.number]).columns
+    for col in numerical_cols:
+        if df[col].isnull().sum() > 0:
+            df[col] = df[col].fillna(df[col].median())
+    for col in df.select_dtypes(include=['object', 'category']).columns:
+        if df[col].isnull().sum() > 0:
+            df[col] = df[col].fillna(df[col].mode()[0])
+    bounds = {}
+    for col in numerical_cols:
+        Q1 = df[col].quantile(0.25)
+        Q3 = df[col].quantile(0.75)
+        IQR = Q3 - Q1
+        lower_bound = Q1 - 1.5 * IQR
+        upper_bound = Q3 + 1.5 * IQR
+        bounds[col] = [float(lower_bound), float(upper_bound)]
+        outliers = df[(df[col] < lower_bound) | (df[col] > upper_bound)]
+        if len(outliers) > 0:
+            df[col] = np.clip(df[col], lower_bound, upper_bound)
+    return df, bounds
+
+def _run_probe(mode, data_path, output_dir, chunk_rows, probe=_PIPELINE_PROBE):
+    output = subprocess.run(
+        [sys.executable, '-c', probe, mode, data_path, output_dir, str(chunk_rows)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def benchmark_chunked(sizes=(1000000, 3000000), chunk_rows=100000):
+    """Pipeline en memoria vs por trozos: tiempo, pico de memoria y estadísticas del scaler"""
+    print("\n🧩 Preprocesamiento en memoria vs por trozos")
+    print("=" * 60)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            data_path = os.path.join(tmp, f'ventas_{n}.csv')
+            start = time.perf_counter()
+            write_synthetic_csv(data_path, n)
+            print(f"   n={n:>9,}  CSV sintético de {os.path.getsize(data_path) / 2**20:.0f} MB "
+                  f"({time.perf_counter() - start:.1f} s)")
+
+            results = {}
+            for mode in ('memory', 'chunked'):
+                results[mode] = _run_probe(mode, data_path, os.path.join(tmp, f'chunks_{n}'), chunk_rows)
+            for mode, label in (('memory', 'en memoria'), ('chunked', 'por trozos')):
+                result = results[mode]
+                print(f"      {label:<11} {result['seconds']:>7.2f} s  {n / result['seconds']:>10,.0f} filas/s   "
+                      f"pico RSS {result['peak_mb']:>7.1f} MB "
+                      f"(+{result['peak_mb'] - result['baseline_mb']:.1f} MB)")
+
+            # Los cuantiles por trozos salen de una muestra: las estadísticas deben ser muy cercanas
+            mean_error = np.max(np.abs(np.subtract(results['chunked']['scaler_mean'], results['memory']['scaler_mean']))
+                                / np.array(results['memory']['scaler_scale']))
+            scale_error = np.max(np.abs(np.divide(results['chunked']['scaler_scale'], results['memory']['scaler_scale']) - 1))
+            print(f"      diferencia del scaler: media {mean_error:.2e} desviaciones, escala {scale_error:.2e} relativa")
+            if mean_error > 0.01 or scale_error > 0.01:
+                print("❌ Las estadísticas por trozos se alejan de las del modo en memoria")
+                ok = False
+    return ok
+
+def benchmark_clean_data(sizes=(100000, 1000000, 10000000)):
+    """clean_data columna por columna vs vectorizado, con los tipos del esquema"""
+    from data_preprocessing import DataPreprocessor, SALES_CATEGORIES, SALES_SCHEMA
+
+    print("\n🧹 clean_data: columna por columna vs vectorizado")
+    print("=" * 60)
+
+    ok = True
+    rng = np.random.default_rng(42)
+    for n in sizes:
+        df = synthetic_frame(rng, n)
+        for col, dtype in SALES_SCHEMA.items():
+            df[col] = pd.Categorical(df[col], categories=SALES_CATEGORIES[col]) \
+                if dtype == 'category' else df[col].astype(dtype)
+
+        start = time.perf_counter()
+        legacy, legacy_bounds = legacy_clean_data(df.copy())
+        legacy_time = time.perf_counter() - start
+
+        preprocessor = DataPreprocessor()
+        preprocessor.df = df.copy()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            preprocessor.clean_data()
+        vector_time = time.perf_counter() - start
+
+        print(f"   n={n:>11,}  columna por columna {legacy_time:>7.3f} s   vectorizado {vector_time:>7.3f} s   "
+              f"(x{legacy_time / vector_time:.1f}, {n / vector_time:,.0f} filas/s)")
+
+        same = preprocessor.clip_bounds == legacy_bounds and all(
+            np.array_equal(preprocessor.df[col].to_numpy(dtype=np.float64), legacy[col].to_numpy(dtype=np.float64))
+            for col in legacy.select_dtypes(include=[np.number]).columns
+        ) and preprocessor.df['ubicacion'].equals(legacy['ubicacion'])
+        if not same:
+            print("❌ clean_data vectorizado no coincide con la versión columna por columna")
+            ok = False
+    return ok
+
+def benchmark_headless(sizes=(100000, 1000000)):
+    """Pipeline completo con gráficos vs headless (reportes aparte o en paralelo)"""
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+
+    print("\n🖼️ Pipeline con gráficos vs headless")
+    print("=" * 60)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            data_path = os.path.join(tmp, f'ventas_{n}.csv')
+            write_synthetic_csv(data_path, n)
+            print(f"   n={n:>9,}")
+
+            results = {}
+            for mode, label in (('full', 'con gráficos'), ('headless', 'headless'), ('parallel', 'headless + reportes')):
+                # Cada modo en su propio directorio: escribe models/ y los PNG sin tocar los del repo
+                workdir = os.path.join(tmp, f'{mode}_{n}')
+                os.makedirs(os.path.join(workdir, 'models'))
+                output = subprocess.run([sys.executable, '-c', _HEADLESS_PROBE, mode, data_path, src_dir],
+                                        cwd=workdir, capture_output=True, text=True, check=True).stdout
+                result = results[mode] = json.loads(output.strip().splitlines()[-1])
+                if mode == 'headless':
+                    start = time.perf_counter()
+                    subprocess.run([sys.executable, os.path.join(src_dir, 'reporting.py')],
+                                   cwd=workdir, capture_output=True, check=True)
+                    result['total_seconds'] += time.perf_counter() - start
+                figures = sorted(name for name in os.listdir(workdir) if name.endswith('.png'))
+
+                print(f"      {label:<20} modelo listo {result['model_seconds']:>6.2f} s   "
+                      f"con reportes {result['total_seconds']:>6.2f} s   gráficos {len(figures)}")
+                if mode != 'full' and result['plotting_loaded']:
+                    print(f"❌ El modo headless importó {result['plotting_loaded']}")
+                    ok = False
+                if len(figures) != 4:
+                    print(f"❌ Se esperaban 4 gráficos y se generaron {len(figures)}")
+                    ok = False
+            print(f"      modelo listo x{results['full']['model_seconds'] / results['headless']['model_seconds']:.1f} "
+                  f"más rápido en headless")
+    return ok
+
+def benchmark_incremental(sizes=(1000000, 3000000), chunk_rows=100000, workers=(1, 2)):
+    """LinearRegression.fit en memoria vs estadísticas suficientes por trozos (en paralelo)"""
+    print("\n🧮 Ajuste en memoria vs estadísticas suficientes por trozos")
+    print("=" * 60)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            data_path = os.path.join(tmp, f'ventas_{n}.csv')
+            chunks_dir = os.path.join(tmp, f'chunks_{n}')
+            write_synthetic_csv(data_path, n)
+            _run_probe('chunked', data_path, chunks_dir, chunk_rows)
+            print(f"   n={n:>9,}  ({n // chunk_rows} trozos)")
+
+            results = {'memory': _run_probe('memory', chunks_dir, '1', '', probe=_FIT_PROBE)}
+            for count in workers:
+                results[count] = _run_probe('stats', chunks_dir, str(count), '', probe=_FIT_PROBE)
+            for key, result in results.items():
+                label = 'en memoria' if key == 'memory' else f'por trozos ({key} proc.)'
+                print(f"      {label:<22} {result['seconds']:>6.2f} s   pico RSS {result['peak_mb']:>7.1f} MB "
+                      f"(+{result['peak_mb'] - result['baseline_mb']:.1f} MB)")
+
+            reference = np.array(results['memory']['coef'])
+            for count in workers:
+                error = np.max(np.abs(np.array(results[count]['coef']) - reference) / np.abs(reference))
+                intercept_error = abs(results[count]['intercept'] / results['memory']['intercept'] - 1)
+                print(f"      diferencia relativa ({count} proc.): coeficientes {error:.1e}, intercepto {intercept_error:.1e}")
+                if error > 1e-9 or intercept_error > 1e-9:
+                    print("❌ Los coeficientes por trozos no coinciden con LinearRegression.fit")
+                    ok = False
+    return ok
+
+def benchmark_cv(sizes=(100000, 1000000), folds=(5, 50), loo_rows=2000):
+    """cross_val_score de LinearRegression vs validación cruzada en forma cerrada"""
+    from sklearn.linear_model import LinearRegression
+    from sklearn.model_selection import LeaveOneOut, cross_val_predict, cross_val_score
+    from linear_stats import cross_val_scores, loo_predictions
+
+    print("\n🔄 Validación cruzada: reajuste por fold vs forma cerrada")
+    print("=" * 60)
+
+    ok = True
+    rng = np.random.default_rng(42)
+    for n in sizes:
+        df = synthetic_frame(rng, n, null_rate=0.0)
+        df['ubicacion'] = df['ubicacion'].map({'rural': 0, 'suburbana': 1, 'urbana': 2})
+        X = df.drop(columns='ventas').to_numpy(dtype=np.float64)
+        y = df['ventas'].to_numpy(dtype=np.float64)
+        for k in folds:
+            start = time.perf_counter()
+            reference = cross_val_score(LinearRegression(), X, y, cv=k, scoring='r2')
+            refit_time = time.perf_counter() - start
+            start = time.perf_counter()
+            scores = cross_val_scores(X, y, cv=k)
+            closed_time = time.perf_counter() - start
+            error = np.max(np.abs(scores - reference))
+            print(f"   n={n:>9,}  {k:>3} folds   reajuste {refit_time:>7.3f} s   forma cerrada {closed_time:>7.3f} s   "
+                  f"(x{refit_time / closed_time:.0f}, diferencia máx. {error:.1e})")
+            if error > 1e-10:
+                print("❌ Los scores en forma cerrada no coinciden con cross_val_score")
+                ok = False
+
+    start = time.perf_counter()
+    reference = cross_val_predict(LinearRegression(), X[:loo_rows], y[:loo_rows], cv=LeaveOneOut())
+    refit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    predictions = loo_predictions(X[:loo_rows], y[:loo_rows])
+    closed_time = time.perf_counter() - start
+    error = np.max(np.abs(predictions - reference) / np.abs(reference))
+    print(f"   leave-one-out n={loo_rows:,}   reajuste {refit_time:>7.3f} s   matriz sombrero {closed_time:>7.4f} s   "
+          f"(diferencia relativa máx. {error:.1e})")
+    if error > 1e-10:
+        print("❌ Las predicciones leave-one-out no coinciden con cross_val_predict")
+        ok = False
+    return ok
+
+def benchmark_cache(sizes=(1000000, 5000000)):
+    """Preprocesamiento sin caché, con caché vacía, con caché llena y cambiando solo la división"""
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+
+    print("\n♻️ Caché de etapas del preprocesamiento")
+    print("=" * 60)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            data_path = os.path.join(tmp, f'ventas_{n}.csv')
+            write_synthetic_csv(data_path, n)
+            workdir = os.path.join(tmp, f'run_{n}')
+            os.makedirs(os.path.join(workdir, 'models'))
+            print(f"   n={n:>9,}")
+
+            results = {}
+            runs = (('no-cache', 0.2, 'sin caché'), ('cold', 0.2, 'caché vacía'), ('warm', 0.2, 'caché llena'),
+                    ('split', 0.25, 'otro test_size'))
+            for mode, test_size, label in runs:
+                output = subprocess.run([sys.executable, '-c', _CACHE_PROBE, mode, data_path, src_dir, str(test_size)],
+                                        cwd=workdir, capture_output=True, text=True, check=True).stdout
+                result = results[mode] = json.loads(output.strip().splitlines()[-1])
+                print(f"      {label:<15} {result['seconds']:>7.2f} s   etapas de la caché: {result['hits'] or '-'}")
+
+            # Con la caché llena el resultado debe ser idéntico al de la ejecución sin caché
+            if results['warm']['checksum'] != results['no-cache']['checksum'] or \
+                    results['cold']['checksum'] != results['no-cache']['checksum']:
+                print("❌ El resultado con caché no coincide con el de la ejecución sin caché")
+                ok = False
+            if results['split']['checksum'][0] == results['no-cache']['checksum'][0]:
+                print("❌ Cambiar test_size no invalidó la división en caché")
+                ok = False
+    return ok
+
+def benchmark_processed_format(sizes=(1000000, 5000000)):
+    """Etapa de entrenamiento: cargar processed_data.pkl vs mapear el formato columnar"""
+    import joblib
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+    from data_preprocessing import write_processed_data
+
+    print("\n🗂️ Datos procesados: pickle de DataFrames vs .npy columnar mapeado")
+    print("=" * 60)
+
+    ok = True
+    rng = np.random.default_rng(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            df = synthetic_frame(rng, n, null_rate=0.0)
+            df['ubicacion'] = df['ubicacion'].map({'rural': 0, 'suburbana': 1, 'urbana': 2})
+            feature_cols = ['tienda_id', 'empleados', 'publicidad', 'ubicacion']
+            scaler = StandardScaler()
+            X = pd.DataFrame(scaler.fit_transform(df[feature_cols].astype(np.float64)), columns=feature_cols)
+            X_train, X_test, y_train, y_test = train_test_split(X, df['ventas'], test_size=0.2, random_state=42)
+            processed_data = {
+                'X_train': X_train, 'X_test': X_test, 'y_train': y_train, 'y_test': y_test,
+                'feature_cols': feature_cols, 'target_col': 'ventas', 'scaler': scaler,
+                'label_encoders': {}, 'fill_values': {}, 'clip_bounds': {}
+            }
+            workdir = os.path.join(tmp, f'run_{n}')
+            os.makedirs(workdir)
+            joblib.dump(processed_data, os.path.join(workdir, 'processed_data.pkl'))
+            write_processed_data(processed_data, os.path.join(workdir, 'processed_data'))
+            del df, X, X_train, X_test, y_train, y_test, processed_data
+            print(f"   n={n:>9,}")
+
+            results = {}
+            for mode, label in (('pkl', 'pickle'), ('columnar', 'columnar'),
+                                ('columnar-incremental', 'columnar + incremental')):
+                result = results[mode] = _run_probe(mode, workdir, '', '', probe=_TRAIN_LOAD_PROBE)
+                print(f"      {label:<23} carga {result['load_seconds']:>6.3f} s   ajuste {result['fit_seconds']:>6.3f} s   "
+                      f"pico RSS {result['peak_mb']:>7.1f} MB (+{result['peak_mb'] - result['baseline_mb']:.1f} MB)")
+
+            for mode in ('columnar', 'columnar-incremental'):
+                if not np.allclose(results[mode]['coef'], results['pkl']['coef'], rtol=1e-9):
+                    print(f"❌ Los coeficientes con '{mode}' no coinciden con los del pickle")
+                    ok = False
+    return ok
+
+def benchmark_retrain(sizes=(1000000, 5000000), month_rows=100000, months=3):
+    """Reentrenamiento incremental por meses frente a repetir todo sobre el histórico"""
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+
+    print("\n📅 Reentrenamiento incremental con particiones mensuales")
+    print("=" * 60)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            base_csv = write_synthetic_csv(os.path.join(tmp, f'base_{n}.csv'), n)
+            month_paths = [write_synthetic_csv(os.path.join(tmp, f'mes_{n}_{month + 1}.csv'), month_rows, seed=month + 1)
+                           for month in range(months)]
+            # Histórico completo para el reentrenamiento de hoy (solo se mide su tiempo)
+            full_csv = os.path.join(tmp, f'completo_{n}.csv')
+            with open(full_csv, 'w') as out:
+                for index, path in enumerate([base_csv] + month_paths):
+                    with open(path) as f:
+                        if index:
+                            next(f)
+                        out.writelines(f)
+            # Un mes con una ubicación que el esquema de la API no admite
+            unserved_csv = os.path.join(tmp, f'zona_franca_{n}.csv')
+            df = pd.read_csv(month_paths[-1])
+            df.loc[df.index % 10 == 0, 'ubicacion'] = 'zona_franca'
+            df.to_csv(unserved_csv, index=False)
+            workdir = os.path.join(tmp, f'run_{n}')
+            os.makedirs(os.path.join(workdir, 'models'))
+            print(f"   n={n:>9,} + {months} meses de {month_rows:,} filas")
+
+            process = subprocess.run([sys.executable, '-c', _RETRAIN_PROBE, src_dir, base_csv, full_csv, unserved_csv]
+                                     + month_paths,
+                                     cwd=workdir, capture_output=True, text=True)
+            if process.returncode != 0:
+                print(f"❌ Error en el reentrenamiento:\n{process.stderr}")
+                ok = False
+                continue
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+            print(f"      versión base (pipeline completo)  {result['base']:>7.2f} s")
+            print(f"      init del estado incremental       {result['init']:>7.2f} s")
+            for month, seconds in enumerate(result['updates'], 1):
+                print(f"      actualización mes {month}              {seconds:>7.2f} s")
+            print(f"      partición repetida (se omite)     {result['duplicate']:>7.2f} s")
+            print(f"      reentrenamiento completo          {result['full']:>7.2f} s")
+            print(f"      versión {result['version']}, ubicaciones {result['vocabulary']}, "
+                  f"zona_franca {'rechazada' if result['rejected'] else 'aceptada'}")
+            print(f"      vs. reajuste en memoria: coef {result['coef_diff']:.1e}, intercepto "
+                  f"{result['intercept_diff']:.1e}, scaler {result['scaler_diff']:.1e}, R² prueba {result['r2_diff']:.1e}")
+
+            if max(result['coef_diff'], result['intercept_diff'], result['scaler_diff'], result['r2_diff']) > 1e-9:
+                print("❌ El modelo incremental no coincide con el reajuste sobre todas las filas")
+                ok = False
+            if result['version'] != months:
+                print(f"❌ Se esperaban {months} versiones y hay {result['version']}")
+                ok = False
+            if not result['rejected']:
+                print("❌ Se aceptó una ubicación que la API no puede servir")
+                ok = False
+    return ok
+
+def benchmark_ingestion(sizes=(1000000, 10000000)):
+    """Carga del CSV: tipos inferidos vs esquema declarado (tiempo, memoria y resultado)"""
+    print("\n📥 Carga del CSV: tipos inferidos vs esquema declarado")
+    print("=" * 60)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            data_path = os.path.join(tmp, f'ventas_{n}.csv')
+            write_synthetic_csv(data_path, n)
+            print(f"   n={n:>11,}  CSV sintético de {os.path.getsize(data_path) / 2**20:,.0f} MB")
+
+            results = {}
+            for mode, label in (('inferred', 'inferidos'), ('schema', 'esquema')):
+                result = results[mode] = _run_probe(mode, data_path, '', 0, probe=_INGEST_PROBE)
+                print(f"      {label:<10} {result['seconds']:>7.2f} s  {n / result['seconds']:>12,.0f} filas/s   "
+                      f"DataFrame {result['frame_mb']:>8.1f} MB   pico RSS {result['peak_mb']:>8.1f} MB")
+
+            # Como en el dataset real, los valores son enteros y exactos en float32: el contenido debe coincidir
+            if (results['schema']['nulls'] != results['inferred']['nulls']
+                    or not np.allclose(results['schema']['sums'], results['inferred']['sums'], rtol=1e-12)):
+                print("❌ La carga con esquema no reproduce los valores de la carga inferida")
+                ok = False
+    return ok
+
+if __name__ == "__main__":
+    print("🚀 Benchmarks del Pipeline de Preprocesamiento")
+    print("=" * 60)
+
+    # 'python benchmark_pipeline.py ingestion N' mide solo la carga con N filas (p. ej. 100000000)
+    if sys.argv[1:2] == ['retrain']:
+        ok = benchmark_retrain(tuple(int(n) for n in sys.argv[2:]) or (1000000, 5000000))
+        print("\n" + "=" * 60)
+        print("🏁 Benchmarks completados" if ok else "⚠️ Benchmarks con errores")
+        sys.exit(0 if ok else 1)
+
+    if sys.argv[1:2] == ['processed']:
+        ok = benchmark_processed_format(tuple(int(n) for n in sys.argv[2:]) or (1000000, 5000000))
+        print("\n" + "=" * 60)
+        print("🏁 Benchmarks completados" if ok else "⚠️ Benchmarks con errores")
+        sys.exit(0 if ok else 1)
+
+    if sys.argv[1:2] == ['cache']:
+        ok = benchmark_cache(tuple(int(n) for n in sys.argv[2:]) or (1000000, 5000000))
+        print("\n" + "=" * 60)
+        print("🏁 Benchmarks completados" if ok else "⚠️ Benchmarks con errores")
+        sys.exit(0 if ok else 1)
+
+    if sys.argv[1:2] == ['cv']:
+        ok = benchmark_cv(tuple(int(n) for n in sys.argv[2:]) or (100000, 1000000))
+        print("\n" + "=" * 60)
+        print("🏁 Benchmarks completados" if ok else "⚠️ Benchmarks con errores")
+        sys.exit(0 if ok else 1)
+
+    if sys.argv[1:2] == ['incremental']:
+        ok = benchmark_incremental(tuple(int(n) for n in sys.argv[2:]) or (1000000, 3000000))
+        print("\n" + "=" * 60)
+        print("🏁 Benchmarks completados" if ok else "⚠️ Benchmarks con errores")
+        sys.exit(0 if ok else 1)
+
+    if sys.argv[1:2] == ['headless']:
+        ok = benchmark_headless(tuple(int(n) for n in sys.argv[2:]) or (100000, 1000000))
+        print("\n" + "=" * 60)
+        print("🏁 Benchmarks completados" if ok else "⚠️ Benchmarks con errores")
+        sys.exit(0 if ok else 1)
+
+    if sys.argv[1:2] == ['ingestion']:
+        ok = benchmark_ingestion(tuple(int(n) for n in sys.argv[2:]) or (1000000, 10000000))
+        print("\n" + "=" * 60)
+        print("🏁 Benchmarks completados" if ok else "⚠️ Benchmarks con errores")
+        sys.exit(0 if ok else 1)
+
+    ok = benchmark_ingestion()
+    ok = benchmark_clean_data() and ok
+    ok = benchmark_chunked() and ok
+    ok = benchmark_headless() and ok
+    ok = benchmark_incremental() and ok
+    ok = benchmark_cv() and ok
+    ok = benchmark_cache() and ok
+    ok = benchmark_processed_format() and ok
+    ok = benchmark_retrain() and ok
+
+    print("\n" + "=" * 60)
+    print("🏁 Benchmarks completados" if ok else "⚠️ Benchmarks con errores")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,353 @@
+"""
+Puntuación por lotes fuera de línea - CRISP-DM
+Fase 6: Despliegue
+
+Puntúa archivos CSV con la forma de 'data/ventas_tiendas (4).csv' usando los
+mismos artefactos y la misma validación/preprocesado que la API. El archivo se
+divide en rangos de bytes alineados a líneas que se reparten entre procesos;
+cada trabajador lee solo su rango, así la memoria no depende del tamaño del
+archivo. Las predicciones se escriben en orden a medida que terminan los
+trozos, y un checkpoint permite reanudar tras una caída sin repetir trabajo.
+
+Como los rangos se cortan en cualquier salto de línea, cada registro debe
+ocupar una sola línea: un campo entre comillas con un salto de línea dentro
+partiría la fila entre dos trabajadores. Esos archivos se detectan (la fila
+no cuadra con la cabecera) y el trabajo se detiene con un error.
+
+Salida (una fila por fila de entrada, en el mismo orden):
+    CSV:     [columnas conservadas,] prediction, error
+    Parquet: directorio con un archivo part-NNNNNN.parquet por trozo
+
+Uso:
+    python src/batch_scoring.py "data/ventas_tiendas (4).csv" predicciones.csv
+    python src/batch_scoring.py grande.csv salida/ --format parquet --workers 8
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Mismos artefactos, validación y kernel que la API, sin importar la aplicación FastAPI
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from schemas import FIELD_CONSTRAINTS
+from serving import MODEL_BUNDLE_PATH, load_serving_model
+
+OUTPUT_FORMATS = ('csv', 'parquet')
+CHECKPOINT_VERSION = 1
+
+# Estado de cada proceso trabajador (se asigna en el inicializador)
+_worker_state: Dict[str, Any] = {}
+
+def _init_worker(scorer, input_path: str, header: List[str], keep_columns: List[str],
+                 output_format: str, output_path: str):
+    """Precargar el scorer y la configuración una vez por proceso"""
+    _worker_state.update(
+        scorer=scorer, input_path=input_path, header=header, keep_columns=keep_columns,
+        output_format=output_format, output_path=output_path
+    )
+
+def part_path(output_path: str, chunk_id: int) -> str:
+    return os.path.join(output_path, f"part-{chunk_id:06d}.parquet")
+
+def _score_range(task: Tuple[int, int, int]) -> Tuple[int, int, int, bytes]:
+    """Leer, validar, puntuar y serializar un rango de bytes del archivo de entrada
+
+    Devuelve (id del trozo, filas, filas válidas, salida CSV). En formato
+    Parquet el propio trabajador escribe su archivo y la salida queda vacía.
+    """
+    chunk_id, start, end = task
+    state = _worker_state
+    with open(state['input_path'], 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    scorer = state['scorer']
+    if not data.strip():
+        return chunk_id, 0, 0, b''
+    text_cols = [col for col in state['header'] if col in scorer.encoders or col in state['keep_columns']]
+    try:
+        df = pd.read_csv(io.BytesIO(data), header=None, names=state['header'],
+                         dtype={col: str for col in text_cols}, skip_blank_lines=True)
+    except pd.errors.ParserError as e:
+        raise ValueError(_multiline_error(state['input_path'], start, e)) from e
+    n = len(df)
+    # Sin comillas cada línea es una fila; con comillas, una fila que abarca
+    # varias líneas se delata porque pandas lee menos filas que líneas
+    if b'"' in data and n != sum(1 for line in data.splitlines() if line.strip()):
+        raise ValueError(_multiline_error(state['input_path'], start, "filas que abarcan varias líneas"))
+
+    # Las columnas numéricas que pandas ya convirtió pasan como arreglos; las que
+    # traen texto inválido se validan valor a valor como en la API
+    columns = {
+        col: df[col].to_numpy(dtype=np.float64) if pd.api.types.is_numeric_dtype(df[col]) else df[col].tolist()
+        for col in scorer.feature_cols if col in df.columns
+    }
+    predictions, valid_idx, errors = scorer.score_columns(columns, n)
+
+    if state['output_format'] == 'parquet':
+        prediction_col = np.full(n, np.nan)
+        prediction_col[valid_idx] = predictions
+        error_col = np.full(n, None, dtype=object)
+        for error in errors:
+            error_col[error['index']] = error['error']
+
+        out = df[state['keep_columns']].copy() if state['keep_columns'] else pd.DataFrame(index=df.index)
+        out['prediction'] = prediction_col
+        out['error'] = error_col
+        path = part_path(state['output_path'], chunk_id)
+        out.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        return chunk_id, n, len(valid_idx), b''
+
+    # CSV armado a mano: DataFrame.to_csv es la parte más lenta del trozo
+    prediction_text = [''] * n
+    for i, prediction in zip(valid_idx.tolist(), predictions.tolist()):
+        prediction_text[i] = repr(prediction)
+    error_text = [''] * n
+    for error in errors:
+        error_text[error['index']] = _csv_field(error['error'])
+    kept = [list(map(_csv_field, df[col].tolist())) for col in state['keep_columns']]
+    lines = map(','.join, zip(*kept, prediction_text, error_text))
+    return chunk_id, n, len(valid_idx), ('\n'.join(lines) + '\n').encode('utf-8') if n else b''
+
+def _multiline_error(input_path: str, start: int, detail: Any) -> str:
+    return (f"Filas inválidas en '{input_path}' a partir del byte {start} ({detail}); "
+            f"la puntuación por lotes no admite campos entre comillas con saltos de línea")
+
+def _csv_field(value: Any) -> str:
+    """Texto de un campo CSV (vacío para nulos, entre comillas si hace falta)"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    text = str(value)
+    if any(c in text for c in ',"\r\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+def iter_byte_ranges(path: str, start: int, chunk_bytes: int) -> Iterator[Tuple[int, int]]:
+    """Rangos [inicio, fin) de unos chunk_bytes que terminan en un salto de línea"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            yield start, end
+            start = end
+
+def read_header(path: str) -> Tuple[List[str], int]:
+    """Columnas de la cabecera y posición donde empiezan los datos"""
+    with open(path, 'rb') as f:
+        line = f.readline().decode('utf-8-sig')
+        return [name.strip() for name in next(csv.reader([line]))], f.tell()
+
+class BatchScoringJob:
+    """Trabajo de puntuación reanudable de un archivo CSV"""
+
+    def __init__(self, input_path: str, output_path: str, output_format: str = 'csv',
+                 bundle_path: Optional[str] = MODEL_BUNDLE_PATH, models_dir: str = 'models',
+                 chunk_mb: float = 16.0, workers: Optional[int] = None,
+                 keep_columns: Optional[List[str]] = None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato desconocido '{output_format}', opciones: {', '.join(OUTPUT_FORMATS)}")
+        self.input_path = input_path
+        self.output_path = output_path
+        self.output_format = output_format
+        self.bundle_path = bundle_path
+        self.models_dir = models_dir
+        self.chunk_bytes = max(1, int(chunk_mb * 1024 * 1024))
+        self.workers = workers or os.cpu_count() or 1
+        self.keep_columns = list(keep_columns or [])
+        self.model = None
+
+    @property
+    def checkpoint_path(self) -> str:
+        if self.output_format == 'parquet':
+            return os.path.join(self.output_path, '_checkpoint.json')
+        return f"{self.output_path}.checkpoint.json"
+
+    def _input_identity(self) -> Dict[str, Any]:
+        stat = os.stat(self.input_path)
+        return {
+            'input': os.path.abspath(self.input_path),
+            'input_size': stat.st_size,
+            'input_mtime_ns': stat.st_mtime_ns,
+            'model_version': self.model.version,
+            'output_format': self.output_format,
+            'keep_columns': self.keep_columns
+        }
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """Checkpoint previo si corresponde a la misma entrada, modelo y configuración"""
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        identity = self._input_identity()
+        mismatched = [key for key, value in identity.items() if checkpoint.get(key) != value]
+        if checkpoint.get('version') != CHECKPOINT_VERSION or mismatched:
+            raise RuntimeError(
+                f"El checkpoint '{self.checkpoint_path}' no corresponde a este trabajo "
+                f"({', '.join(mismatched) or 'versión'}); use --restart para empezar de nuevo"
+            )
+        return checkpoint
+
+    def save_checkpoint(self, state: Dict[str, Any]):
+        """Guardar el avance de forma atómica (después de que la salida esté en disco)"""
+        checkpoint = {'version': CHECKPOINT_VERSION, **self._input_identity(), **state}
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _prepare_output(self, checkpoint: Optional[Dict[str, Any]]):
+        """Abrir la salida y descartar lo escrito después del último checkpoint"""
+        if self.output_format == 'parquet':
+            os.makedirs(self.output_path, exist_ok=True)
+            next_chunk = checkpoint['next_chunk'] if checkpoint else 0
+            for name in os.listdir(self.output_path):
+                if name.startswith('part-') and int(name[5:11]) >= next_chunk:
+                    os.remove(os.path.join(self.output_path, name))
+            return None
+
+        if checkpoint:
+            out = open(self.output_path, 'r+b')
+            out.truncate(checkpoint['output_bytes'])
+            out.seek(checkpoint['output_bytes'])
+            return out
+        out = open(self.output_path, 'wb')
+        out.write((','.join(self.keep_columns + ['prediction', 'error']) + '\n').encode('utf-8'))
+        return out
+
+    def run(self, restart: bool = False) -> Dict[str, Any]:
+        """Puntuar el archivo (reanudando desde el checkpoint si existe)"""
+        print(f"🚀 Puntuación por lotes de '{self.input_path}'")
+        self.model = load_serving_model(self.bundle_path, FIELD_CONSTRAINTS, models_dir=self.models_dir)
+        print(f"✅ Modelo {self.model.version} ({self.model.model_type})")
+
+        header, data_start = read_header(self.input_path)
+        missing = [col for col in self.model.feature_cols + self.keep_columns if col not in header]
+        if missing:
+            raise ValueError(f"Faltan columnas en '{self.input_path}': {missing}")
+
+        if restart and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        checkpoint = self.load_checkpoint()
+        if checkpoint and checkpoint.get('completed'):
+            print(f"✅ Ya completado: {checkpoint['rows']:,} filas en '{self.output_path}'")
+            return checkpoint
+
+        state = {
+            'next_chunk': checkpoint['next_chunk'] if checkpoint else 0,
+            'next_offset': checkpoint['next_offset'] if checkpoint else data_start,
+            'rows': checkpoint['rows'] if checkpoint else 0,
+            'valid_rows': checkpoint['valid_rows'] if checkpoint else 0,
+            'output_bytes': checkpoint['output_bytes'] if checkpoint else 0,
+            'completed': False
+        }
+        if checkpoint:
+            print(f"🔄 Reanudando en el trozo {state['next_chunk']} ({state['rows']:,} filas ya puntuadas)")
+
+        out = self._prepare_output(checkpoint)
+        if out is not None:
+            state['output_bytes'] = out.tell()
+
+        size = os.path.getsize(self.input_path)
+        start_time = time.perf_counter()
+        start_offset = state['next_offset']
+        ranges = enumerate(iter_byte_ranges(self.input_path, start_offset, self.chunk_bytes),
+                           start=state['next_chunk'])
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model.scorer, self.input_path, header, self.keep_columns,
+                          self.output_format, self.output_path)
+            ) as pool:
+                # Como mucho dos trozos en vuelo por trabajador: memoria acotada
+                in_flight = deque()
+                for chunk_id, (start, end) in ranges:
+                    in_flight.append((end, pool.submit(_score_range, (chunk_id, start, end))))
+                    if len(in_flight) >= 2 * self.workers:
+                        self._commit(out, state, *in_flight.popleft())
+                while in_flight:
+                    self._commit(out, state, *in_flight.popleft())
+        finally:
+            if out is not None:
+                out.close()
+
+        state['completed'] = True
+        self.save_checkpoint(state)
+        elapsed = time.perf_counter() - start_time
+        scored_mb = (size - start_offset) / 1e6
+        print(f"✅ {state['rows']:,} filas ({state['valid_rows']:,} válidas) en '{self.output_path}' "
+              f"- {elapsed:.1f} s, {scored_mb / elapsed if elapsed else 0:,.1f} MB/s")
+        return state
+
+    def _commit(self, out, state: Dict[str, Any], end: int, future):
+        """Escribir un trozo terminado (en orden) y avanzar el checkpoint"""
+        chunk_id, rows, valid_rows, payload = future.result()
+        if out is not None:
+            out.write(payload)
+            out.flush()
+            os.fsync(out.fileno())
+            state['output_bytes'] = out.tell()
+        state.update(
+            next_chunk=chunk_id + 1,
+            next_offset=end,
+            rows=state['rows'] + rows,
+            valid_rows=state['valid_rows'] + valid_rows
+        )
+        self.save_checkpoint(state)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Puntuación por lotes de archivos CSV de ventas")
+    parser.add_argument('input', help="CSV de entrada con las columnas del modelo")
+    parser.add_argument('output', help="CSV de salida o directorio Parquet")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', dest='output_format')
+    parser.add_argument('--bundle', default=MODEL_BUNDLE_PATH, help="Bundle del modelo ('' = usar los .pkl)")
+    parser.add_argument('--models-dir', default='models', help="Directorio con los artefactos .pkl")
+    parser.add_argument('--chunk-mb', type=float, default=16.0, help="Tamaño de cada trozo en MB")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos (por defecto, núcleos)")
+    parser.add_argument('--keep-columns', default='', help="Columnas de entrada a copiar en la salida")
+    parser.add_argument('--restart', action='store_true', help="Ignorar el checkpoint y empezar de nuevo")
+    args = parser.parse_args(argv)
+
+    if args.output_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("--format parquet requiere pyarrow (pip install pyarrow)")
+
+    job = BatchScoringJob(
+        args.input, args.output,
+        output_format=args.output_format,
+        bundle_path=args.bundle or None,
+        models_dir=args.models_dir,
+        chunk_mb=args.chunk_mb,
+        workers=args.workers,
+        keep_columns=[col.strip() for col in args.keep_columns.split(',') if col.strip()]
+    )
+    try:
+        job.run(restart=args.restart)
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,29 +6,257 @@ Fase 3: Preparación de los Datos
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.model_selection import train_test_split
+from collections import Counter
+import argparse
+import json
+import os
 import warnings
+from reporting import REPORT_DATA_DIR, plot_target_distribution, save_preprocessing_report_data
+from pipeline_cache import DEFAULT_CACHE_DIR, PipelineCache, code_digest, stage_key
 warnings.filterwarnings('ignore')
 
+# Directorio de salida del modo por trozos
+DEFAULT_CHUNKS_DIR = 'data/processed_chunks'
+
+# Divisiones del modo en memoria: un .npy por matriz, en orden de columnas
+# (Fortran) para leer una columna contigua, más manifest.json y preprocessing.pkl
+DEFAULT_PROCESSED_DIR = 'models/processed_data'
+PROCESSED_FORMAT_VERSION = 1
+PROCESSED_SPLITS = ('X_train', 'X_test', 'y_train', 'y_test')
+
+# Esquema declarado del dataset de ventas: tipos compactos con los que se guarda
+# cada columna. Los números se leen como float64 y se reducen por trozo solo si la
+# conversión no pierde información; si no, la columna se queda en float64.
+SALES_SCHEMA = {
+    'tienda_id': 'int16',
+    'empleados': 'float32',
+    'publicidad': 'float32',
+    'ubicacion': 'category',
+    'ventas': 'float32'
+}
+SALES_CATEGORIES = {'ubicacion': ['rural', 'suburbana', 'urbana']}
+INGEST_CHUNK_ROWS = 500000
+
+def _compact_column(values, dtype):
+    """Reducir una columna float64 al tipo declarado si es exacto; si no, dejarla igual"""
+    target = np.dtype(dtype)
+    array = values.to_numpy()
+    if target.kind in 'iu':
+        info = np.iinfo(target)
+        if (np.isnan(array).any() or (array != np.floor(array)).any()
+                or len(array) and (array.min() < info.min or array.max() > info.max)):
+            return values
+        return values.astype(target)
+    compact = array.astype(target)
+    # Solo difieren los NaN (NaN != NaN) salvo que el tipo pierda precisión
+    mismatch = compact != array
+    if not mismatch.any() or np.isnan(array[mismatch]).all():
+        return pd.Series(compact, index=values.index, name=values.name)
+    return values
+
+def _apply_schema(chunk, schema, categories, first_row):
+    """Validar un trozo recién leído y convertirlo a los tipos del esquema"""
+    for col, dtype in schema.items():
+        if col not in chunk.columns:
+            continue
+        if dtype == 'category':
+            # El parser ya devuelve la columna como categórica: validar sus categorías
+            # (no las filas) y recodificar a la lista declarada, común a todos los trozos
+            values = chunk[col].astype('category')
+            allowed = categories.get(col)
+            if allowed is not None:
+                unknown = [value for value in values.cat.categories if value not in allowed]
+                if unknown:
+                    rows = values.isin(unknown).to_numpy()
+                    row = first_row + int(np.argmax(rows))
+                    raise ValueError(f"Columna '{col}': {int(rows.sum())} valores fuera de "
+                                     f"{allowed} (primero en la fila {row}: '{values.iloc[row - first_row]}')")
+                values = values.cat.set_categories(allowed)
+            chunk[col] = values
+        else:
+            chunk[col] = _compact_column(chunk[col], dtype)
+    return chunk
+
+def _order_statistics(values, ks):
+    """Valores de values ordenado en las posiciones ks, sin ordenarlo (reordena values)
+    
+    Cada posición se obtiene con un partition de un solo pivote sobre el tramo
+    que aún la contiene; en NumPy es mucho más rápido que un partition con
+    varios pivotes a la vez o que un sort completo.
+    """
+    found = {}
+    
+    def select(lo, hi, ks):
+        if not ks:
+            return
+        mid = ks[len(ks) // 2]
+        values[lo:hi].partition(mid - lo)
+        found[mid] = float(values[mid])
+        select(lo, mid, [k for k in ks if k < mid])
+        select(mid + 1, hi, [k for k in ks if k > mid])
+    
+    select(0, len(values), sorted(set(ks)))
+    return found
+
+def _lerp(a, b, t):
+    # Misma interpolación lineal (y redondeo) que np.quantile
+    diff = b - a
+    return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+def median_and_quantiles(values, n_missing=0, qs=(0.25, 0.75)):
+    """Mediana de los valores no nulos y cuantiles tras rellenar n_missing nulos con ella
+    
+    values son los valores no nulos (se reordenan). Da los mismos resultados que
+    Series.median() seguido de fillna(mediana).quantile(q), pero con una sola
+    selección por estadístico: la columna rellenada es la ordenada con n_missing
+    copias de la mediana insertadas, así que sus posiciones se leen de values.
+    """
+    p = len(values)
+    if p == 0:
+        return np.nan, [np.nan] * len(qs)
+    n = p + n_missing
+    needed = [p // 2] if p % 2 else [p // 2 - 1, p // 2]
+    positions = []
+    for q in qs:
+        # Índice virtual del método 'linear' de np.quantile
+        h = (n - 1) * q
+        lo = int(np.floor(h))
+        hi = min(lo + 1, n - 1)
+        positions.append((lo, hi, h - lo))
+        for k in (lo, hi):
+            needed.extend(i for i in (k, k - n_missing) if 0 <= i < p)
+    
+    stats = _order_statistics(values, needed)
+    median = stats[p // 2] if p % 2 else (stats[p // 2 - 1] + stats[p // 2]) / 2
+    
+    def filled(k):
+        # Posición k de la columna rellenada
+        if k < p and stats[k] < median:
+            return stats[k]
+        if 0 <= k - n_missing < p and stats[k - n_missing] > median:
+            return stats[k - n_missing]
+        return median
+    
+    return median, [_lerp(filled(lo), filled(hi), t) for lo, hi, t in positions]
+
+def iter_sales_csv(path, chunk_rows=INGEST_CHUNK_ROWS, schema=SALES_SCHEMA, categories=SALES_CATEGORIES):
+    """Leer un CSV por trozos con el esquema declarado, validando cada trozo
+    
+    Con pyarrow instalado se usa su lector CSV en streaming (multihilo); si no,
+    el motor C de pandas. Las columnas fuera del esquema se infieren.
+    """
+    schema = schema or {}
+    parse_types = {col: ('category' if dtype == 'category' else 'float64') for col, dtype in schema.items()}
+    first_row = 0
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        pa = None
+    
+    if pa is not None:
+        header = pd.read_csv(path, nrows=0).columns
+        column_types = {col: (pa.dictionary(pa.int32(), pa.string()) if kind == 'category' else pa.float64())
+                        for col, kind in parse_types.items() if col in header}
+        reader = pa_csv.open_csv(
+            path, read_options=pa_csv.ReadOptions(block_size=64 << 20),
+            convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+        )
+        chunks = (batch.to_pandas() for batch in reader)
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        chunks = pd.read_csv(path, chunksize=chunk_rows,
+                             dtype={col: kind for col, kind in parse_types.items() if col in header})
+    
+    for chunk in chunks:
+        chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+        yield _apply_schema(chunk, schema, categories, first_row)
+        first_row += len(chunk)
+
+def read_sales_csv(path, schema=SALES_SCHEMA, categories=SALES_CATEGORIES, chunk_rows=INGEST_CHUNK_ROWS):
+    """Cargar el CSV completo con tipos compactos (sin esquema: inferencia de pandas)"""
+    if not schema:
+        return pd.read_csv(path)
+    chunks = list(iter_sales_csv(path, chunk_rows, schema, categories))
+    if not chunks:
+        return pd.read_csv(path)
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+def find_target_col(columns):
+    """Columna objetivo: la primera cuyo nombre contiene 'venta' o 'sales'"""
+    ventas_cols = [col for col in columns if 'venta' in col.lower() or 'sales' in col.lower()]
+    return ventas_cols[0] if ventas_cols else None
+
+class ReservoirSample:
+    """Muestra uniforme de tamaño fijo de una columna numérica (algoritmo R)
+    
+    Permite estimar mediana y cuartiles en una sola pasada con memoria
+    constante; si la columna cabe en la muestra, los cuantiles son exactos.
+    """
+    
+    def __init__(self, size=100000, rng=None):
+        self.size = int(size)
+        self.rng = rng if rng is not None else np.random.default_rng(42)
+        self.values = np.empty(self.size, dtype=np.float64)
+        self.seen = 0
+        
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        
+        # Llenar la muestra con los primeros valores
+        free = min(self.size - min(self.seen, self.size), len(values))
+        if free > 0:
+            self.values[self.seen:self.seen + free] = values[:free]
+        rest = values[free:]
+        
+        # Cada valor t-ésimo sustituye a uno al azar con probabilidad size / t
+        if len(rest):
+            positions = np.arange(self.seen + free + 1, self.seen + len(values) + 1)
+            slots = (self.rng.random(len(rest)) * positions).astype(np.int64)
+            keep = slots < self.size
+            # Con índices repetidos gana el último, como en el algoritmo secuencial
+            self.values[slots[keep]] = rest[keep]
+        self.seen += len(values)
+        
+    @property
+    def sample(self):
+        return self.values[:min(self.seen, self.size)]
+    
+    def quantiles(self, qs, n_missing=0, fill_value=None):
+        """Cuantiles de la columna tras rellenar n_missing nulos con fill_value"""
+        sample = self.sample
+        if n_missing and fill_value is not None and self.seen:
+            extra = int(round(len(sample) * n_missing / self.seen))
+            sample = np.concatenate([sample, np.full(extra, fill_value)])
+        return np.quantile(sample, qs)
+
 class DataPreprocessor:
-    def __init__(self, data_path='data/ventas_tiendas (4).csv'):
+    def __init__(self, data_path='data/ventas_tiendas (4).csv', schema=SALES_SCHEMA):
         self.data_path = data_path
+        self.schema = schema
         self.df = None
+        self.df_scaled = None
+        self.feature_cols = None
+        self.splits = None
         self.scaler = StandardScaler()
         self.label_encoders = {}
+        self.stream_stats = None
+        self.fill_values = {}
+        self.clip_bounds = {}
         
     def load_data(self):
         """Cargar y explorar los datos - Fase 2: Comprensión de los Datos"""
         print("=== FASE 2: COMPRENSIÓN DE LOS DATOS ===")
         
         try:
-            self.df = pd.read_csv(self.data_path)
+            self.df = read_sales_csv(self.data_path, self.schema)
             print(f"✅ Dataset cargado exitosamente")
             print(f"📊 Dimensiones: {self.df.shape}")
             print(f"📋 Columnas: {list(self.df.columns)}")
+            print(f"💾 Memoria: {self.df.memory_usage(deep=True).sum() / 2**20:.1f} MB")
             
         except Exception as e:
             print(f"❌ Error al cargar el dataset: {e}")
@@ -58,7 +286,7 @@ class DataPreprocessor:
         print(self.df.dtypes.value_counts())
         
         # Variables categóricas
-        categorical_cols = self.df.select_dtypes(include=['object']).columns
+        categorical_cols = self.df.select_dtypes(include=['object', 'category']).columns
         print(f"\n🏷️ Variables categóricas: {list(categorical_cols)}")
         
         # Variables numéricas
@@ -72,10 +300,9 @@ class DataPreprocessor:
         print("\n=== ANÁLISIS DE LA VARIABLE OBJETIVO ===")
         
         # Buscar la columna de ventas
-        ventas_cols = [col for col in self.df.columns if 'venta' in col.lower() or 'sales' in col.lower()]
+        target_col = find_target_col(self.df.columns)
         
-        if ventas_cols:
-            target_col = ventas_cols[0]
+        if target_col is not None:
             print(f"🎯 Variable objetivo identificada: {target_col}")
             
             # Estadísticas de la variable objetivo
@@ -83,22 +310,7 @@ class DataPreprocessor:
             print(self.df[target_col].describe())
             
             # Distribución
-            plt.figure(figsize=(12, 4))
-            
-            plt.subplot(1, 2, 1)
-            plt.hist(self.df[target_col], bins=30, alpha=0.7, color='skyblue', edgecolor='black')
-            plt.title(f'Distribución de {target_col}')
-            plt.xlabel(target_col)
-            plt.ylabel('Frecuencia')
-            
-            plt.subplot(1, 2, 2)
-            plt.boxplot(self.df[target_col])
-            plt.title(f'Boxplot de {target_col}')
-            plt.ylabel(target_col)
-            
-            plt.tight_layout()
-            plt.savefig('target_analysis.png', dpi=300, bbox_inches='tight')
-            plt.close()
+            plot_target_distribution(self.df[target_col], target_col)
             
             print(f"📈 Gráficos guardados en 'target_analysis.png'")
             
@@ -108,7 +320,13 @@ class DataPreprocessor:
             return None
     
     def clean_data(self):
-        """Limpieza de datos - Fase 3: Preparación de los Datos"""
+        """Limpieza de datos - Fase 3: Preparación de los Datos
+        
+        Cada columna numérica se recorre una vez: máscara de nulos, mediana y
+        cuartiles en una sola selección (median_and_quantiles), relleno y capado
+        en el sitio. Los valores de relleno y los límites de capado quedan en
+        fill_values y clip_bounds para aplicarlos igual al predecir.
+        """
         print("\n=== FASE 3: PREPARACIÓN DE LOS DATOS ===")
         
         # Guardar copia original
@@ -118,20 +336,47 @@ class DataPreprocessor:
         print("\n🧹 Limpieza de valores nulos...")
         null_counts_before = self.df.isnull().sum().sum()
         
-        # Para variables numéricas, rellenar con la mediana
+        # Para variables numéricas, rellenar con la mediana y capar outliers
+        # con los límites IQR de la columna ya rellenada
+        self.fill_values = {}
+        self.clip_bounds = {}
+        outlier_messages = []
+        outliers_removed = 0
         numerical_cols = self.df.select_dtypes(include=[np.number]).columns
         for col in numerical_cols:
-            if self.df[col].isnull().sum() > 0:
-                median_val = self.df[col].median()
-                self.df[col].fillna(median_val, inplace=True)
+            values = self.df[col].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            null_mask = np.isnan(values)
+            nulls = int(np.count_nonzero(null_mask))
+            median_val, (Q1, Q3) = median_and_quantiles(values[~null_mask], nulls)
+            if nulls > 0:
+                values[null_mask] = median_val
                 print(f"   ✅ {col}: valores nulos rellenados con mediana ({median_val:.2f})")
+            del null_mask
+            
+            IQR = Q3 - Q1
+            lower_bound = Q1 - 1.5 * IQR
+            upper_bound = Q3 + 1.5 * IQR
+            self.fill_values[col] = float(median_val)
+            self.clip_bounds[col] = [float(lower_bound), float(upper_bound)]
+            
+            outliers = int(np.count_nonzero((values < lower_bound) | (values > upper_bound)))
+            if outliers > 0:
+                outlier_messages.append(f"   ⚠️ {col}: {outliers} outliers detectados")
+                # Capar outliers en lugar de eliminarlos
+                np.clip(values, lower_bound, upper_bound, out=values)
+                outliers_removed += outliers
+            
+            # Conservar el tipo compacto de la columna si el resultado cabe en él
+            if nulls > 0 or outliers > 0:
+                self.df[col] = _compact_column(pd.Series(values, index=self.df.index, name=col), self.df[col].dtype)
         
         # Para variables categóricas, rellenar con la moda
-        categorical_cols = self.df.select_dtypes(include=['object']).columns
+        categorical_cols = self.df.select_dtypes(include=['object', 'category']).columns
         for col in categorical_cols:
             if self.df[col].isnull().sum() > 0:
                 mode_val = self.df[col].mode()[0]
-                self.df[col].fillna(mode_val, inplace=True)
+                self.df[col] = self.df[col].fillna(mode_val)
+                self.fill_values[col] = mode_val
                 print(f"   ✅ {col}: valores nulos rellenados con moda ('{mode_val}')")
         
         null_counts_after = self.df.isnull().sum().sum()
@@ -139,22 +384,8 @@ class DataPreprocessor:
         
         # 2. Detección y manejo de outliers
         print("\n🔍 Detección de outliers...")
-        outliers_removed = 0
-        
-        for col in numerical_cols:
-            Q1 = self.df[col].quantile(0.25)
-            Q3 = self.df[col].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
-            
-            outliers = self.df[(self.df[col] < lower_bound) | (self.df[col] > upper_bound)]
-            if len(outliers) > 0:
-                print(f"   ⚠️ {col}: {len(outliers)} outliers detectados")
-                # Capar outliers en lugar de eliminarlos
-                self.df[col] = np.clip(self.df[col], lower_bound, upper_bound)
-                outliers_removed += len(outliers)
-        
+        for message in outlier_messages:
+            print(message)
         print(f"   📊 Total outliers manejados: {outliers_removed}")
         
         return True
@@ -163,7 +394,7 @@ class DataPreprocessor:
         """Codificación de variables categóricas"""
         print("\n🏷️ Codificación de variables categóricas...")
         
-        categorical_cols = self.df.select_dtypes(include=['object']).columns
+        categorical_cols = self.df.select_dtypes(include=['object', 'category']).columns
         
         for col in categorical_cols:
             if col != 'ventas':  # No codificar la variable objetivo si es categórica
@@ -181,10 +412,10 @@ class DataPreprocessor:
         # Separar características y objetivo
         feature_cols = [col for col in self.df.columns if col != target_col]
         
-        # Escalar características
-        features_scaled = self.scaler.fit_transform(self.df[feature_cols])
+        # Escalar características (en float64, aunque se carguen con tipos compactos)
+        features_scaled = self.scaler.fit_transform(self.df[feature_cols].astype(np.float64))
         self.df_scaled = pd.DataFrame(features_scaled, columns=feature_cols)
-        self.df_scaled[target_col] = self.df[target_col]
+        self.df_scaled[target_col] = self.df[target_col].astype(np.float64)
         
         print(f"   ✅ Características escaladas: {len(feature_cols)} columnas")
         
@@ -206,10 +437,19 @@ class DataPreprocessor:
         
         return X_train, X_test, y_train, y_test
     
-    def save_processed_data(self, X_train, X_test, y_train, y_test, feature_cols, target_col):
-        """Guardar datos procesados"""
+    def save_processed_data(self, X_train, X_test, y_train, y_test, feature_cols, target_col, cache_key=None,
+                            output_dir=DEFAULT_PROCESSED_DIR):
+        """Guardar datos procesados en formato columnar (ver write_processed_data)
+        
+        cache_key (la clave de la división en la caché) se guarda en el
+        manifiesto; si el directorio existente tiene la misma, no se reescribe.
+        """
         print("\n💾 Guardando datos procesados...")
         
+        if cache_key is not None and processed_data_key(output_dir) == cache_key:
+            print(f"   ♻️ '{output_dir}' ya contiene estos datos, no se reescribe")
+            return True
+        
         # Guardar datos procesados
         processed_data = {
             'X_train': X_train,
@@ -219,50 +459,429 @@ class DataPreprocessor:
             'feature_cols': feature_cols,
             'target_col': target_col,
             'scaler': self.scaler,
-            'label_encoders': self.label_encoders
+            'label_encoders': self.label_encoders,
+            'fill_values': self.fill_values,
+            'clip_bounds': self.clip_bounds
         }
+        if cache_key is not None:
+            processed_data['cache_key'] = cache_key
         
-        import joblib
-        joblib.dump(processed_data, 'models/processed_data.pkl')
-        print("   ✅ Datos procesados guardados en 'models/processed_data.pkl'")
+        write_processed_data(processed_data, output_dir)
+        print(f"   ✅ Datos procesados guardados en '{output_dir}' (manifest.json + .npy por división)")
         
         return True
     
-    def run_preprocessing_pipeline(self):
-        """Ejecutar pipeline completo de preprocesamiento"""
+    # Etapas en memoria y atributos que cada una guarda en la caché
+    CACHED_STAGES = (
+        ('load', ('df',)),
+        ('clean', ('df', 'fill_values', 'clip_bounds')),
+        ('encode', ('df', 'fill_values', 'clip_bounds', 'label_encoders')),
+        ('scale', ('df_scaled', 'feature_cols', 'scaler', 'fill_values', 'clip_bounds', 'label_encoders')),
+        ('split', ('splits', 'feature_cols', 'scaler', 'fill_values', 'clip_bounds', 'label_encoders'))
+    )
+    
+    def stage_keys(self, cache, test_size=0.2, random_state=42):
+        """Claves de caché de cada etapa: CSV de entrada, código y parámetros (ver pipeline_cache.py)"""
+        codes = {
+            'load': code_digest(DataPreprocessor.load_data, read_sales_csv, iter_sales_csv,
+                                _apply_schema, _compact_column),
+            'clean': code_digest(DataPreprocessor.clean_data, median_and_quantiles, _order_statistics,
+                                 _lerp, _compact_column),
+            'encode': code_digest(DataPreprocessor.encode_categorical_variables),
+            'scale': code_digest(DataPreprocessor.scale_numerical_features, find_target_col),
+            'split': code_digest(DataPreprocessor.split_data)
+        }
+        params = {
+            'load': {'schema': self.schema, 'categories': SALES_CATEGORIES},
+            'split': {'test_size': test_size, 'random_state': random_state}
+        }
+        
+        keys, key = {}, cache.file_digest(self.data_path)
+        for stage, _ in self.CACHED_STAGES:
+            key = keys[stage] = stage_key(key, stage, codes[stage], params.get(stage))
+        return keys
+    
+    def run_preprocessing_pipeline(self, headless=False, report_dir=REPORT_DATA_DIR, use_cache=True,
+                                   cache_dir=DEFAULT_CACHE_DIR, test_size=0.2, random_state=42):
+        """Ejecutar pipeline completo de preprocesamiento
+        
+        Con headless=True no se imprime la exploración ni se dibuja: los datos
+        del gráfico de la variable objetivo se guardan en report_dir para
+        generarlo después con reporting.py.
+        
+        Con use_cache=True cada etapa se guarda en cache_dir; en una nueva
+        ejecución se retoma desde la última etapa cuya clave no ha cambiado.
+        """
         print("🚀 INICIANDO PIPELINE DE PREPROCESAMIENTO CRISP-DM")
         print("=" * 60)
         
-        # Fase 2: Comprensión de los Datos
-        if not self.load_data():
+        cache = PipelineCache(cache_dir, enabled=use_cache)
+        try:
+            keys = self.stage_keys(cache, test_size, random_state) if use_cache else None
+        except OSError as e:
+            print(f"❌ Error al cargar el dataset: {e}")
             return False
+        stages = [stage for stage, _ in self.CACHED_STAGES]
+        # Última etapa en caché: las anteriores (salvo la carga) no hace falta recalcularlas
+        cached = [stage for stage in stages[1:] if use_cache and cache.has(stage, keys[stage])]
+        resume = stages.index(cached[-1]) if cached else 0
         
-        categorical_cols, numerical_cols = self.explore_data()
-        target_col = self.analyze_target_variable()
+        # Fase 2: Comprensión de los Datos (la exploración necesita los datos cargados)
+        if not self._run_stage(cache, keys, 'load', self.load_data):
+            return False
+        
+        if headless:
+            target_col = find_target_col(self.df.columns)
+            if target_col is not None:
+                save_preprocessing_report_data(self.df[target_col], target_col, report_dir)
+        else:
+            categorical_cols, numerical_cols = self.explore_data()
+            target_col = self.analyze_target_variable()
         
         if target_col is None:
             print("❌ No se pudo identificar la variable objetivo")
             return False
         
         # Fase 3: Preparación de los Datos
-        if not self.clean_data():
+        def scale():
+            self.feature_cols = self.scale_numerical_features(target_col)
+            return True
+        
+        def split():
+            self.splits = self.split_data(target_col, test_size, random_state)
+            return True
+        
+        runners = {'clean': self.clean_data, 'encode': self.encode_categorical_variables,
+                   'scale': scale, 'split': split}
+        for index, stage in enumerate(stages[1:], start=1):
+            if index < resume:
+                continue
+            if not self._run_stage(cache, keys, stage, runners[stage]):
+                return False
+        
+        X_train, X_test, y_train, y_test = self.splits
+        if not self.save_processed_data(X_train, X_test, y_train, y_test, self.feature_cols, target_col,
+                                        keys['split'] if use_cache else None):
             return False
         
-        if not self.encode_categorical_variables():
+        if cache.hits:
+            print(f"\n♻️ Etapas recuperadas de la caché: {', '.join(cache.hits)}")
+        print("\n✅ PIPELINE DE PREPROCESAMIENTO COMPLETADO EXITOSAMENTE")
+        print("=" * 60)
+        
+        return True
+    
+    def _run_stage(self, cache, keys, stage, run):
+        """Recuperar la etapa de la caché o ejecutarla y guardar su resultado"""
+        attrs = dict(self.CACHED_STAGES)[stage]
+        if keys is not None:
+            state = cache.get(stage, keys[stage])
+            if state is not None:
+                for attr in attrs:
+                    setattr(self, attr, state[attr])
+                if stage == 'load':
+                    print(f"♻️ Dataset recuperado de la caché: {self.df.shape}")
+                return True
+        
+        if run() is False:
             return False
+        if keys is not None:
+            cache.put(stage, keys[stage], {attr: getattr(self, attr) for attr in attrs})
+        return True
+
+    # Modo por trozos: memoria acotada por el tamaño del trozo, no por el dataset
+    
+    def compute_streaming_statistics(self, chunk_rows=100000, sample_size=100000, random_state=42):
+        """Primera pasada: medianas, modas, límites IQR y vocabularios de los encoders
+        
+        Los cuantiles salen de una muestra de tamaño fijo por columna (exactos si
+        la columna cabe en ella); los conteos de categorías son exactos.
+        """
+        print("\n=== PRIMERA PASADA: ESTADÍSTICAS EN STREAMING ===")
+        
+        rng = np.random.default_rng(random_state)
+        reservoirs, missing, category_counts = {}, {}, {}
+        columns, rows = None, 0
+        
+        for chunk in iter_sales_csv(self.data_path, chunk_rows, self.schema):
+            if columns is None:
+                columns = list(chunk.columns)
+                for col in columns:
+                    missing[col] = 0
+                    if pd.api.types.is_numeric_dtype(chunk[col]):
+                        reservoirs[col] = ReservoirSample(sample_size, rng)
+                    else:
+                        category_counts[col] = Counter()
+            
+            for col in columns:
+                missing[col] += int(chunk[col].isnull().sum())
+                if col in reservoirs:
+                    reservoirs[col].update(chunk[col].to_numpy(dtype=np.float64, na_value=np.nan))
+                else:
+                    category_counts[col].update(chunk[col].dropna().astype(str).tolist())
+            rows += len(chunk)
+        
+        if columns is None:
+            print("❌ El dataset está vacío")
+            return None
         
-        feature_cols = self.scale_numerical_features(target_col)
-        X_train, X_test, y_train, y_test = self.split_data(target_col)
+        target_col = find_target_col(columns)
+        if target_col is None:
+            print("⚠️ No se encontró una columna de ventas. Revisar el dataset.")
+            return None
         
-        if not self.save_processed_data(X_train, X_test, y_train, y_test, feature_cols, target_col):
-            return False
+        numeric = {}
+        for col, reservoir in reservoirs.items():
+            median = float(np.quantile(reservoir.sample, 0.5)) if reservoir.seen else 0.0
+            # Cuartiles sobre la columna ya rellenada con la mediana, como en clean_data
+            q1, q3 = reservoir.quantiles([0.25, 0.75], missing[col], median)
+            iqr = q3 - q1
+            numeric[col] = {
+                'median': median,
+                'lower': float(q1 - 1.5 * iqr),
+                'upper': float(q3 + 1.5 * iqr),
+                'missing': missing[col],
+                'exact': reservoir.seen <= reservoir.size
+            }
+            print(f"   ✅ {col}: mediana {median:.2f}, límites [{q1 - 1.5 * iqr:.2f}, {q3 + 1.5 * iqr:.2f}]"
+                  f"{'' if numeric[col]['exact'] else ' (aproximados)'}")
+        
+        categorical = {}
+        for col, counts in category_counts.items():
+            # Moda: la más frecuente y, a igualdad, la menor (como Series.mode()[0])
+            mode = min(counts, key=lambda value: (-counts[value], value)) if counts else None
+            categorical[col] = {'mode': mode, 'classes': sorted(counts), 'missing': missing[col]}
+            print(f"   ✅ {col}: moda '{mode}', {len(counts)} categorías")
+        
+        self.fill_values = {col: info['median'] for col, info in numeric.items()}
+        self.fill_values.update({col: info['mode'] for col, info in categorical.items()})
+        self.clip_bounds = {col: [info['lower'], info['upper']] for col, info in numeric.items()}
+        self.stream_stats = {
+            'rows': rows,
+            'columns': columns,
+            'target_col': target_col,
+            'feature_cols': [col for col in columns if col != target_col],
+            'numeric': numeric,
+            'categorical': categorical
+        }
+        print(f"   📊 Filas leídas: {rows:,}")
+        return self.stream_stats
+    
+    def set_transform_statistics(self, fill_values, clip_bounds, vocabularies):
+        """Fijar los parámetros de transform_chunk sin la primera pasada
+        
+        fill_values: relleno por columna (mediana o moda); clip_bounds: límites
+        [inferior, superior] de las columnas numéricas; vocabularies: clases de
+        cada categórica, en el orden de sus códigos. Las listas de vocabularies
+        se usan tal cual, así que añadirles clases se refleja en los trozos
+        siguientes. Lo usa el reentrenamiento incremental.
+        """
+        self.stream_stats = dict(self.stream_stats or {}, **{
+            'numeric': {col: {'median': fill_values[col], 'lower': lower, 'upper': upper}
+                        for col, (lower, upper) in clip_bounds.items()},
+            'categorical': {col: {'mode': fill_values[col], 'classes': classes}
+                            for col, classes in vocabularies.items()}
+        })
+        return self.stream_stats
+    
+    def transform_chunk(self, chunk):
+        """Rellenar nulos, capar outliers y codificar un trozo con las estadísticas globales
+        
+        Usa las estadísticas de compute_streaming_statistics o de
+        set_transform_statistics.
+        """
+        stats = self.stream_stats
+        for col, info in stats['numeric'].items():
+            chunk[col] = chunk[col].astype(np.float64).fillna(info['median']).clip(info['lower'], info['upper'])
+        for col, info in stats['categorical'].items():
+            codes = {cls_: code for code, cls_ in enumerate(info['classes'])}
+            values = chunk[col].fillna(info['mode']).astype(str)
+            chunk[col] = values.map(codes).astype(np.float64)
+        return chunk
+    
+    def transform_chunks(self, output_dir=DEFAULT_CHUNKS_DIR, chunk_rows=100000, test_size=0.2, random_state=42):
+        """Segunda pasada: transformar y escribir cada trozo, ajustando el scaler en streaming
         
-        print("\n✅ PIPELINE DE PREPROCESAMIENTO COMPLETADO EXITOSAMENTE")
+        Cada trozo se escribe como part-NNNNN.X.npy, .y.npy y .test.npy (marca de
+        prueba). El scaler necesita los valores ya capados, así que se ajusta con
+        partial_fit durante esta pasada y se aplica al final sobre los .npy en disco.
+        """
+        print("\n=== SEGUNDA PASADA: TRANSFORMACIÓN POR TROZOS ===")
+        
+        stats = self.stream_stats
+        feature_cols, target_col = stats['feature_cols'], stats['target_col']
+        os.makedirs(output_dir, exist_ok=True)
+        rng = np.random.default_rng(random_state)
+        
+        self.scaler = StandardScaler()
+        self.label_encoders = {}
+        for col, info in stats['categorical'].items():
+            le = LabelEncoder()
+            le.classes_ = np.array(info['classes'], dtype=object)
+            self.label_encoders[col] = le
+        
+        parts, rows, test_rows = [], 0, 0
+        for chunk in iter_sales_csv(self.data_path, chunk_rows, self.schema):
+            chunk = self.transform_chunk(chunk)
+            self.scaler.partial_fit(chunk[feature_cols])
+            
+            name = f"part-{len(parts):05d}"
+            test_mask = rng.random(len(chunk)) < test_size
+            np.save(os.path.join(output_dir, f"{name}.X.npy"), chunk[feature_cols].to_numpy(dtype=np.float64))
+            np.save(os.path.join(output_dir, f"{name}.y.npy"), chunk[target_col].to_numpy(dtype=np.float64))
+            np.save(os.path.join(output_dir, f"{name}.test.npy"), test_mask)
+            parts.append({'name': name, 'rows': len(chunk), 'test_rows': int(test_mask.sum())})
+            rows += len(chunk)
+            test_rows += int(test_mask.sum())
+        
+        # Escalar en el sitio cada trozo escrito (mapeado en memoria)
+        for part in parts:
+            X = np.load(os.path.join(output_dir, f"{part['name']}.X.npy"), mmap_mode='r+')
+            X -= self.scaler.mean_
+            X /= self.scaler.scale_
+            X.flush()
+            del X
+        
+        print(f"   ✅ {len(parts)} trozos escritos en '{output_dir}'")
+        print(f"   📊 Entrenamiento: {rows - test_rows:,} filas   Prueba: {test_rows:,} filas")
+        return parts
+    
+    def save_chunked_metadata(self, output_dir, parts):
+        """Guardar scaler, encoders y el índice de trozos junto a los datos"""
+        import joblib
+        joblib.dump({
+            'feature_cols': self.stream_stats['feature_cols'],
+            'target_col': self.stream_stats['target_col'],
+            'scaler': self.scaler,
+            'label_encoders': self.label_encoders,
+            'fill_values': self.fill_values,
+            'clip_bounds': self.clip_bounds
+        }, os.path.join(output_dir, 'preprocessing.pkl'))
+        
+        stats = {key: value for key, value in self.stream_stats.items() if key != 'columns'}
+        with open(os.path.join(output_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({**stats, 'parts': parts}, f, indent=2, ensure_ascii=False)
+        print(f"   ✅ Metadatos guardados en '{output_dir}/manifest.json' y 'preprocessing.pkl'")
+        return True
+    
+    def run_chunked_pipeline(self, output_dir=DEFAULT_CHUNKS_DIR, chunk_rows=100000,
+                             sample_size=100000, test_size=0.2, random_state=42):
+        """Pipeline de preprocesamiento en dos pasadas para datasets que no caben en memoria"""
+        print("🚀 INICIANDO PIPELINE DE PREPROCESAMIENTO POR TROZOS")
         print("=" * 60)
         
+        if self.compute_streaming_statistics(chunk_rows, sample_size, random_state) is None:
+            return False
+        parts = self.transform_chunks(output_dir, chunk_rows, test_size, random_state)
+        if not self.save_chunked_metadata(output_dir, parts):
+            return False
+        
+        print("\n✅ PIPELINE DE PREPROCESAMIENTO POR TROZOS COMPLETADO")
+        print("=" * 60)
         return True
 
+def iter_processed_chunks(output_dir=DEFAULT_CHUNKS_DIR):
+    """Recorrer los trozos escritos por run_chunked_pipeline: (X escalado, y, marca de prueba)"""
+    with open(os.path.join(output_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    for part in manifest['parts']:
+        base = os.path.join(output_dir, part['name'])
+        yield (np.load(f"{base}.X.npy", mmap_mode='r'),
+               np.load(f"{base}.y.npy", mmap_mode='r'),
+               np.load(f"{base}.test.npy", mmap_mode='r'))
+
+def write_processed_data(processed_data, output_dir=DEFAULT_PROCESSED_DIR):
+    """Escribir las divisiones como .npy (float64, orden de columnas) y los metadatos aparte
+    
+    Se escribe en un directorio temporal y se sustituye el anterior al final,
+    así un lector nunca ve una mezcla de dos versiones.
+    """
+    import joblib
+    import shutil
+    
+    tmp_dir = f"{output_dir.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    
+    files = {}
+    for name in PROCESSED_SPLITS:
+        values = np.asfortranarray(np.asarray(processed_data[name], dtype=np.float64))
+        files[name] = f"{name}.npy"
+        np.save(os.path.join(tmp_dir, files[name]), values)
+    
+    joblib.dump({
+        'scaler': processed_data['scaler'],
+        'label_encoders': processed_data['label_encoders']
+    }, os.path.join(tmp_dir, 'preprocessing.pkl'))
+    
+    manifest = {
+        'format_version': PROCESSED_FORMAT_VERSION,
+        'feature_cols': list(processed_data['feature_cols']),
+        'target_col': processed_data['target_col'],
+        'rows': {name: len(processed_data[name]) for name in PROCESSED_SPLITS},
+        'files': files,
+        'fill_values': {col: float(value) if isinstance(value, (int, float, np.number)) else value
+                        for col, value in processed_data.get('fill_values', {}).items()},
+        'clip_bounds': processed_data.get('clip_bounds', {}),
+        'cache_key': processed_data.get('cache_key')
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return output_dir
+
+def processed_data_key(output_dir=DEFAULT_PROCESSED_DIR):
+    """cache_key del manifiesto de unos datos procesados, o None"""
+    try:
+        with open(os.path.join(output_dir, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f).get('cache_key')
+    except (OSError, ValueError):
+        return None
+
+def read_processed_data(output_dir=DEFAULT_PROCESSED_DIR, mmap_mode='r'):
+    """Leer lo escrito por write_processed_data, con las mismas claves que processed_data.pkl
+    
+    Con mmap_mode='r' las divisiones se mapean en memoria: solo se leen del disco
+    las columnas y filas que se usan (X[:, j] es contiguo).
+    """
+    import joblib
+    
+    with open(os.path.join(output_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != PROCESSED_FORMAT_VERSION:
+        raise ValueError(f"Versión de formato no soportada: {manifest.get('format_version')}")
+    
+    processed_data = {name: np.load(os.path.join(output_dir, file_name), mmap_mode=mmap_mode)
+                      for name, file_name in manifest['files'].items()}
+    processed_data.update(joblib.load(os.path.join(output_dir, 'preprocessing.pkl')))
+    for key in ('feature_cols', 'target_col', 'fill_values', 'clip_bounds', 'cache_key'):
+        processed_data[key] = manifest.get(key)
+    return processed_data
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preprocesamiento de datos de ventas (CRISP-DM)")
+    parser.add_argument("data_path", nargs="?", default='data/ventas_tiendas (4).csv', help="CSV de entrada")
+    parser.add_argument("--chunked", action="store_true",
+                        help="Procesar por trozos en dos pasadas (memoria independiente del número de filas)")
+    parser.add_argument("--chunk-rows", type=int, default=100000, help="Filas por trozo en el modo por trozos")
+    parser.add_argument("--sample-size", type=int, default=100000,
+                        help="Tamaño de la muestra por columna para los cuantiles aproximados")
+    parser.add_argument("--output-dir", default=DEFAULT_CHUNKS_DIR, help="Directorio de salida del modo por trozos")
+    parser.add_argument("--headless", action="store_true",
+                        help="Sin exploración ni gráficos; guardar los datos de los reportes para reporting.py")
+    parser.add_argument("--no-cache", action="store_true", help="Recalcular todas las etapas sin usar la caché")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Directorio de la caché de etapas")
+    args = parser.parse_args(argv)
+    
+    preprocessor = DataPreprocessor(args.data_path)
+    if args.chunked:
+        return preprocessor.run_chunked_pipeline(args.output_dir, args.chunk_rows, args.sample_size)
+    return preprocessor.run_preprocessing_pipeline(headless=args.headless, use_cache=not args.no_cache,
+                                                   cache_dir=args.cache_dir)
+
 if __name__ == "__main__":
     # Crear instancia y ejecutar pipeline
-    preprocessor = DataPreprocessor()
-    preprocessor.run_preprocessing_pipeline()
+    sys_exit_code = 0 if main() else 1
+    raise SystemExit(sys_exit_code)
@@ -0,0 +1,379 @@
+"""
+Reentrenamiento incremental con particiones mensuales nuevas - CRISP-DM
+Fase 3: Preparación de los Datos
+Fase 4: Modelado
+Fase 6: Despliegue
+
+Cada mes se añade un CSV con filas nuevas. En lugar de repetir el
+preprocesamiento y el entrenamiento sobre todo el histórico, se guarda un
+estado en models/incremental con:
+
+- los parámetros de limpieza (relleno y límites de capado) de la versión base,
+  que quedan fijos para que las filas ya vistas no cambien;
+- el vocabulario de cada variable categórica;
+- las estadísticas suficientes (LinearSufficientStats) de las filas de
+  entrenamiento y de prueba en unidades originales. Sus medias y varianzas son
+  las estadísticas del StandardScaler, que se recalcula sin volver a leer nada.
+
+Ingerir una partición solo lee ese CSV; ajustar es resolver un sistema p×p.
+El resultado coincide con reentrenar desde cero sobre todas las filas con los
+mismos parámetros de limpieza y la misma asignación a entrenamiento/prueba.
+Cada actualización publica una versión nueva del modelo (model.pkl, scaler,
+encoders y bundle, que la API recarga) y archiva su bundle en versions/.
+
+Una categoría nueva solo se acepta si el esquema de la API (PredictionRequest
+en api/schemas.py) ya la admite; si no, la partición se rechaza. Publicar un
+modelo que la API no puede servir no tiene sentido, así que primero se amplía
+el esquema y después se reentrena.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+from data_preprocessing import (DEFAULT_PROCESSED_DIR, INGEST_CHUNK_ROWS, SALES_SCHEMA, DataPreprocessor,
+                                iter_sales_csv, read_processed_data)
+from linear_stats import DEFAULT_FIT_CHUNK_ROWS, LinearSufficientStats, merge_stats
+from model_training import ModelTrainer
+from pipeline_cache import PipelineCache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from model_bundle import DEFAULT_BUNDLE_PATH
+from schemas import FIELD_CONSTRAINTS
+
+DEFAULT_STATE_DIR = 'models/incremental'
+STATE_FORMAT_VERSION = 1
+
+class IncrementalTrainer:
+    """Estado del reentrenamiento incremental y publicación de versiones"""
+
+    def __init__(self, state_dir=DEFAULT_STATE_DIR, schema=SALES_SCHEMA):
+        self.state_dir = state_dir
+        self.schema = schema
+        self.state = None
+
+    @property
+    def state_path(self):
+        return os.path.join(self.state_dir, 'state.pkl')
+
+    def load_state(self):
+        """Cargar el estado guardado; False si no existe"""
+        if not os.path.exists(self.state_path):
+            print(f"❌ No hay estado incremental en '{self.state_dir}' (ejecutar 'init' primero)")
+            return False
+        self.state = joblib.load(self.state_path)
+        if self.state.get('format_version') != STATE_FORMAT_VERSION:
+            raise ValueError(f"Versión de estado no soportada: {self.state.get('format_version')}")
+        return True
+
+    def save_state(self):
+        """Guardar el estado (escritura atómica)"""
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        joblib.dump(self.state, tmp_path)
+        os.replace(tmp_path, self.state_path)
+
+    def init_from_processed(self, processed_dir=DEFAULT_PROCESSED_DIR, test_size=0.2, random_state=42,
+                            chunk_rows=DEFAULT_FIT_CHUNK_ROWS):
+        """Crear el estado a partir de la salida del preprocesamiento en memoria (versión 0)
+
+        Las divisiones guardadas están escaladas: se devuelven a unidades
+        originales con el scaler (x = z·scale + mean) y las columnas
+        categóricas se redondean a su código.
+        """
+        print(f"📥 Inicializando el estado incremental desde '{processed_dir}'...")
+        data = read_processed_data(processed_dir)
+        feature_cols, target_col = list(data['feature_cols']), data['target_col']
+        scaler = data['scaler']
+        categorical = [feature_cols.index(col) for col in data['label_encoders']]
+
+        def raw_stats(X, y):
+            parts = []
+            for start in range(0, len(y), chunk_rows):
+                X_raw = np.asarray(X[start:start + chunk_rows]) * scaler.scale_ + scaler.mean_
+                X_raw[:, categorical] = np.rint(X_raw[:, categorical])
+                parts.append(LinearSufficientStats.from_arrays(X_raw, y[start:start + chunk_rows]))
+            return merge_stats(parts, len(feature_cols))
+
+        train = raw_stats(data['X_train'], data['y_train'])
+        test = raw_stats(data['X_test'], data['y_test'])
+
+        # Moda de cada categórica (para rellenar nulos) si la base no la guardó
+        fill_values = dict(data['fill_values'] or {})
+        vocabularies = {}
+        for col, le in data['label_encoders'].items():
+            vocabularies[col] = [str(value) for value in le.classes_]
+            if col not in fill_values:
+                j = feature_cols.index(col)
+                counts = np.zeros(len(vocabularies[col]), dtype=np.int64)
+                for X in (data['X_train'], data['X_test']):
+                    codes = np.rint(np.asarray(X[:, j]) * scaler.scale_[j] + scaler.mean_[j]).astype(np.int64)
+                    counts += np.bincount(codes, minlength=len(counts))
+                fill_values[col] = vocabularies[col][int(np.argmax(counts))]
+
+        self.state = {
+            'format_version': STATE_FORMAT_VERSION,
+            'feature_cols': feature_cols,
+            'target_col': target_col,
+            'fill_values': fill_values,
+            'clip_bounds': {col: list(bounds) for col, bounds in (data['clip_bounds'] or {}).items()},
+            'vocabularies': vocabularies,
+            'test_size': test_size,
+            'random_state': random_state,
+            'train': train,
+            'test': test,
+            'partitions': [{'name': 'base', 'source': os.path.abspath(processed_dir), 'sha256': None,
+                            'rows': train.n + test.n, 'test_rows': test.n}],
+            'version': 0,
+            'versions': []
+        }
+        self.save_state()
+        print(f"✅ Estado creado: {train.n + test.n:,} filas ({test.n:,} de prueba), "
+              f"{len(feature_cols)} características")
+        return True
+
+    def _preprocessor(self, vocabularies):
+        """DataPreprocessor cuyo transform_chunk aplica los parámetros fijos del estado"""
+        preprocessor = DataPreprocessor(schema=self.schema)
+        preprocessor.set_transform_statistics(self.state['fill_values'], self.state['clip_bounds'], vocabularies)
+        return preprocessor
+
+    def _extend_vocabularies(self, chunk, vocabularies):
+        """Añadir las categorías nuevas de un trozo al final del vocabulario
+
+        Solo es seguro si ordenan después de las existentes: así los códigos
+        ya acumulados no cambian y el LabelEncoder (clases ordenadas) sigue
+        siendo válido. Si no, hace falta un reentrenamiento completo. Además,
+        la API debe aceptar la categoría: si su patrón la rechaza, la versión
+        publicada no podría puntuarla.
+        """
+        added = {}
+        for col, classes in vocabularies.items():
+            present = {str(value) for value in chunk[col].dropna().unique()}
+            new = sorted(present - set(classes))
+            if not new:
+                continue
+            pattern = FIELD_CONSTRAINTS.get(col, {}).get('pattern')
+            unserved = [value for value in new if pattern is not None and not pattern.match(value)]
+            if unserved:
+                raise ValueError(f"Columna '{col}': la API no acepta las categorías nuevas {unserved}; "
+                                 f"hay que ampliar PredictionRequest en api/schemas.py antes de reentrenar")
+            if classes and new[0] < classes[-1]:
+                raise ValueError(f"Columna '{col}': las categorías nuevas {new} se ordenan antes de "
+                                 f"'{classes[-1]}' y cambiarían los códigos existentes; "
+                                 f"hace falta un reentrenamiento completo")
+            classes.extend(new)
+            added[col] = new
+        return added
+
+    def ingest(self, csv_path, chunk_rows=INGEST_CHUNK_ROWS):
+        """Acumular una partición nueva; False si ya se había ingerido
+
+        Las filas de prueba se eligen con una semilla derivada de random_state
+        y del hash del archivo, así que la asignación no depende del orden en
+        que se ingieren las particiones. La partición entera se procesa antes
+        de tocar el estado: un error deja el estado como estaba.
+        """
+        state = self.state
+        digest = PipelineCache(self.state_dir).file_digest(csv_path)
+        if any(part['sha256'] == digest for part in state['partitions']):
+            print(f"⚠️ '{csv_path}' ya se ingirió (sha256 {digest[:12]}...), se omite")
+            return False
+
+        print(f"📥 Ingiriendo '{csv_path}'...")
+        feature_cols, target_col = state['feature_cols'], state['target_col']
+        vocabularies = {col: list(classes) for col, classes in state['vocabularies'].items()}
+        preprocessor = self._preprocessor(vocabularies)
+        rng = np.random.default_rng([state['random_state'], int(digest[:16], 16)])
+
+        train = LinearSufficientStats(len(feature_cols))
+        test = LinearSufficientStats(len(feature_cols))
+        added = {}
+        # Sin lista de categorías permitidas: las nuevas se validan al extender el vocabulario
+        for chunk in iter_sales_csv(csv_path, chunk_rows, self.schema, categories={}):
+            missing = [col for col in feature_cols + [target_col] if col not in chunk.columns]
+            if missing:
+                raise ValueError(f"Faltan columnas en '{csv_path}': {missing}")
+            for col, new in self._extend_vocabularies(chunk, vocabularies).items():
+                added.setdefault(col, []).extend(new)
+            for col in vocabularies:
+                # Las categorías del trozo son solo las presentes: la moda puede no estar
+                chunk[col] = chunk[col].astype(object)
+            chunk = preprocessor.transform_chunk(chunk)
+            X = chunk[feature_cols].to_numpy(dtype=np.float64)
+            y = chunk[target_col].to_numpy(dtype=np.float64)
+            test_mask = rng.random(len(chunk)) < state['test_size']
+            train.update(X[~test_mask], y[~test_mask])
+            test.update(X[test_mask], y[test_mask])
+
+        state['train'].merge(train)
+        state['test'].merge(test)
+        state['vocabularies'] = vocabularies
+        state['partitions'].append({'name': os.path.basename(csv_path), 'source': os.path.abspath(csv_path),
+                                    'sha256': digest, 'rows': train.n + test.n, 'test_rows': test.n})
+        print(f"   ✅ {train.n + test.n:,} filas ({test.n:,} de prueba)")
+        for col, new in added.items():
+            print(f"   🏷️ {col}: categorías nuevas {new}")
+        return True
+
+    def build_scaler(self):
+        """StandardScaler de todas las filas a partir de las estadísticas acumuladas"""
+        total = merge_stats([self.state['train'], self.state['test']], len(self.state['feature_cols']))
+        var = np.diag(total.sxx) / total.n
+        scale = np.sqrt(var)
+        scale[scale == 0] = 1.0  # como StandardScaler con columnas constantes
+
+        scaler = StandardScaler()
+        scaler.mean_ = total.mean_x.copy()
+        scaler.var_ = var
+        scaler.scale_ = scale
+        scaler.n_samples_seen_ = total.n
+        scaler.n_features_in_ = len(scale)
+        scaler.feature_names_in_ = np.asarray(self.state['feature_cols'], dtype=object)
+        return scaler
+
+    def build_label_encoders(self):
+        label_encoders = {}
+        for col, classes in self.state['vocabularies'].items():
+            le = LabelEncoder()
+            le.classes_ = np.array(classes, dtype=object)
+            label_encoders[col] = le
+        return label_encoders
+
+    def fit(self):
+        """Modelo, scaler y métricas de las filas acumuladas
+
+        Las estadísticas se pasan a la escala del scaler nuevo y se resuelve el
+        sistema; R² y RMSE salen de las propias estadísticas (el MAE necesitaría
+        volver a leer las filas).
+        """
+        scaler = self.build_scaler()
+        train = self.state['train'].scaled(scaler.mean_, scaler.scale_)
+        test = self.state['test'].scaled(scaler.mean_, scaler.scale_)
+        model = train.to_model()
+
+        metrics = {}
+        for split, stats, intercept in (('train', train, None), ('test', test, model.intercept_)):
+            rss = stats.residual_sum_of_squares(model.coef_, intercept)
+            metrics[f'r2_{split}'] = 1 - rss / stats.syy if stats.syy > 0 else 0.0
+            metrics[f'rmse_{split}'] = float(np.sqrt(rss / max(stats.n, 1)))
+        return model, scaler, metrics
+
+    def publish(self, model, scaler, metrics):
+        """Guardar los artefactos que carga la API como una versión nueva y archivar su bundle"""
+        state = self.state
+        version = state['version'] + 1
+        trainer = ModelTrainer()
+        trainer.model = model
+        trainer.processed_data = {
+            'scaler': scaler,
+            'label_encoders': self.build_label_encoders(),
+            'feature_cols': state['feature_cols'],
+            'target_col': state['target_col'],
+            'clip_bounds': state['clip_bounds']
+        }
+        trainer.report_coefficients()
+        rows = state['train'].n + state['test'].n
+        trainer.save_model(metrics, training_info={
+            'model_version': version,
+            'rows': rows,
+            'partitions': [part['name'] for part in state['partitions']]
+        })
+
+        checksum = None
+        if os.path.exists(DEFAULT_BUNDLE_PATH):
+            from model_bundle import read_bundle
+
+            checksum = read_bundle(DEFAULT_BUNDLE_PATH, verify=False)['checksum']['value']
+            versions_dir = os.path.join(self.state_dir, 'versions')
+            os.makedirs(versions_dir, exist_ok=True)
+            shutil.copy2(DEFAULT_BUNDLE_PATH, os.path.join(versions_dir, f"v{version:04d}.bin"))
+
+        state['version'] = version
+        state['versions'].append({
+            'version': version,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'rows': rows,
+            'partitions': len(state['partitions']),
+            'checksum': checksum,
+            'metrics': metrics
+        })
+        print(f"🏷️ Versión {version} publicada" + (f" (bundle {checksum[:12]})" if checksum else ""))
+        return version
+
+    def update(self, csv_paths, chunk_rows=INGEST_CHUNK_ROWS):
+        """Ingerir particiones nuevas, reajustar y publicar una versión si hubo filas nuevas"""
+        print("🚀 REENTRENAMIENTO INCREMENTAL")
+        print("=" * 60)
+        if not self.load_state():
+            return False
+
+        start = time.perf_counter()
+        try:
+            ingested = [path for path in csv_paths if self.ingest(path, chunk_rows)]
+        except (OSError, ValueError) as e:
+            print(f"❌ Error al ingerir: {e}")
+            return False
+        if not ingested:
+            print("⚠️ No hay particiones nuevas; se mantiene la versión actual")
+            return True
+
+        model, scaler, metrics = self.fit()
+        print(f"\n📊 R² Score - Entrenamiento: {metrics['r2_train']:.4f}")
+        print(f"📊 R² Score - Prueba: {metrics['r2_test']:.4f}")
+        print(f"📊 RMSE - Prueba: {metrics['rmse_test']:.4f}")
+        self.publish(model, scaler, metrics)
+        self.save_state()
+        print(f"⏱️ {len(ingested)} particiones en {time.perf_counter() - start:.2f} s")
+        return True
+
+    def print_status(self):
+        if not self.load_state():
+            return False
+        state = self.state
+        rows = state['train'].n + state['test'].n
+        print(f"🏷️ Versión actual: {state['version']}")
+        print(f"📊 Filas acumuladas: {rows:,} ({state['test'].n:,} de prueba)")
+        for col, classes in state['vocabularies'].items():
+            print(f"🏷️ {col}: {classes}")
+        print("📁 Particiones:")
+        for part in state['partitions']:
+            print(f"   - {part['name']}: {part['rows']:,} filas")
+        for entry in state['versions']:
+            print(f"   v{entry['version']}: {entry['created']}, {entry['rows']:,} filas, "
+                  f"R² prueba {entry['metrics']['r2_test']:.4f}")
+        return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reentrenamiento incremental con particiones nuevas de ventas")
+    parser.add_argument("--state-dir", default=DEFAULT_STATE_DIR, help="Directorio del estado incremental")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init = commands.add_parser("init", help="Crear el estado desde la salida del preprocesamiento")
+    init.add_argument("--processed-dir", default=DEFAULT_PROCESSED_DIR, help="Datos procesados de la versión base")
+    init.add_argument("--test-size", type=float, default=0.2, help="Fracción de prueba de las particiones nuevas")
+    init.add_argument("--random-state", type=int, default=42, help="Semilla de la división de las particiones")
+
+    update = commands.add_parser("update", help="Ingerir CSV nuevos y publicar una versión nueva del modelo")
+    update.add_argument("csv_paths", nargs="+", help="Particiones nuevas (mismas columnas que el dataset)")
+    update.add_argument("--chunk-rows", type=int, default=INGEST_CHUNK_ROWS, help="Filas por trozo al leer")
+
+    commands.add_parser("status", help="Versión, filas y particiones acumuladas")
+    args = parser.parse_args(argv)
+
+    trainer = IncrementalTrainer(args.state_dir)
+    if args.command == "init":
+        return trainer.init_from_processed(args.processed_dir, args.test_size, args.random_state)
+    if args.command == "update":
+        return trainer.update(args.csv_paths, args.chunk_rows)
+    return trainer.print_status()
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
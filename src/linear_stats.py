@@ -0,0 +1,276 @@
+"""
+Regresión lineal por estadísticas suficientes - CRISP-DM
+Fase 4: Modelado
+
+Un modelo lineal queda determinado por las medias de X e y y por los productos
+cruzados centrados Σ(x-x̄)(x-x̄)ᵀ y Σ(x-x̄)(y-ȳ). Se acumulan trozo a trozo, cada
+proceso sobre sus propios archivos, y se combinan en orden con la fórmula de
+Chan et al.; al final se resuelve un sistema p×p. La memoria depende del tamaño
+del trozo y del número de características, no del número de filas. Centrar por
+trozo (en lugar de acumular XᵀX en crudo) evita la cancelación numérica, y los
+coeficientes coinciden con LinearRegression.fit en memoria.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_preprocessing import DEFAULT_CHUNKS_DIR, iter_processed_chunks
+
+DEFAULT_FIT_CHUNK_ROWS = 100000
+
+class LinearSufficientStats:
+    """Estadísticas suficientes de una regresión lineal, combinables entre trozos"""
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean_x = np.zeros(n_features)
+        self.mean_y = 0.0
+        self.sxx = np.zeros((n_features, n_features))
+        self.sxy = np.zeros(n_features)
+        self.syy = 0.0
+
+    @classmethod
+    def from_arrays(cls, X, y):
+        """Estadísticas de un trozo (X: n×p, y: n)"""
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        stats = cls(X.shape[1])
+        if len(y) == 0:
+            return stats
+        stats.n = len(y)
+        stats.mean_x = X.mean(axis=0)
+        stats.mean_y = float(y.mean())
+        Xc = X - stats.mean_x
+        yc = y - stats.mean_y
+        stats.sxx = Xc.T @ Xc
+        stats.sxy = Xc.T @ yc
+        stats.syy = float(yc @ yc)
+        return stats
+
+    def update(self, X, y):
+        """Añadir un trozo de filas"""
+        return self.merge(LinearSufficientStats.from_arrays(X, y))
+
+    def merge(self, other):
+        """Combinar con las estadísticas de otro conjunto de filas (en el sitio)"""
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mean_x, self.mean_y = other.n, other.mean_x.copy(), other.mean_y
+            self.sxx, self.sxy, self.syy = other.sxx.copy(), other.sxy.copy(), other.syy
+            return self
+
+        n = self.n + other.n
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        weight = self.n * other.n / n
+        self.sxx = self.sxx + other.sxx + weight * np.outer(dx, dx)
+        self.sxy = self.sxy + other.sxy + weight * dx * dy
+        self.syy = self.syy + other.syy + weight * dy * dy
+        self.mean_x = self.mean_x + dx * (other.n / n)
+        self.mean_y = self.mean_y + dy * (other.n / n)
+        self.n = n
+        return self
+
+    def subtract(self, other):
+        """Estadísticas de estas filas sin las de other (un subconjunto de ellas)
+
+        Es la fórmula de merge invertida: permite obtener el entrenamiento de
+        cada fold como total menos fold sin recorrer otra vez los datos.
+        """
+        n = self.n - other.n
+        result = LinearSufficientStats(len(self.mean_x))
+        if n <= 0:
+            return result
+        result.n = n
+        result.mean_x = (self.n * self.mean_x - other.n * other.mean_x) / n
+        result.mean_y = (self.n * self.mean_y - other.n * other.mean_y) / n
+        dx = other.mean_x - result.mean_x
+        dy = other.mean_y - result.mean_y
+        weight = n * other.n / self.n
+        result.sxx = self.sxx - other.sxx - weight * np.outer(dx, dx)
+        result.sxy = self.sxy - other.sxy - weight * dx * dy
+        result.syy = self.syy - other.syy - weight * dy * dy
+        return result
+
+    def scaled(self, mean, scale):
+        """Estadísticas de las mismas filas con X transformada a (X - mean) / scale
+
+        Permite acumular en unidades originales y ajustar con un scaler que se
+        decide después (p. ej. uno recalculado al añadir filas).
+        """
+        result = LinearSufficientStats(len(self.mean_x))
+        result.n = self.n
+        result.mean_x = (self.mean_x - mean) / scale
+        result.mean_y = self.mean_y
+        result.sxx = self.sxx / np.outer(scale, scale)
+        result.sxy = self.sxy / scale
+        result.syy = self.syy
+        return result
+
+    def solve(self):
+        """Coeficientes e intercepto de mínimos cuadrados: (coef, intercept)"""
+        if self.n == 0:
+            raise ValueError("No hay filas para ajustar el modelo")
+        # lstsq también resuelve el caso singular (solución de norma mínima)
+        coef = np.linalg.lstsq(self.sxx, self.sxy, rcond=None)[0]
+        intercept = self.mean_y - float(self.mean_x @ coef)
+        return coef, intercept
+
+    def residual_sum_of_squares(self, coef, intercept=None):
+        """Σ(y - ŷ)² de las filas acumuladas para unos coeficientes dados
+
+        Sin intercept se supone el de mínimos cuadrados de estas mismas filas;
+        con él se suma el término del desplazamiento de las medias.
+        """
+        rss = float(self.syy - 2 * coef @ self.sxy + coef @ self.sxx @ coef)
+        if intercept is not None:
+            rss += self.n * (self.mean_y - intercept - float(self.mean_x @ coef)) ** 2
+        return rss
+
+    def to_model(self, feature_names=None):
+        """LinearRegression ya ajustado con los coeficientes de estas estadísticas"""
+        from sklearn.linear_model import LinearRegression
+
+        coef, intercept = self.solve()
+        model = LinearRegression()
+        model.coef_ = coef
+        model.intercept_ = intercept
+        model.n_features_in_ = len(coef)
+        model.rank_ = int(np.linalg.matrix_rank(self.sxx))
+        if feature_names is not None:
+            model.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        return model
+
+def merge_stats(parts, n_features):
+    """Combinar en orden estadísticas de varios conjuntos de filas"""
+    stats = LinearSufficientStats(n_features)
+    for part in parts:
+        stats.merge(part)
+    return stats
+
+def stats_from_arrays(X, y, chunk_rows=DEFAULT_FIT_CHUNK_ROWS):
+    """Estadísticas de unas matrices en memoria (o mapeadas), recorridas por trozos"""
+    X = np.asarray(X)
+    y = np.asarray(y)
+    return merge_stats((LinearSufficientStats.from_arrays(X[start:start + chunk_rows], y[start:start + chunk_rows])
+                        for start in range(0, len(y), chunk_rows)), X.shape[1])
+
+def uses_closed_form_cv(model):
+    """True si la validación cruzada del modelo se puede obtener en forma cerrada"""
+    from sklearn.linear_model import LinearRegression
+
+    return type(model) is LinearRegression and model.fit_intercept and not model.positive
+
+def _cv_splits(n_rows, cv):
+    """Índices de validación de cada split; cv es un número de folds o un splitter de sklearn"""
+    from sklearn.model_selection import KFold
+
+    splitter = KFold(n_splits=cv) if isinstance(cv, int) else cv
+    for train, test in splitter.split(np.empty((n_rows, 1))):
+        if len(train) + len(test) != n_rows:
+            raise ValueError("La validación cruzada cerrada necesita splits cuyo entrenamiento sea "
+                             "el complemento de la validación (KFold, RepeatedKFold...)")
+        yield test
+
+def cross_val_scores(X, y, cv=5, scoring='r2', chunk_rows=DEFAULT_FIT_CHUNK_ROWS):
+    """Validación cruzada de LinearRegression sin reajustar en cada fold
+
+    Las estadísticas del total se calculan una vez; las de cada fold de
+    validación se restan para obtener las de entrenamiento, se resuelve el
+    sistema p×p y el error del fold sale de sus propias estadísticas. Devuelve
+    lo mismo que cross_val_score(LinearRegression(), X, y, cv=cv, scoring=scoring)
+    para scoring 'r2' o 'neg_mean_squared_error'.
+    """
+    if scoring not in ('r2', 'neg_mean_squared_error'):
+        raise ValueError(f"scoring no soportado: {scoring}")
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    total = stats_from_arrays(X, y, chunk_rows)
+
+    scores = []
+    for test in _cv_splits(len(y), cv):
+        fold = LinearSufficientStats.from_arrays(X[test], y[test])
+        coef, intercept = total.subtract(fold).solve()
+        rss = fold.residual_sum_of_squares(coef, intercept)
+        if scoring == 'r2':
+            scores.append(1 - rss / fold.syy if fold.syy > 0 else 0.0)
+        else:
+            scores.append(-rss / fold.n)
+    return np.array(scores)
+
+def loo_predictions(X, y, chunk_rows=DEFAULT_FIT_CHUNK_ROWS):
+    """Predicciones leave-one-out de LinearRegression con la matriz sombrero
+
+    Con un solo ajuste: ŷ₍₋ᵢ₎ = yᵢ - eᵢ / (1 - hᵢᵢ), con hᵢᵢ = 1/n + x̃ᵢᵀ S⁻¹ x̃ᵢ
+    (x̃ centrado). Coincide con cross_val_predict(..., cv=LeaveOneOut()).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    stats = stats_from_arrays(X, y, chunk_rows)
+    coef, intercept = stats.solve()
+    sxx_inv = np.linalg.pinv(stats.sxx)
+
+    predictions = np.empty(len(y))
+    for start in range(0, len(y), chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        Xc = X[rows] - stats.mean_x
+        leverage = 1 / stats.n + np.einsum('ij,jk,ik->i', Xc, sxx_inv, Xc)
+        residuals = y[rows] - (X[rows] @ coef + intercept)
+        predictions[rows] = y[rows] - residuals / (1 - leverage)
+    return predictions
+
+def _part_stats(task):
+    """Estadísticas de entrenamiento de un trozo en disco (se ejecuta en un proceso del pool)"""
+    base, chunk_rows = task
+    X = np.load(f"{base}.X.npy", mmap_mode='r')
+    y = np.load(f"{base}.y.npy", mmap_mode='r')
+    train = ~np.load(f"{base}.test.npy")
+    stats = LinearSufficientStats(X.shape[1])
+    for start in range(0, len(y), chunk_rows):
+        rows = train[start:start + chunk_rows]
+        stats.update(X[start:start + chunk_rows][rows], y[start:start + chunk_rows][rows])
+    return stats
+
+def stats_from_chunks(output_dir=DEFAULT_CHUNKS_DIR, workers=None, chunk_rows=DEFAULT_FIT_CHUNK_ROWS):
+    """Estadísticas de las filas de entrenamiento de run_chunked_pipeline, en paralelo
+
+    Cada proceso lee sus trozos mapeados en memoria; los resultados se combinan en
+    el orden del manifiesto, así el ajuste no depende del número de procesos.
+    """
+    import json
+
+    with open(os.path.join(output_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    tasks = [(os.path.join(output_dir, part['name']), chunk_rows) for part in manifest['parts']]
+    n_features = len(manifest['feature_cols'])
+
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers <= 1:
+        return merge_stats(map(_part_stats, tasks), n_features)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return merge_stats(pool.map(_part_stats, tasks), n_features)
+
+def evaluate_chunks(coef, intercept, output_dir=DEFAULT_CHUNKS_DIR):
+    """R², MAE y RMSE de entrenamiento y prueba recorriendo los trozos en disco"""
+    # Varianza de y combinable (estadísticas sin características) y sumas de errores
+    target = {split: LinearSufficientStats(0) for split in ('train', 'test')}
+    errors = {split: [0.0, 0.0] for split in ('train', 'test')}
+    for X, y, test in iter_processed_chunks(output_dir):
+        y = np.asarray(y, dtype=np.float64)
+        residuals = y - (np.asarray(X) @ coef + intercept)
+        for split, rows in (('train', ~test), ('test', test)):
+            target[split].update(np.empty((int(rows.sum()), 0)), y[rows])
+            errors[split][0] += float(np.abs(residuals[rows]).sum())
+            errors[split][1] += float(residuals[rows] @ residuals[rows])
+
+    metrics = {}
+    for split in ('train', 'test'):
+        n = max(target[split].n, 1)
+        sae, sse = errors[split]
+        metrics[f'r2_{split}'] = 1 - sse / target[split].syy if target[split].syy > 0 else 0.0
+        metrics[f'mae_{split}'] = sae / n
+        metrics[f'rmse_{split}'] = float(np.sqrt(sse / n))
+    return metrics
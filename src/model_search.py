@@ -0,0 +1,163 @@
+"""
+Búsqueda de modelos con validación cruzada en paralelo - CRISP-DM
+Fase 4: Modelado
+Fase 5: Evaluación
+
+Evalúa una lista de candidatos (lineal, Ridge, Lasso, gradient boosting y un
+modelo lineal por ubicación) con sus rejillas de hiperparámetros. Cada tarea
+es un par (configuración, fold) y se reparte entre procesos. Los índices de
+los folds se calculan una sola vez y las matrices ya escaladas se escriben una
+vez en .npy que cada proceso mapea en memoria: ningún candidato repite el
+preprocesamiento ni recibe los datos por pickle. El resultado es una tabla
+ordenada por R² medio de validación cruzada (leaderboard).
+"""
+
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.linear_model import Lasso, LinearRegression, Ridge
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import KFold, ParameterGrid
+
+# GroupedRegressor vive en api/ para que la API pueda cargar el model.pkl que lo contiene
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from group_models import GroupedRegressor
+
+DEFAULT_CV_FOLDS = 5
+LEADERBOARD_PATH = 'models/leaderboard.csv'
+
+def default_candidates(feature_cols):
+    """Candidatos por defecto: (nombre, estimador base, rejilla de hiperparámetros)
+
+    La rejilla de los modelos por ubicación se aplica al estimador de cada grupo.
+    """
+    candidates = [
+        ('linear', LinearRegression(), {}),
+        ('ridge', Ridge(), {'alpha': [0.1, 1.0, 10.0, 100.0]}),
+        ('lasso', Lasso(max_iter=10000), {'alpha': [1.0, 10.0, 100.0]}),
+        ('gbr', GradientBoostingRegressor(random_state=42),
+         {'n_estimators': [100, 300], 'max_depth': [2, 3], 'learning_rate': [0.05, 0.1]}),
+    ]
+    if 'ubicacion' in feature_cols:
+        group_index = list(feature_cols).index('ubicacion')
+        candidates += [
+            ('linear_por_ubicacion', GroupedRegressor(LinearRegression(), group_index), {}),
+            ('ridge_por_ubicacion', GroupedRegressor(Ridge(), group_index),
+             {'estimator__alpha': [1.0, 10.0]}),
+        ]
+    return candidates
+
+def fold_indices(n_rows, n_splits=DEFAULT_CV_FOLDS):
+    """Índices (entrenamiento, validación) de cada fold, los mismos que cross_val_score(cv=n_splits)"""
+    return list(KFold(n_splits=n_splits).split(np.empty((n_rows, 1))))
+
+def expand_candidates(candidates):
+    """Una configuración por combinación de hiperparámetros: (nombre, parámetros, estimador)"""
+    configs = []
+    for name, estimator, grid in candidates:
+        for params in ParameterGrid(grid):
+            configs.append((name, params, clone(estimator).set_params(**params)))
+    return configs
+
+# Datos compartidos de cada proceso (se asignan en el inicializador)
+_worker_state = {}
+
+def _init_worker(cache_dir, folds):
+    """Mapear una vez por proceso las matrices escaladas y guardar los folds"""
+    _worker_state.update(
+        X=np.load(os.path.join(cache_dir, 'X.npy'), mmap_mode='r'),
+        y=np.load(os.path.join(cache_dir, 'y.npy'), mmap_mode='r'),
+        folds=folds
+    )
+
+def _fit_fold(task):
+    """Ajustar y puntuar una configuración en un fold"""
+    config_id, estimator, fold = task
+    X, y = _worker_state['X'], _worker_state['y']
+    train, test = _worker_state['folds'][fold]
+
+    start = time.perf_counter()
+    model = clone(estimator).fit(X[train], y[train])
+    fit_seconds = time.perf_counter() - start
+    y_pred = model.predict(X[test])
+    return config_id, fold, {
+        'r2': r2_score(y[test], y_pred),
+        'mae': mean_absolute_error(y[test], y_pred),
+        'rmse': float(np.sqrt(mean_squared_error(y[test], y_pred))),
+        'fit_seconds': fit_seconds
+    }
+
+def search_models(X, y, candidates, n_splits=DEFAULT_CV_FOLDS, workers=None):
+    """Validación cruzada de todas las configuraciones en paralelo
+
+    Devuelve (leaderboard, configs, scores): la tabla ordenada por R² medio, las
+    configuraciones expandidas y los R² por fold de cada una.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    folds = fold_indices(len(y), n_splits)
+    configs = expand_candidates(candidates)
+    # Las configuraciones más lentas primero, para no dejar una sola al final
+    tasks = sorted(((config_id, estimator, fold) for config_id, (_, _, estimator) in enumerate(configs)
+                    for fold in range(len(folds))),
+                   key=lambda task: not isinstance(task[1], GradientBoostingRegressor))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        np.save(os.path.join(cache_dir, 'X.npy'), X)
+        np.save(os.path.join(cache_dir, 'y.npy'), y)
+
+        workers = min(workers or os.cpu_count() or 1, len(tasks))
+        if workers <= 1:
+            _init_worker(cache_dir, folds)
+            for task in tasks:
+                config_id, fold, scores = _fit_fold(task)
+                results[config_id, fold] = scores
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(cache_dir, folds)) as pool:
+                for future in as_completed([pool.submit(_fit_fold, task) for task in tasks]):
+                    config_id, fold, scores = future.result()
+                    results[config_id, fold] = scores
+
+    rows, fold_scores = [], []
+    for config_id, (name, params, _) in enumerate(configs):
+        per_fold = [results[config_id, fold] for fold in range(len(folds))]
+        r2 = np.array([scores['r2'] for scores in per_fold])
+        fold_scores.append(r2)
+        rows.append({
+            'candidate': name,
+            'params': params,
+            'cv_r2_mean': r2.mean(),
+            'cv_r2_std': r2.std(),
+            'cv_mae': np.mean([scores['mae'] for scores in per_fold]),
+            'cv_rmse': np.mean([scores['rmse'] for scores in per_fold]),
+            'fit_seconds': np.sum([scores['fit_seconds'] for scores in per_fold]),
+            'config_id': config_id
+        })
+    leaderboard = pd.DataFrame(rows).sort_values('cv_r2_mean', ascending=False, kind='stable')
+    return leaderboard.reset_index(drop=True), configs, fold_scores
+
+def coefficient_table(model, feature_cols):
+    """Tabla feature/coefficient que guardan model_info y el bundle
+
+    Para modelos sin coeficientes se usan las importancias del árbol, y para los
+    modelos por grupo la media de los coeficientes de los grupos.
+    """
+    if hasattr(model, 'coef_'):
+        values = np.asarray(model.coef_, dtype=np.float64)
+    elif hasattr(model, 'feature_importances_'):
+        values = np.asarray(model.feature_importances_, dtype=np.float64)
+    elif isinstance(model, GroupedRegressor):
+        values = np.mean([(group or model.global_model_).coef_ for group in model.models_], axis=0)
+    else:
+        values = np.zeros(len(feature_cols))
+    return pd.DataFrame({'feature': feature_cols, 'coefficient': values}) \
+        .sort_values('coefficient', key=abs, ascending=False)
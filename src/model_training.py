@@ -6,29 +6,51 @@ Fase 5: Evaluación
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.model_selection import cross_val_score, KFold
 import joblib
+import argparse
+import os
+import sys
+import time
 import warnings
 warnings.filterwarnings('ignore')
 
+# El formato del bundle lo comparten el entrenamiento y la API
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from model_bundle import DEFAULT_BUNDLE_PATH, write_bundle
+
+import reporting
+from data_preprocessing import DEFAULT_CHUNKS_DIR, DEFAULT_PROCESSED_DIR, read_processed_data
+from linear_stats import (DEFAULT_FIT_CHUNK_ROWS, cross_val_scores, evaluate_chunks, stats_from_arrays,
+                          stats_from_chunks, uses_closed_form_cv)
+from model_search import LEADERBOARD_PATH, coefficient_table, default_candidates, expand_candidates, search_models
+
 class ModelTrainer:
-    def __init__(self, model_path='models/processed_data.pkl'):
+    def __init__(self, model_path='models/processed_data.pkl', processed_dir=DEFAULT_PROCESSED_DIR):
         self.model_path = model_path
+        self.processed_dir = processed_dir
         self.model = None
         self.processed_data = None
         self.feature_importance = None
+        self.report_process = None
         
     def load_processed_data(self):
-        """Cargar datos procesados"""
+        """Cargar datos procesados
+        
+        Usa el formato columnar de processed_dir (divisiones mapeadas en memoria)
+        y, si no existe, el processed_data.pkl de versiones anteriores.
+        """
         print("=== FASE 4: MODELADO ===")
         
         try:
-            self.processed_data = joblib.load(self.model_path)
-            print("✅ Datos procesados cargados exitosamente")
+            if os.path.exists(os.path.join(self.processed_dir, 'manifest.json')):
+                self.processed_data = read_processed_data(self.processed_dir)
+                print(f"✅ Datos procesados mapeados desde '{self.processed_dir}'")
+            else:
+                self.processed_data = joblib.load(self.model_path)
+                print("✅ Datos procesados cargados exitosamente")
             
             X_train = self.processed_data['X_train']
             X_test = self.processed_data['X_test']
@@ -48,17 +70,45 @@ class ModelTrainer:
             print(f"❌ Error al cargar datos procesados: {e}")
             return None, None, None, None, None, None
     
-    def train_linear_regression(self, X_train, y_train):
-        """Entrenar modelo de regresión lineal"""
+    def train_linear_regression(self, X_train, y_train, incremental=False, chunk_rows=DEFAULT_FIT_CHUNK_ROWS):
+        """Entrenar modelo de regresión lineal
+        
+        Con incremental=True se ajusta por estadísticas suficientes recorriendo
+        X_train en trozos de chunk_rows filas (mismos coeficientes).
+        """
         print("\n🤖 Entrenando modelo de Regresión Lineal...")
         
         # Crear y entrenar modelo
-        self.model = LinearRegression()
-        self.model.fit(X_train, y_train)
+        if incremental:
+            stats = stats_from_arrays(X_train, y_train, chunk_rows)
+            self.model = stats.to_model(getattr(X_train, 'columns', None))
+        else:
+            self.model = LinearRegression()
+            self.model.fit(X_train, y_train)
         
         print("✅ Modelo entrenado exitosamente")
+        self.report_coefficients()
+        
+        return self.model
+    
+    def train_from_chunks(self, chunks_dir=DEFAULT_CHUNKS_DIR, workers=None, chunk_rows=DEFAULT_FIT_CHUNK_ROWS):
+        """Entrenar sobre la salida de run_chunked_pipeline sin cargarla en memoria
         
-        # Obtener coeficientes
+        Cada proceso acumula las estadísticas suficientes de sus trozos; se
+        combinan y se resuelve una sola vez.
+        """
+        print(f"\n🤖 Entrenando Regresión Lineal por trozos desde '{chunks_dir}'...")
+        
+        stats = stats_from_chunks(chunks_dir, workers, chunk_rows)
+        self.model = stats.to_model(self.processed_data['feature_cols'])
+        
+        print(f"✅ Modelo entrenado con {stats.n:,} filas")
+        self.report_coefficients()
+        
+        return self.model
+    
+    def report_coefficients(self):
+        """Tabla de coeficientes ordenada por magnitud (feature_importance)"""
         feature_cols = self.processed_data['feature_cols']
         coefficients = pd.DataFrame({
             'feature': feature_cols,
@@ -69,11 +119,13 @@ class ModelTrainer:
         print(coefficients.head(10))
         
         self.feature_importance = coefficients
-        
-        return self.model
     
-    def evaluate_model(self, X_train, X_test, y_train, y_test):
-        """Evaluación del modelo - Fase 5: Evaluación"""
+    def evaluate_model(self, X_train, X_test, y_train, y_test, cv_scores=None):
+        """Evaluación del modelo - Fase 5: Evaluación
+        
+        cv_scores permite reutilizar los R² por fold ya calculados (búsqueda de
+        modelos) en lugar de repetir la validación cruzada.
+        """
         print("\n=== FASE 5: EVALUACIÓN ===")
         
         # Predicciones
@@ -104,7 +156,11 @@ class ModelTrainer:
         
         # Cross-validation
         print("\n🔄 Validación Cruzada (5-fold):")
-        cv_scores = cross_val_score(self.model, X_train, y_train, cv=5, scoring='r2')
+        if cv_scores is None and uses_closed_form_cv(self.model):
+            # Mismos scores que cross_val_score, restando estadísticas por fold
+            cv_scores = cross_val_scores(X_train, y_train, cv=5)
+        elif cv_scores is None:
+            cv_scores = cross_val_score(self.model, X_train, y_train, cv=5, scoring='r2')
         print(f"R² CV Scores: {cv_scores}")
         print(f"R² CV Mean: {cv_scores.mean():.4f} (+/- {cv_scores.std() * 2:.4f})")
         
@@ -128,44 +184,10 @@ class ModelTrainer:
         print("\n📊 Análisis de Residuos...")
         
         # Calcular residuos
-        residuals_train = y_train - y_train_pred
         residuals_test = y_test - y_test_pred
         
         # Crear gráficos de residuos
-        fig, axes = plt.subplots(2, 2, figsize=(15, 12))
-        
-        # 1. Residuos vs Predicciones (Train)
-        axes[0, 0].scatter(y_train_pred, residuals_train, alpha=0.6, color='blue')
-        axes[0, 0].axhline(y=0, color='red', linestyle='--')
-        axes[0, 0].set_xlabel('Predicciones')
-        axes[0, 0].set_ylabel('Residuos')
-        axes[0, 0].set_title('Residuos vs Predicciones (Entrenamiento)')
-        axes[0, 0].grid(True, alpha=0.3)
-        
-        # 2. Residuos vs Predicciones (Test)
-        axes[0, 1].scatter(y_test_pred, residuals_test, alpha=0.6, color='green')
-        axes[0, 1].axhline(y=0, color='red', linestyle='--')
-        axes[0, 1].set_xlabel('Predicciones')
-        axes[0, 1].set_ylabel('Residuos')
-        axes[0, 1].set_title('Residuos vs Predicciones (Prueba)')
-        axes[0, 1].grid(True, alpha=0.3)
-        
-        # 3. Histograma de residuos (Train)
-        axes[1, 0].hist(residuals_train, bins=30, alpha=0.7, color='blue', edgecolor='black')
-        axes[1, 0].set_xlabel('Residuos')
-        axes[1, 0].set_ylabel('Frecuencia')
-        axes[1, 0].set_title('Distribución de Residuos (Entrenamiento)')
-        axes[1, 0].grid(True, alpha=0.3)
-        
-        # 4. Q-Q Plot de residuos (Test)
-        from scipy import stats
-        stats.probplot(residuals_test, dist="norm", plot=axes[1, 1])
-        axes[1, 1].set_title('Q-Q Plot de Residuos (Prueba)')
-        axes[1, 1].grid(True, alpha=0.3)
-        
-        plt.tight_layout()
-        plt.savefig('residuals_analysis.png', dpi=300, bbox_inches='tight')
-        plt.close()
+        reporting.plot_residuals(y_train, y_test, y_train_pred, y_test_pred)
         
         print("📈 Gráficos de residuos guardados en 'residuals_analysis.png'")
         
@@ -181,25 +203,7 @@ class ModelTrainer:
         print("\n📊 Visualizando importancia de características...")
         
         if self.feature_importance is not None:
-            plt.figure(figsize=(12, 8))
-            
-            # Top 15 características más importantes
-            top_features = self.feature_importance.head(15)
-            
-            colors = ['red' if x < 0 else 'blue' for x in top_features['coefficient']]
-            
-            plt.barh(range(len(top_features)), top_features['coefficient'], color=colors, alpha=0.7)
-            plt.yticks(range(len(top_features)), top_features['feature'])
-            plt.xlabel('Coeficiente')
-            plt.title('Importancia de Características (Coeficientes del Modelo)')
-            plt.grid(True, alpha=0.3)
-            
-            # Añadir líneas de referencia
-            plt.axvline(x=0, color='black', linestyle='-', alpha=0.5)
-            
-            plt.tight_layout()
-            plt.savefig('feature_importance.png', dpi=300, bbox_inches='tight')
-            plt.close()
+            reporting.plot_feature_importance(self.feature_importance)
             
             print("📈 Gráfico de importancia guardado en 'feature_importance.png'")
     
@@ -207,32 +211,16 @@ class ModelTrainer:
         """Gráfico de predicciones vs valores reales"""
         print("\n📈 Visualizando predicciones vs valores reales...")
         
-        fig, axes = plt.subplots(1, 2, figsize=(15, 6))
-        
-        # Entrenamiento
-        axes[0].scatter(y_train, y_train_pred, alpha=0.6, color='blue')
-        axes[0].plot([y_train.min(), y_train.max()], [y_train.min(), y_train.max()], 'r--', lw=2)
-        axes[0].set_xlabel('Valores Reales')
-        axes[0].set_ylabel('Predicciones')
-        axes[0].set_title('Predicciones vs Reales (Entrenamiento)')
-        axes[0].grid(True, alpha=0.3)
-        
-        # Prueba
-        axes[1].scatter(y_test, y_test_pred, alpha=0.6, color='green')
-        axes[1].plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'r--', lw=2)
-        axes[1].set_xlabel('Valores Reales')
-        axes[1].set_ylabel('Predicciones')
-        axes[1].set_title('Predicciones vs Reales (Prueba)')
-        axes[1].grid(True, alpha=0.3)
-        
-        plt.tight_layout()
-        plt.savefig('predictions_vs_actual.png', dpi=300, bbox_inches='tight')
-        plt.close()
+        reporting.plot_predictions_vs_actual(y_train, y_test, y_train_pred, y_test_pred)
         
         print("📈 Gráfico de predicciones guardado en 'predictions_vs_actual.png'")
     
-    def save_model(self, metrics=None):
-        """Guardar modelo entrenado"""
+    def save_model(self, metrics=None, training_info=None):
+        """Guardar modelo entrenado
+        
+        training_info se añade a la información de entrenamiento del modelo
+        (p. ej. la versión y las particiones de un reentrenamiento incremental).
+        """
         print("\n💾 Guardando modelo...")
         
         # Guardar modelo
@@ -247,32 +235,74 @@ class ModelTrainer:
         joblib.dump(label_encoders, 'models/label_encoders.pkl')
         print("✅ Scaler y encoders guardados")
         
+        # Límites de capado de las características, para capar igual al predecir
+        clip_bounds = {
+            col: bounds for col, bounds in self.processed_data.get('clip_bounds', {}).items()
+            if col in self.processed_data['feature_cols']
+        }
+        
         # Guardar información del modelo
         model_info = {
-            'model_type': 'LinearRegression',
+            'model_type': type(self.model).__name__,
             'feature_importance': self.feature_importance,
             'processed_data_info': {
                 'feature_cols': self.processed_data['feature_cols'],
                 'target_col': self.processed_data['target_col']
             }
         }
+        if clip_bounds:
+            model_info['processed_data_info']['clip_bounds'] = clip_bounds
         
         # Agregar métricas si están disponibles
         if metrics:
             model_info['metrics'] = metrics
+        if metrics and 'cv_scores' in metrics:
             model_info['training_info'] = {
                 'cv_scores': metrics['cv_scores'].tolist(),
                 'cv_mean': metrics['cv_mean'],
                 'cv_std': metrics['cv_std']
             }
+        if training_info:
+            model_info.setdefault('training_info', {}).update(training_info)
         
         joblib.dump(model_info, 'models/model_info.pkl')
         print("✅ Información del modelo guardada")
         
+        # Bundle único (pesos planos + cabecera JSON + checksum) que carga la API
+        if hasattr(self.model, 'coef_'):
+            write_bundle(
+                DEFAULT_BUNDLE_PATH,
+                coef=self.model.coef_,
+                intercept=self.model.intercept_,
+                scaler_mean=scaler.mean_,
+                scaler_scale=scaler.scale_,
+                feature_cols=self.processed_data['feature_cols'],
+                target_col=self.processed_data['target_col'],
+                encoders={col: list(le.classes_) for col, le in label_encoders.items()},
+                model_type=model_info['model_type'],
+                metrics=model_info.get('metrics'),
+                training_info=model_info.get('training_info'),
+                feature_importance=self.feature_importance,
+                clip_bounds=clip_bounds
+            )
+            print(f"✅ Bundle del modelo guardado en '{DEFAULT_BUNDLE_PATH}'")
+        elif os.path.exists(DEFAULT_BUNDLE_PATH):
+            # El bundle solo admite modelos lineales: uno anterior tendría prioridad sobre los .pkl
+            os.remove(DEFAULT_BUNDLE_PATH)
+            print(f"🗑️ Modelo no lineal: se eliminó el bundle anterior '{DEFAULT_BUNDLE_PATH}', la API usará los .pkl")
+        
         return True
     
-    def run_training_pipeline(self):
-        """Ejecutar pipeline completo de entrenamiento"""
+    def run_training_pipeline(self, headless=False, parallel_reports=False, report_dir=reporting.REPORT_DATA_DIR,
+                              incremental=False):
+        """Ejecutar pipeline completo de entrenamiento
+        
+        Con headless=True no se dibuja nada: los datos de los gráficos se guardan
+        en report_dir. Con parallel_reports=True, además, los gráficos se generan
+        en otro proceso que sigue en segundo plano (self.report_process) y no
+        retrasa el guardado del modelo. Con incremental=True el ajuste se hace por
+        estadísticas suficientes (ver linear_stats.py).
+        """
         print("🚀 INICIANDO PIPELINE DE ENTRENAMIENTO CRISP-DM")
         print("=" * 60)
         
@@ -284,28 +314,110 @@ class ModelTrainer:
         X_train, X_test, y_train, y_test, feature_cols, target_col = data
         
         # Entrenar modelo
-        self.train_linear_regression(X_train, y_train)
+        self.train_linear_regression(X_train, y_train, incremental=incremental)
         
         # Evaluar modelo
         metrics, y_train_pred, y_test_pred = self.evaluate_model(X_train, X_test, y_train, y_test)
         
         # Análisis adicionales
-        self.analyze_residuals(y_train, y_test, y_train_pred, y_test_pred)
-        self.plot_feature_importance()
-        self.plot_predictions_vs_actual(y_train, y_test, y_train_pred, y_test_pred)
+        if headless:
+            reporting.save_training_report_data(y_train, y_test, y_train_pred, y_test_pred,
+                                                self.feature_importance, report_dir)
+            if parallel_reports:
+                self.report_process = reporting.start_report_process(report_dir)
+                print(f"\n📈 Generando reportes en segundo plano (PID {self.report_process.pid})")
+            else:
+                print(f"\n📈 Datos de los reportes guardados en '{report_dir}' (generar con src/reporting.py)")
+        else:
+            self.analyze_residuals(y_train, y_test, y_train_pred, y_test_pred)
+            self.plot_feature_importance()
+            self.plot_predictions_vs_actual(y_train, y_test, y_train_pred, y_test_pred)
         
         # Guardar modelo
         self.save_model(metrics)
         
-        # Resumen final
+        self._print_summary(metrics)
+        return True
+    
+    def run_chunked_training_pipeline(self, chunks_dir=DEFAULT_CHUNKS_DIR, workers=None):
+        """Entrenar y evaluar sobre la salida de run_chunked_pipeline con memoria constante"""
+        print("🚀 INICIANDO PIPELINE DE ENTRENAMIENTO POR TROZOS")
+        print("=" * 60)
+        print("=== FASE 4: MODELADO ===")
+        
+        try:
+            self.processed_data = joblib.load(os.path.join(chunks_dir, 'preprocessing.pkl'))
+        except Exception as e:
+            print(f"❌ Error al cargar los metadatos de '{chunks_dir}': {e}")
+            return False
+        
+        self.train_from_chunks(chunks_dir, workers)
+        
+        print("\n=== FASE 5: EVALUACIÓN ===")
+        metrics = evaluate_chunks(self.model.coef_, self.model.intercept_, chunks_dir)
+        for name, key in (('R² Score', 'r2'), ('MAE', 'mae'), ('RMSE', 'rmse')):
+            print(f"{name} - Entrenamiento: {metrics[f'{key}_train']:.4f}")
+            print(f"{name} - Prueba: {metrics[f'{key}_test']:.4f}")
+        
+        self.save_model(metrics)
+        
+        self._print_summary(metrics)
+        return True
+    
+    def run_model_search(self, workers=None, n_splits=5, candidates=None, leaderboard_path=LEADERBOARD_PATH):
+        """Buscar el mejor modelo con validación cruzada en paralelo y exportarlo para la API
+        
+        El ganador es el de mayor R² medio de validación cruzada; se reajusta con
+        todo el conjunto de entrenamiento, se evalúa en prueba y se guarda con
+        save_model (bundle si es lineal, .pkl si no).
+        """
+        print("🚀 INICIANDO BÚSQUEDA DE MODELOS")
+        print("=" * 60)
+        
+        data = self.load_processed_data()
+        if data[0] is None:
+            return False
+        X_train, X_test, y_train, y_test, feature_cols, target_col = data
+        
+        candidates = candidates or default_candidates(feature_cols)
+        print(f"\n🔍 Evaluando {len(expand_candidates(candidates))} configuraciones x {n_splits} folds...")
+        start = time.perf_counter()
+        leaderboard, configs, fold_scores = search_models(X_train, y_train, candidates, n_splits, workers)
+        print(f"✅ Búsqueda completada en {time.perf_counter() - start:.1f} s")
+        
+        print("\n🏆 Leaderboard (top 10):")
+        print(leaderboard.drop(columns='config_id').head(10).to_string(index=False))
+        leaderboard.drop(columns='config_id').to_csv(leaderboard_path, index=False)
+        print(f"💾 Leaderboard guardado en '{leaderboard_path}'")
+        
+        # Reajustar el ganador con todo el entrenamiento
+        best = leaderboard.iloc[0]
+        name, params, estimator = configs[best['config_id']]
+        print(f"\n🤖 Ganador: {name} {params or ''}")
+        self.model = estimator.fit(X_train, y_train)
+        self.feature_importance = coefficient_table(self.model, feature_cols)
+        print(self.feature_importance.head(10))
+        
+        metrics, _, _ = self.evaluate_model(X_train, X_test, y_train, y_test, fold_scores[best['config_id']])
+        metrics['candidate'] = name
+        metrics['params'] = params
+        self.save_model(metrics)
+        
+        self._print_summary(metrics)
+        return True
+    
+    def _print_summary(self, metrics):
+        """Resumen final del entrenamiento"""
         print("\n" + "=" * 60)
         print("✅ PIPELINE DE ENTRENAMIENTO COMPLETADO")
         print("=" * 60)
-        print(f"🎯 Modelo: Regresión Lineal")
+        print(f"🎯 Modelo: {type(self.model).__name__}")
         print(f"📊 R² Score (Prueba): {metrics['r2_test']:.4f}")
-        print(f"📊 MAE (Prueba): {metrics['mae_test']:.4f}")
+        if 'mae_test' in metrics:
+            print(f"📊 MAE (Prueba): {metrics['mae_test']:.4f}")
         print(f"📊 RMSE (Prueba): {metrics['rmse_test']:.4f}")
-        print(f"🔄 CV R² Score: {metrics['cv_mean']:.4f} (+/- {metrics['cv_std'] * 2:.4f})")
+        if 'cv_mean' in metrics:
+            print(f"🔄 CV R² Score: {metrics['cv_mean']:.4f} (+/- {metrics['cv_std'] * 2:.4f})")
         
         if metrics['r2_test'] > 0.7:
             print("🎉 ¡Excelente! El modelo tiene un buen rendimiento (R² > 0.7)")
@@ -313,10 +425,31 @@ class ModelTrainer:
             print("👍 Buen rendimiento del modelo (R² > 0.5)")
         else:
             print("⚠️ El modelo podría necesitar mejoras (R² < 0.5)")
-        
-        return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Entrenamiento del modelo de ventas (CRISP-DM)")
+    parser.add_argument("--headless", action="store_true",
+                        help="Sin gráficos; guardar los datos de los reportes para reporting.py")
+    parser.add_argument("--reports", action="store_true",
+                        help="Con --headless, generar los gráficos en paralelo en otro proceso")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Ajustar por estadísticas suficientes en trozos en lugar de LinearRegression.fit")
+    parser.add_argument("--chunks-dir", default=None,
+                        help="Entrenar sobre la salida de 'data_preprocessing.py --chunked' sin cargarla en memoria")
+    parser.add_argument("--search", action="store_true",
+                        help="Comparar candidatos con validación cruzada en paralelo y exportar el mejor")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Procesos para --chunks-dir y --search (por defecto, núcleos)")
+    args = parser.parse_args(argv)
+    
+    trainer = ModelTrainer()
+    if args.search:
+        return trainer.run_model_search(args.workers)
+    if args.chunks_dir:
+        return trainer.run_chunked_training_pipeline(args.chunks_dir, args.workers)
+    return trainer.run_training_pipeline(headless=args.headless, parallel_reports=args.reports,
+                                         incremental=args.incremental)
 
 if __name__ == "__main__":
     # Crear instancia y ejecutar pipeline
-    trainer = ModelTrainer()
-    trainer.run_training_pipeline()
+    raise SystemExit(0 if main() else 1)
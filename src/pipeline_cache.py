@@ -0,0 +1,126 @@
+"""
+Caché de etapas del preprocesamiento direccionada por contenido - CRISP-DM
+Fase 3: Preparación de los Datos
+
+Cada etapa (carga, limpieza, codificación, escalado y división) guarda su
+resultado bajo una clave que resume todo lo que lo determina:
+
+    clave = sha256(clave de la etapa anterior, nombre de la etapa,
+                   código fuente de las funciones de la etapa, parámetros)
+
+y la primera etapa parte del hash del CSV de entrada. Cambiar el archivo, el
+código de una etapa o sus parámetros cambia su clave y la de todas las
+siguientes; una etapa cuya clave ya está en la caché no se vuelve a calcular.
+Los hashes de los archivos se memorizan por (tamaño, mtime) para no releer un
+CSV grande que no ha cambiado.
+"""
+
+import glob
+import hashlib
+import inspect
+import json
+import os
+
+DEFAULT_CACHE_DIR = 'models/cache'
+CACHE_FORMAT_VERSION = 1
+
+# Entradas que se conservan por etapa (las más recientes)
+MAX_ENTRIES_PER_STAGE = 3
+
+def code_digest(*objects):
+    """Hash del código fuente de funciones, métodos o clases"""
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode('utf-8'))
+    return digest.hexdigest()
+
+def stage_key(parent_key, stage, code, params=None):
+    """Clave de una etapa a partir de la anterior, su código y sus parámetros"""
+    payload = json.dumps({
+        'format': CACHE_FORMAT_VERSION,
+        'parent': parent_key,
+        'stage': stage,
+        'code': code,
+        'params': params or {}
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class PipelineCache:
+    """Resultados de etapas en disco (joblib), uno por archivo stage-<clave>.pkl"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = []
+        self.misses = []
+
+    def path(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage}-{key[:32]}.pkl")
+
+    def has(self, stage, key):
+        return self.enabled and os.path.exists(self.path(stage, key))
+
+    def get(self, stage, key):
+        """Resultado guardado de la etapa, o None si no está (o no se puede leer)"""
+        if not self.has(stage, key):
+            self.misses.append(stage)
+            return None
+        import joblib
+        try:
+            value = joblib.load(self.path(stage, key))
+        except Exception as e:
+            print(f"⚠️ Entrada de caché ilegible para '{stage}', se recalcula: {e}")
+            self.misses.append(stage)
+            return None
+        self.hits.append(stage)
+        return value
+
+    def put(self, stage, key, value):
+        """Guardar el resultado (escritura atómica) y podar entradas antiguas de la etapa"""
+        if not self.enabled:
+            return None
+        import joblib
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(stage, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(value, tmp_path)
+        os.replace(tmp_path, path)
+        self._prune(stage)
+        return path
+
+    def _prune(self, stage):
+        entries = sorted(glob.glob(os.path.join(self.cache_dir, f"{stage}-*.pkl")), key=os.path.getmtime)
+        for old in entries[:-MAX_ENTRIES_PER_STAGE]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def file_digest(self, path):
+        """SHA-256 del contenido de un archivo, memorizado por (ruta, tamaño, mtime)"""
+        stat = os.stat(path)
+        signature = [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+        memo_path = os.path.join(self.cache_dir, 'file_digests.json')
+        memo = {}
+        if self.enabled and os.path.exists(memo_path):
+            try:
+                with open(memo_path, encoding='utf-8') as f:
+                    memo = json.load(f)
+            except (OSError, ValueError):
+                memo = {}
+        entry = memo.get(signature[0])
+        if entry and entry['signature'] == signature:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        memo[signature[0]] = {'signature': signature, 'sha256': digest.hexdigest()}
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{memo_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(memo, f)
+            os.replace(tmp_path, memo_path)
+        return digest.hexdigest()
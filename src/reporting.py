@@ -0,0 +1,249 @@
+"""
+Reportes gráficos del pipeline - CRISP-DM
+Fase 2: Comprensión de los Datos
+Fase 5: Evaluación
+
+Las figuras del análisis de la variable objetivo y de la evaluación del modelo
+se generan aquí. En el modo headless el preprocesamiento y el entrenamiento
+solo guardan los datos de cada figura en models/report_data; este módulo las
+genera después, o en segundo plano mientras el pipeline continúa, en procesos
+en paralelo. matplotlib y scipy solo se importan dentro de las funciones de
+dibujo, de modo que importar este módulo no los carga.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+REPORT_DATA_DIR = 'models/report_data'
+FIGURE_DPI = 300
+
+# Puntos por figura en el modo diferido: histogramas y dispersión de una muestra
+# uniforme, que no cambia la figura y acota el tamaño de los datos guardados
+REPORT_MAX_POINTS = 1000000
+
+def _pyplot():
+    import matplotlib
+    if not os.environ.get('DISPLAY') and 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def plot_target_distribution(values, target_col, path='target_analysis.png'):
+    """Histograma y boxplot de la variable objetivo"""
+    plt = _pyplot()
+    plt.figure(figsize=(12, 4))
+
+    plt.subplot(1, 2, 1)
+    plt.hist(values, bins=30, alpha=0.7, color='skyblue', edgecolor='black')
+    plt.title(f'Distribución de {target_col}')
+    plt.xlabel(target_col)
+    plt.ylabel('Frecuencia')
+
+    plt.subplot(1, 2, 2)
+    plt.boxplot(values)
+    plt.title(f'Boxplot de {target_col}')
+    plt.ylabel(target_col)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=FIGURE_DPI, bbox_inches='tight')
+    plt.close()
+    return path
+
+def plot_residuals(y_train, y_test, y_train_pred, y_test_pred, path='residuals_analysis.png'):
+    """Residuos vs predicciones, histograma y Q-Q plot"""
+    plt = _pyplot()
+    from scipy import stats
+
+    residuals_train = y_train - y_train_pred
+    residuals_test = y_test - y_test_pred
+
+    fig, axes = plt.subplots(2, 2, figsize=(15, 12))
+
+    # 1. Residuos vs Predicciones (Train)
+    axes[0, 0].scatter(y_train_pred, residuals_train, alpha=0.6, color='blue')
+    axes[0, 0].axhline(y=0, color='red', linestyle='--')
+    axes[0, 0].set_xlabel('Predicciones')
+    axes[0, 0].set_ylabel('Residuos')
+    axes[0, 0].set_title('Residuos vs Predicciones (Entrenamiento)')
+    axes[0, 0].grid(True, alpha=0.3)
+
+    # 2. Residuos vs Predicciones (Test)
+    axes[0, 1].scatter(y_test_pred, residuals_test, alpha=0.6, color='green')
+    axes[0, 1].axhline(y=0, color='red', linestyle='--')
+    axes[0, 1].set_xlabel('Predicciones')
+    axes[0, 1].set_ylabel('Residuos')
+    axes[0, 1].set_title('Residuos vs Predicciones (Prueba)')
+    axes[0, 1].grid(True, alpha=0.3)
+
+    # 3. Histograma de residuos (Train)
+    axes[1, 0].hist(residuals_train, bins=30, alpha=0.7, color='blue', edgecolor='black')
+    axes[1, 0].set_xlabel('Residuos')
+    axes[1, 0].set_ylabel('Frecuencia')
+    axes[1, 0].set_title('Distribución de Residuos (Entrenamiento)')
+    axes[1, 0].grid(True, alpha=0.3)
+
+    # 4. Q-Q Plot de residuos (Test)
+    stats.probplot(residuals_test, dist="norm", plot=axes[1, 1])
+    axes[1, 1].set_title('Q-Q Plot de Residuos (Prueba)')
+    axes[1, 1].grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=FIGURE_DPI, bbox_inches='tight')
+    plt.close()
+    return path
+
+def plot_feature_importance(feature_importance, path='feature_importance.png'):
+    """Coeficientes del modelo como barras horizontales (top 15)"""
+    plt = _pyplot()
+    plt.figure(figsize=(12, 8))
+
+    # Top 15 características más importantes
+    top_features = feature_importance.head(15)
+
+    colors = ['red' if x < 0 else 'blue' for x in top_features['coefficient']]
+
+    plt.barh(range(len(top_features)), top_features['coefficient'], color=colors, alpha=0.7)
+    plt.yticks(range(len(top_features)), top_features['feature'])
+    plt.xlabel('Coeficiente')
+    plt.title('Importancia de Características (Coeficientes del Modelo)')
+    plt.grid(True, alpha=0.3)
+
+    # Añadir líneas de referencia
+    plt.axvline(x=0, color='black', linestyle='-', alpha=0.5)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=FIGURE_DPI, bbox_inches='tight')
+    plt.close()
+    return path
+
+def plot_predictions_vs_actual(y_train, y_test, y_train_pred, y_test_pred, path='predictions_vs_actual.png'):
+    """Predicciones vs valores reales en entrenamiento y prueba"""
+    plt = _pyplot()
+    fig, axes = plt.subplots(1, 2, figsize=(15, 6))
+
+    # Entrenamiento
+    axes[0].scatter(y_train, y_train_pred, alpha=0.6, color='blue')
+    axes[0].plot([y_train.min(), y_train.max()], [y_train.min(), y_train.max()], 'r--', lw=2)
+    axes[0].set_xlabel('Valores Reales')
+    axes[0].set_ylabel('Predicciones')
+    axes[0].set_title('Predicciones vs Reales (Entrenamiento)')
+    axes[0].grid(True, alpha=0.3)
+
+    # Prueba
+    axes[1].scatter(y_test, y_test_pred, alpha=0.6, color='green')
+    axes[1].plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'r--', lw=2)
+    axes[1].set_xlabel('Valores Reales')
+    axes[1].set_ylabel('Predicciones')
+    axes[1].set_title('Predicciones vs Reales (Prueba)')
+    axes[1].grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=FIGURE_DPI, bbox_inches='tight')
+    plt.close()
+    return path
+
+# Figuras de cada etapa: (función, archivo de salida, argumentos tomados de los datos guardados)
+REPORTS = {
+    'preprocessing': [
+        (plot_target_distribution, 'target_analysis.png', ('values', 'target_col')),
+    ],
+    'training': [
+        (plot_residuals, 'residuals_analysis.png', ('y_train', 'y_test', 'y_train_pred', 'y_test_pred')),
+        (plot_feature_importance, 'feature_importance.png', ('feature_importance',)),
+        (plot_predictions_vs_actual, 'predictions_vs_actual.png', ('y_train', 'y_test', 'y_train_pred', 'y_test_pred')),
+    ]
+}
+
+def _sample(arrays, max_points=REPORT_MAX_POINTS, seed=42):
+    """Misma muestra uniforme de filas para arreglos alineados"""
+    arrays = [np.asarray(a) for a in arrays]
+    n = len(arrays[0]) if arrays else 0
+    if n <= max_points:
+        return arrays
+    idx = np.sort(np.random.default_rng(seed).choice(n, max_points, replace=False))
+    return [a[idx] for a in arrays]
+
+def save_report_data(stage, data, report_dir=REPORT_DATA_DIR):
+    """Guardar los datos de las figuras de una etapa para generarlas después"""
+    import joblib
+
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f'{stage}.pkl')
+    joblib.dump(data, path)
+    return path
+
+def save_preprocessing_report_data(values, target_col, report_dir=REPORT_DATA_DIR):
+    (values,) = _sample([values])
+    return save_report_data('preprocessing', {'values': values, 'target_col': target_col}, report_dir)
+
+def save_training_report_data(y_train, y_test, y_train_pred, y_test_pred, feature_importance,
+                              report_dir=REPORT_DATA_DIR):
+    y_train, y_train_pred = _sample([y_train, y_train_pred])
+    y_test, y_test_pred = _sample([y_test, y_test_pred])
+    return save_report_data('training', {
+        'y_train': y_train, 'y_test': y_test, 'y_train_pred': y_train_pred, 'y_test_pred': y_test_pred,
+        'feature_importance': feature_importance
+    }, report_dir)
+
+def _render(task):
+    """Generar una figura (se ejecuta en un proceso del pool)"""
+    fn, path, data_path, names = task
+    import joblib
+
+    data = joblib.load(data_path)
+    start = time.perf_counter()
+    fn(*[data[name] for name in names], path=path)
+    return path, time.perf_counter() - start
+
+def generate_reports(report_dir=REPORT_DATA_DIR, output_dir='.', workers=None):
+    """Generar todas las figuras con datos guardados, una por proceso
+
+    Devuelve [(archivo, segundos)]. Con workers=1 se generan en este proceso.
+    """
+    tasks = []
+    for stage, figures in REPORTS.items():
+        data_path = os.path.join(report_dir, f'{stage}.pkl')
+        if os.path.exists(data_path):
+            tasks.extend((fn, os.path.join(output_dir, name), data_path, names) for fn, name, names in figures)
+    if not tasks:
+        return []
+
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if workers <= 1:
+        return [_render(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render, tasks))
+
+def start_report_process(report_dir=REPORT_DATA_DIR, output_dir='.', workers=None):
+    """Lanzar generate_reports en un proceso aparte y devolver el Popen (no espera)"""
+    command = [sys.executable, os.path.abspath(__file__), '--report-dir', report_dir, '--output-dir', output_dir]
+    if workers:
+        command += ['--workers', str(workers)]
+    return subprocess.Popen(command)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generar las figuras de un pipeline ejecutado en modo headless")
+    parser.add_argument("--report-dir", default=REPORT_DATA_DIR, help="Datos guardados por el pipeline")
+    parser.add_argument("--output-dir", default='.', help="Directorio de las figuras")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo (por defecto, uno por figura)")
+    args = parser.parse_args(argv)
+
+    print("📈 Generando reportes...")
+    start = time.perf_counter()
+    results = generate_reports(args.report_dir, args.output_dir, args.workers)
+    if not results:
+        print(f"⚠️ No hay datos de reportes en '{args.report_dir}'")
+        return False
+    for path, seconds in results:
+        print(f"   ✅ {path} ({seconds:.2f} s)")
+    print(f"📈 {len(results)} gráficos generados en {time.perf_counter() - start:.2f} s")
+    return True
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)